@@ -1,13 +1,17 @@
+import os
 import glob
 
 import helpers
+import chimes_single_point
+
+# Parameter file the current run_md.in was written for
+
+INPUT_PARAMS = [None]
 
 def clean_up():
 
-    files   = ' '.join(glob.glob("*input.xyz"))
-    files  += ' '.join(glob.glob("params* "))
-    files  += ' '.join(glob.glob("*run_md.in"))
-    files  += "run_chimesmd.cmd traj_bad_r.lt.rin.xyz traj_bad_r.lt.rin+dp.xyz restart.bak traj_bad_r.ge.rin+dp_dftbfrq.xyz traj.gen stdoutmsg run_md.out restart.xyzv md_statistics.out"
+    files   = ' '.join(glob.glob("*input.xyz") + glob.glob("params* ") + glob.glob("*run_md.in"))
+    files  += " run_chimesmd.cmd traj_bad_r.lt.rin.xyz traj_bad_r.lt.rin+dp.xyz restart.bak traj_bad_r.ge.rin+dp_dftbfrq.xyz traj.gen stdoutmsg run_md.out restart.xyzv md_statistics.out"
 
     helpers.run_bash_cmnd("rm -f " + files)
 
@@ -25,65 +29,36 @@ def check_atomtypes(param_file):
     return atmtyps
 
 
-def gen_input_file(param_file, xyz_file):
+def gen_input_file(param_file, xyz_file=None):
     
     """ 
     
     Creates a generic ChIMES_MD input file for a single point calculation,
     name run_md.in.
     
-    Usage: gen_input_file(param_file, xyz_file)
+    Usage: gen_input_file(param_file)
+    
+    Notes: Configurations are read from chimes_single_point.SINGLE_POINT_INPUT;
+           xyz_file is accepted for backwards compatibility, and ignored.
     
     """
     
-    ofstream = open ("run_md.in",'w')
-    ofstream.write("\n# TEMPERA #\n\t0.0")
-    ofstream.write("\n# CMPRFRC #\n\tfalse")
-    ofstream.write("\n# TIMESTP #\n\t0.0")
-    ofstream.write("\n# N_MDSTP #\n\t1")
-    ofstream.write("\n# NLAYERS #\n\t1 REPLICATE 0")
-    ofstream.write("\n# USENEIG #\n\ttrue")
-    ofstream.write("\n# PRMFILE #\n\t" + param_file)
-    ofstream.write("\n# CRDFILE #\n\t" + xyz_file)
-    ofstream.write("\n# VELINIT #\n\tGEN")
-    ofstream.write("\n# CONSRNT #\n\tNVT-MTK HOOVER 10")
-    ofstream.write("\n# PRSCALC #\n\tANALYTICAL")
-    ofstream.write("\n# FRQDFTB #\n\t1")
-    ofstream.write("\n# ATMENER #\n\ttrue")
-    ofstream.write("\n# FRQENER #\n\t1")    
-    ofstream.write("\n# PRNTFRC #\n\ttrue 1")
-    ofstream.write("\n# PRNTBAD #\n\tfalse")
-    ofstream.write("\n# ENDFILE #")
-    ofstream.write("\n#")
-    ofstream.close()
+    chimes_single_point.write_input(".", param_file)
 
 def get_FES(xyz_file,param_file, md_driver):
     
     # Tasks:
     
-    # Setup files for a ChIMES md run
-    
-    gen_input_file(param_file,xyz_file)
-    
-    # Run the single point calculation
-    
-    helpers.writelines("run_md.out",helpers.run_bash_cmnd(md_driver + " run_md.in"))
-    
-    # Parse/save the output
-    
-    natoms   = float(helpers.head(xyz_file,1)[0])    
-    eperatm  = float(helpers.tail("md_statistics.out",1)[0].split()[3])
-    tmp_ener = natoms*eperatm
-    
-    tmp_stress = helpers.tail("run_md.out",6)   
+    # Setup files for a ChIMES md run, once per parameter file
     
-    for i in range(6):
-        tmp_stress[i] = float(tmp_stress[i].split()[1])
+    if (INPUT_PARAMS[0] != param_file) or (not os.path.isfile("run_md.in")):
+        gen_input_file(param_file)
+        INPUT_PARAMS[0] = param_file
     
-    # Clean up
+    # Run the single point calculation, parse the output
     
-    #helpers.run_bash_cmnd("rm -f output.xyz.bak traj_bad_r.lt.rin.xyz traj_bad_r.lt.rin+dp.xyz traj_bad_r.ge.rin+dp_dftbfrq.xyz traj.gen run_md.out output.xyz md_statistics.out forceout.xyzf forceout-labeled.txt")
+    tmp_ener, tmp_stress, tmp_forces = chimes_single_point.evaluate(md_driver, ".", [xyz_file])[0]
     
     # Return results
     
-    return tmp_ener, tmp_stress, "forceout.txt"
+    return tmp_ener, tmp_stress, tmp_forces
@@ -272,7 +272,7 @@ def run_md(my_ALC, my_case, my_indep, *argv, **kwargs):
     
     job_task  = "-n " + repr(int(args["job_nodes"])*int(args["job_ppn"])) + " " +  args["job_executable"] + " " + md_infile + " > run_md.out"    
     
-    if args["job_system"] == "slurm":
+    if args["job_system"] in ["slurm", "pilot"]:
         job_task = "srun "   + job_task
     else:
         job_task = "mpirun " + job_task    
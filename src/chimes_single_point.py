@@ -0,0 +1,213 @@
+# Global (python) modules
+
+import os
+import sys
+import subprocess
+
+"""
+
+Single-point ChIMES energies, stresses, and forces for batches of
+configurations.
+
+Shared by modify_FES (subtracting a model's contributions frame by frame) and
+energy_farm (cluster energies). A run directory is set up once with
+write_input, with its coordinate file fixed to SINGLE_POINT_INPUT, and
+evaluate then swaps each configuration into that file, runs chimes_md, and
+parses its results in-process. This saves the per-frame input generation
+and shell-outs, but not process start-up: chimes_md has no
+multi-configuration single-point input, so each configuration is still its
+own chimes_md call. Callers only see evaluate, so a batch mode can be added
+here if chimes_md gains one.
+
+"""
+
+# Coordinate file each configuration is written to, in the run directory
+
+SINGLE_POINT_INPUT = "sp_input.xyz"
+
+
+def replace_after(lines, key, value):
+
+    """
+
+    Replaces the line following each line containing key
+
+    Usage: lines = replace_after(lines, "CRDFILE", "../config.xyz")
+
+    Notes: Mimics awk '/key/{print;getline;$0=value}{print}'
+
+    """
+
+    new_lines = []
+    skip      = False
+
+    for line in lines:
+
+        if skip:
+            new_lines.append(value + '\n')
+            skip = False
+            continue
+
+        new_lines.append(line)
+
+        if key in line:
+            skip = True
+
+    return new_lines
+
+
+def write_input(run_dir, param_file=None, base_file=None):
+
+    """
+
+    Creates the ChIMES_MD input file (run_md.in) for single point calculations in run_dir
+
+    Usage: write_input(".", "params.txt") or write_input("FARM-0-1", base_file="run_md.cluster")
+
+    Notes: Without base_file, a generic single point input is written. With
+           it, the base file is used, with its CRDFILE (and PRMFILE, if
+           param_file is given) replaced. Relative paths are as seen from
+           run_dir.
+
+    """
+
+    if base_file is None:
+
+        contents = [
+            "\n# TEMPERA #\n\t0.0",
+            "\n# CMPRFRC #\n\tfalse",
+            "\n# TIMESTP #\n\t0.0",
+            "\n# N_MDSTP #\n\t1",
+            "\n# NLAYERS #\n\t1 REPLICATE 0",
+            "\n# USENEIG #\n\ttrue",
+            "\n# PRMFILE #\n\t" + param_file,
+            "\n# CRDFILE #\n\t" + SINGLE_POINT_INPUT,
+            "\n# VELINIT #\n\tGEN",
+            "\n# CONSRNT #\n\tNVT-MTK HOOVER 10",
+            "\n# PRSCALC #\n\tANALYTICAL",
+            "\n# FRQDFTB #\n\t1",
+            "\n# ATMENER #\n\ttrue",
+            "\n# FRQENER #\n\t1",
+            "\n# PRNTFRC #\n\ttrue 1",
+            "\n# PRNTBAD #\n\tfalse",
+            "\n# ENDFILE #",
+            "\n#"]
+
+    else:
+
+        with open(base_file, "r") as ifstream:
+            contents = ifstream.readlines()
+
+        contents = replace_after(contents, "CRDFILE", SINGLE_POINT_INPUT)
+
+        if param_file is not None:
+            contents = replace_after(contents, "PRMFILE", param_file)
+
+    with open(os.path.join(run_dir, "run_md.in"), "w") as ofstream:
+        ofstream.writelines(contents)
+
+
+def evaluate(md_driver, run_dir, frames, energy_line=-1, energy_field=3, stresses=True, forces=True):
+
+    """
+
+    Runs single point calculations for a batch of configurations
+
+    Usage: results = evaluate("chimes_md", ".", [frame_1_lines, "cluster.xyz", ...])
+           energy, stress, force_lines = results[0]
+
+    Notes: run_dir must have been set up with write_input. Each frame is
+           either the lines of an .xyz frame or the path to an .xyz file.
+           Returns one [energy, stress, forces] entry per frame, where
+           energy is the total energy (md_statistics.out entry
+           [energy_line][energy_field], which is per atom, times the atom
+           count); stress is [sxx, syy, szz, sxy, sxz, syz] from the end of
+           the chimes_md output; and forces are the lines of forceout.txt
+           (one force component per line). Stresses and forces are None
+           unless requested. Outputs are removed before each run, so a
+           failed run can't leave the previous frame's results behind. If
+           chimes_md fails, or a result can't be read, it is nan (forces
+           are then 3*natoms "nan" lines), with a warning (to stderr, so
+           worker protocols on stdout are kept clean).
+
+    """
+
+    results  = []
+    stats    = os.path.join(run_dir, "md_statistics.out")
+    forceout = os.path.join(run_dir, "forceout.txt")
+    stdout   = subprocess.DEVNULL
+
+    if stresses:
+        stdout = subprocess.PIPE
+
+    for frame in frames:
+
+        if isinstance(frame, str):
+            with open(frame, "r") as ifstream:
+                frame = ifstream.readlines()
+
+        with open(os.path.join(run_dir, SINGLE_POINT_INPUT), "w") as ofstream:
+            ofstream.writelines(frame)
+
+        for old in [stats, forceout]:
+            if os.path.isfile(old):
+                os.remove(old)
+
+        run    = subprocess.run(md_driver.split() + ["run_md.in"], cwd=run_dir, stdout=stdout, universal_newlines=True)
+        output = run.stdout
+        failed = (run.returncode != 0)
+        
+        if failed:
+            print("WARNING: Single point failed in " + run_dir + " (exit status " + str(run.returncode) + ")", file=sys.stderr)
+
+        # Energy
+
+        natoms = int(frame[0])
+        energy = float("nan")
+
+        if not failed:
+            try:
+                with open(stats, "r") as ifstream:
+                    energy = float(ifstream.readlines()[energy_line].split()[energy_field])*natoms
+            except (IOError, IndexError, ValueError):
+                print("WARNING: No single point energy in " + run_dir, file=sys.stderr)
+
+        # Stress and forces
+
+        stress      = None
+        force_lines = None
+
+        if stresses:
+
+            stress = [float("nan")]*6
+
+            if not failed:
+                try:
+                    lines = output.splitlines()
+
+                    if len(lines) < 6:
+                        raise ValueError
+
+                    stress = [float(line.split()[1]) for line in lines[-6:]]
+                except (IndexError, ValueError):
+                    print("WARNING: No single point stresses in " + run_dir, file=sys.stderr)
+
+        if forces:
+
+            force_lines = ["nan\n"]*(3*natoms)
+
+            if not failed:
+                try:
+                    with open(forceout, "r") as ifstream:
+                        lines = ifstream.readlines()
+
+                    if len(lines) < 3*natoms:
+                        raise ValueError
+
+                    force_lines = lines
+                except (IOError, ValueError):
+                    print("WARNING: No single point forces in " + run_dir, file=sys.stderr)
+
+        results.append([energy, stress, force_lines])
+
+    return results
@@ -2,6 +2,7 @@
 
 import glob # Warning: glob is unserted... set my_list = sorted(glob.glob(<str>)) if sorting needed
 import helpers
+import fileops
 import sys
 import os
 
@@ -18,7 +19,7 @@ def get_repo_energies(*argv, **kwargs):
     Notes: See function definition in helpers.py for a full list of options. 
            Runs out of the ALC folder.
            Expects a "params.txt" file to be there.
-           Calls .sh scripts in the utilities folder.    
+           Energies are computed by a job running energy_farm.py.    
            
     """
 
@@ -26,8 +27,8 @@ def get_repo_energies(*argv, **kwargs):
     # 0. Set up an argument parser
     ################################    
     
-    default_keys   = [""]*14
-    default_values = [""]*14    
+    default_keys   = [""]*15
+    default_values = [""]*15    
     
     # Cluster specific controls
     
@@ -48,6 +49,7 @@ def get_repo_energies(*argv, **kwargs):
     default_keys[11] = "job_executable"    ; default_values[11] = ""            # Full path to executable for ChIMES lsq job
     default_keys[12] = "job_system"        ; default_values[12] = "slurm"       # slurm or torque 
     default_keys[13] = "job_email"         ; default_values[13] = True          # Send slurm emails?
+    default_keys[14] = "local_python"      ; default_values[14] = "python3"     # Python used by the energy job (i.e. HPC_PYTHON)
          
         
     args = dict(list(zip(default_keys, default_values)))
@@ -57,11 +59,6 @@ def get_repo_energies(*argv, **kwargs):
     # 1. Prepare the energy jobs
     ################################
 
-    # Grab the submit scripts from the utitilities folder
-
-    helpers.run_bash_cmnd("cp " + args["driver_dir"] + "/../utilities/new-get_dumb_ener.sh       .")
-    helpers.run_bash_cmnd("cp " + args["driver_dir"] + "/../utilities/new-get_dumb_ener_subjob.sh .")
-
     # Grab the run_md.base file, prepare for this job
     
     ifstream = open(args["base_runfile"],'r')
@@ -83,28 +80,35 @@ def get_repo_energies(*argv, **kwargs):
             if "PRNTBAD" in runfile[i]:
                 found1 = True
     ofstream.close()
-    helpers.run_bash_cmnd("mv tmp run_md.cluster")    
+    fileops.mv("tmp run_md.cluster")
     
     
     ################################
     # 2. Submit the local energy job
     ################################    
     
-    curr_dir = helpers.run_bash_cmnd("pwd").rstrip()
+    curr_dir = fileops.pwd().rstrip()
 
-    run_cmnd  = "sbatch  -N " + args["job_nodes"] + " -n " + args["job_ppn"] + " -t " + args["job_walltime"] + " -J " + "dmb_enr" + " -p " + args["job_queue"] + " -A " + args["job_account"] + " "    
-    
-    if args["job_email"]:
-        run_cmnd += " --mail-type=ALL "
-    run_cmnd += " new-get_dumb_ener.sh GEN_FF/params.txt.reduced "  + args["job_executable"] + " " + curr_dir + "/run_md.cluster " + args["driver_dir"]
+    job_task  = args["local_python"] + " " + args["driver_dir"] + "/energy_farm.py "
+    job_task += "GEN_FF/params.txt.reduced "  + args["job_executable"] + " " + curr_dir + "/run_md.cluster"
     
     # Submit and monitor the jobs
 
     active_jobs = []
     
-    #print "job: ", run_cmnd
+    #print "job: ", job_task
     
-    active_jobs.append(int(helpers.run_bash_cmnd(run_cmnd).split()[0]))
+    active_jobs.append(helpers.create_and_launch_job(
+        job_name       = args["job_name"],
+        job_nodes      = args["job_nodes"],
+        job_ppn        = args["job_ppn"],
+        job_walltime   = args["job_walltime"],
+        job_queue      = args["job_queue"],
+        job_account    = args["job_account"],
+        job_executable = job_task,
+        job_system     = args["job_system"],
+        job_file       = "run_energy_farm.cmd",
+        job_email      = args["job_email"]))
 
     
     ################################
@@ -115,14 +119,12 @@ def get_repo_energies(*argv, **kwargs):
     
         print("Launching central repo energy calculations as well")
     
-        # Grab the submit scripts from the utitilities folder
+        # Stage the parameter and base files
 
-        currdir = helpers.run_bash_cmnd("pwd").rstrip()
+        currdir = fileops.pwd().rstrip()
         
-        helpers.run_bash_cmnd("cp " + args["driver_dir"]   + "/../utilities/new-get_dumb_ener.sh          ../CENTRAL_REPO")
-        helpers.run_bash_cmnd("cp " + args["driver_dir"]   + "/../utilities/new-get_dumb_ener_subjob.sh   ../CENTRAL_REPO")
-        helpers.run_bash_cmnd("cp " + currdir + "/GEN_FF/params.txt.reduced                            ../CENTRAL_REPO")
-        helpers.run_bash_cmnd("cp " + args["base_runfile"] + "                                         ../CENTRAL_REPO")   
+        fileops.cp(currdir + "/GEN_FF/params.txt.reduced                            ../CENTRAL_REPO")
+        fileops.cp(args["base_runfile"] + "                                         ../CENTRAL_REPO")
         
         os.chdir("../CENTRAL_REPO")    
             
@@ -148,18 +150,27 @@ def get_repo_energies(*argv, **kwargs):
                     found1 = True
                 
         ofstream.close()
-        helpers.run_bash_cmnd("mv tmp " + args["base_runfile"])        
+        fileops.mv("tmp " + args["base_runfile"])
         
         
         # Set up the job    
         
-        helpers.run_bash_cmnd("cp full_repo.xyzlist xyzlist.dat")
-    
-        run_cmnd  = "sbatch  -N " + args["job_nodes"] + " -n " + args["job_ppn"] + " -t " + args["job_cent_walltime"] + " -J " + "dmb_enr" + " -p " + args["job_cent_queue"] + " -A " + args["job_account"] + " "
-        run_cmnd += " new-get_dumb_ener.sh params.txt.reduced "  + args["job_executable"] + " " + args["base_runfile"] + " " + args["driver_dir"]
-        run_cmnd += " REPO"
-    
-        active_jobs.append(int(helpers.run_bash_cmnd(run_cmnd).split()[0]))
+        fileops.cp("full_repo.xyzlist xyzlist.dat")
+    
+        job_task  = args["local_python"] + " " + args["driver_dir"] + "/energy_farm.py "
+        job_task += "params.txt.reduced "  + args["job_executable"] + " " + args["base_runfile"] + " REPO"
+    
+        active_jobs.append(helpers.create_and_launch_job(
+            job_name       = args["job_name"],
+            job_nodes      = args["job_nodes"],
+            job_ppn        = args["job_ppn"],
+            job_walltime   = args["job_cent_walltime"],
+            job_queue      = args["job_cent_queue"],
+            job_account    = args["job_account"],
+            job_executable = job_task,
+            job_system     = args["job_system"],
+            job_file       = "run_energy_farm.cmd",
+            job_email      = args["job_email"]))
 
         ################################
         # 4. Wait for repo job to end, post-process
@@ -167,9 +178,9 @@ def get_repo_energies(*argv, **kwargs):
     
         helpers.wait_for_job(active_jobs[1], job_system = args["job_system"], verbose = True, job_name = "get_repo_energies-central")    
     
-        helpers.run_bash_cmnd("mv all.xyzlist.dat     full_repo.xyzlist.dat")
-        helpers.run_bash_cmnd("mv all.energies        full_repo.energies")
-        helpers.run_bash_cmnd("mv all.energies_normed full_repo.energies_normed")
+        fileops.mv("all.xyzlist.dat     full_repo.xyzlist.dat")
+        fileops.mv("all.energies        full_repo.energies")
+        fileops.mv("all.energies_normed full_repo.energies_normed")
     
         os.chdir(currdir)
         
@@ -199,7 +210,7 @@ def list_clusters(CFG_REPO, *argv): # This is where we need to start caring abou
     if len(argv) == 2:
         max_atoms = int(argv[1])
 
-    helpers.run_bash_cmnd("rm -f xyzlist.dat ts_xyzlist.dat")
+    fileops.rm("xyzlist.dat ts_xyzlist.dat")
     
     ################################
     # X. Get a list of all tight species
@@ -240,7 +251,7 @@ def list_clusters(CFG_REPO, *argv): # This is where we need to start caring abou
     ofstream.close()
     
     helpers.run_bash_cmnd_to_file("xyzlist.dat", "sort tmp")
-    helpers.run_bash_cmnd("rm -f tmp")
+    fileops.rm("tmp")
     
 
     
@@ -275,7 +286,7 @@ def list_clusters(CFG_REPO, *argv): # This is where we need to start caring abou
     ofstream.close()
     
     helpers.run_bash_cmnd_to_file("ts_xyzlist.dat", "sort tmp")
-    helpers.run_bash_cmnd("rm -f tmp")    
+    fileops.rm("tmp")
 
 
 def generate_clusters(**kwargs):
@@ -350,20 +361,20 @@ def generate_clusters(**kwargs):
     
     print("Code run.")
     
-    helpers.run_bash_cmnd("rm -rf CFG_REPO")
-    helpers.run_bash_cmnd("mkdir CFG_REPO")
+    fileops.rm_rf("CFG_REPO")
+    fileops.mkdir("CFG_REPO")
     
     # Save
     
     items = ' '.join(glob.glob("*.wrapped.*xyz"))
     
-    helpers.run_bash_cmnd("mv " + items + " CFG_REPO")
+    fileops.mv(items + " CFG_REPO")
     
     # Cleanup
     
     items =  ' '.join(glob.glob("*wrap*xyz")) + " " + ' '.join(glob.glob("*wrap*lammpstrj")) + " " + ' '.join(glob.glob("*cluster*stats"))
 
-    helpers.run_bash_cmnd("rm -f " + items)
+    fileops.rm(items)
     
 
     if args["my_dir"]:
@@ -415,69 +426,32 @@ def get_pared_trajs(do_cluster):
                     ofstream.write(box)
         ofstream.close()
         
-        helpers.run_bash_cmnd("mv traj+box.xyz traj_bad_r.ge.rin+dp_dftbfrq.xyz")
+        fileops.mv("traj+box.xyz traj_bad_r.ge.rin+dp_dftbfrq.xyz")
         
     else:
-        with open("traj_bad_r.ge.rin+dp_dftbfrq.xyz") as ifstream:
-            for line in ifstream:
-                if len(line.split()) == 1:
-                    frames += 1
-    
-    ################################
-    # 1. Generate 20 evenly spaced frames
-    ################################
-    
-    print("Generating 20 evenly spaced frames")
+        frames = helpers.count_xyzframes_general("traj_bad_r.ge.rin+dp_dftbfrq.xyz")
     
     if frames == 0:
         print("ERROR: No frames in traj.gen or traj_bad_r.ge.rin+dp_dftbfrq.xyz")
         print("Try decreasing timestep and starting over.")
         exit()
-    
-    skip = int(frames / 20)
-    
-    if frames <= 20: # Then skip would be 0
-    
-        helpers.cat_specific("traj_20F.xyz", ["traj_bad_r.ge.rin+dp_dftbfrq.xyz"])
-    else:
-
-        helpers.break_apart_xyz(20*skip, "traj_bad_r.ge.rin+dp_dftbfrq.xyz", skip, True) # First arg was: frames
-    
-        # Cat the resulting files, add penalty frames
-    
-        helpers.cat_pattern("traj_20F.xyz", "traj_bad_r.ge.rin+dp_dftbfrq_#*")
-    
-    print("Adding up to 20 traj_bad_r.lt.rin+dp.xyz frames")
-    
-    nbad = 0
+        
+    # Up to 20 evenly spaced penalty frames are added to each pared trajectory
+        
+    penalty = []
     
     if os.path.isfile("traj_bad_r.lt.rin+dp.xyz"):
+        penalty.append(("traj_bad_r.lt.rin+dp.xyz", helpers.subsample_xyzframes("traj_bad_r.lt.rin+dp.xyz", nframes=20)))
     
-        # Figure out how many frames are in the bad traj... if <= 20, just cat, else, split and grab 20
-        
-        nbad   = helpers.count_xyzframes_general("traj_bad_r.lt.rin+dp.xyz")
-
-        if nbad <= 20:
-
-            helpers.cat_specific("tmp", ["traj_20F.xyz", "traj_bad_r.lt.rin+dp.xyz"])
-    
-            helpers.run_bash_cmnd("mv tmp traj_20F.xyz")
-        else:
-        
-            skip = int(nbad / 20)
-            
-            helpers.break_apart_xyz(20*skip, "traj_bad_r.lt.rin+dp.xyz", skip, True) # First arg was: frames
-            helpers.cat_pattern("traj-bad_20F.xyz", "traj_bad_r.lt.rin+dp_#*")
-            
-            helpers.cat_specific("tmp", ["traj_20F.xyz", "traj-bad_20F.xyz"])
+    ################################
+    # 1. Generate 20 evenly spaced frames
+    ################################
     
-            helpers.run_bash_cmnd("mv tmp traj_20F.xyz")            
-        
-    # Clean up
+    print("Generating 20 evenly spaced frames")
+    print("Adding up to 20 traj_bad_r.lt.rin+dp.xyz frames")
     
-    helpers.run_bash_cmnd("rm -f " + ' '.join(glob.glob("traj_bad_r.ge.rin+dp_dftbfrq_#*")))
-    helpers.run_bash_cmnd("rm -f " + ' '.join(glob.glob("traj_bad_r.lt.rin+dp_#*")))
-    helpers.run_bash_cmnd("rm -f " + ' '.join(glob.glob("*FORCES*")))
+    helpers.write_xyzframes("traj_20F.xyz", 
+        [("traj_bad_r.ge.rin+dp_dftbfrq.xyz", helpers.subsample_xyzframes("traj_bad_r.ge.rin+dp_dftbfrq.xyz", nframes=20))] + penalty)
 
     ################################
     # 2. If requested, generate 250 evenly spaced frames
@@ -486,38 +460,10 @@ def get_pared_trajs(do_cluster):
     if do_cluster:
         
         print("Generating 250 evenly spaced frames")
-
-        skip = int(frames / 250)
-        
-        if frames <= 250:
-            helpers.cat_specific("traj_250F.xyz", ["traj_bad_r.ge.rin+dp_dftbfrq.xyz"])
-        else:
-            helpers.break_apart_xyz(250*skip, "traj_bad_r.ge.rin+dp_dftbfrq.xyz", skip, True)  # First arg was: frames
-
-            # Cat the resulting files, add penalty frames
-
-            helpers.cat_pattern("traj_250F.xyz", "traj_bad_r.ge.rin+dp_dftbfrq_#*")
-        
         print("Adding up to 20 traj_bad_r.lt.rin+dp.xyz frames")
         
-        if nbad > 0:
-        
-            if nbad <= 20: # os.path.isfile("traj_bad_r.lt.rin+dp.xyz"):
-
-                helpers.cat_specific("tmp", ["traj_250F.xyz", "traj_bad_r.lt.rin+dp.xyz"])
-
-                helpers.run_bash_cmnd("mv tmp traj_250F.xyz")
-            else:
-            
-                helpers.cat_specific("tmp", ["traj_250F.xyz", "traj-bad_20F.xyz"])
-    
-                helpers.run_bash_cmnd("mv tmp traj_250F.xyz")                
-                
-            
-        # Clean up
-
-        helpers.run_bash_cmnd("rm -f " + ' '.join(glob.glob("traj_bad_r.ge.rin+dp_dftbfrq_#*")))
-        helpers.run_bash_cmnd("rm -f " + ' '.join(glob.glob("*FORCES*")))
+        helpers.write_xyzframes("traj_250F.xyz", 
+            [("traj_bad_r.ge.rin+dp_dftbfrq.xyz", helpers.subsample_xyzframes("traj_bad_r.ge.rin+dp_dftbfrq.xyz", nframes=250))] + penalty)
         
     #helpers.run_bash_cmnd("cd ..")
     
@@ -164,10 +164,7 @@ def continue_job(*argv, **kwargs):
             
                 print("            Resubmitting.")
 
-                if args["job_system"] == "slurm":
-                    job_list.append(helpers.run_bash_cmnd("sbatch run_dftb.cmd").split()[-1])
-                else:    
-                    job_list.append(helpers.run_bash_cmnd("qsub run_dftb.cmd").replace('\n', ''))
+                job_list.append(helpers.submit_job("run_dftb.cmd", args["job_system"]))
 
             else:
                 print("            Not resubmitting.")
@@ -662,8 +659,7 @@ def setup_dftb(my_ALC, *argv, **kwargs):
                 print("\tSearched file:",my_file, ", which is based on \"all\" and \"20\" trajectories")
                 continue
                 
-            frames = helpers.wc_l(my_file  )
-            frames = frames / (2+int(atoms))
+            frames = helpers.count_xyzframes_general(my_file)
 
             helpers.break_apart_xyz(frames, my_file)
             
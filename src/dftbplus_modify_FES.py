@@ -1,152 +1,274 @@
+import os
+import re
 import glob
 
 import helpers
+import fileops
+
+# Current evaluation session: parameter directory whose SK files are staged,
+# [electron temperature, cold start input, warm start input] for the staged
+# dftb_in.hsd, and the atom types (in order) of the frame that wrote charges.bin
+
+SESSION = [None, None, None]
 
 def clean_up():
 
-    files  = ' '.join(glob.glob("*.sfk"))
-    files += "tmp.gen detailed.out results.tag dftb.out tmp.xyz dftb_in.hsd stdoutmsg"
+    files  = glob.glob("*.skf")
+    files += ["tmp.gen", "detailed.out", "results.tag", "dftb.out", "tmp.xyz", "dftb_in.hsd", "stdoutmsg", "charges.bin"]
 
+    fileops.rm(files, glob.glob("tmp-broyden*"), glob.glob("geo_end.*"), "dftb_pin.hsd", "dftbjob.gen")
 
-    helpers.run_bash_cmnd("rm -f " + files)
+    SESSION[0] = None
+    SESSION[1] = None
+    SESSION[2] = None
 
 def check_atomtypes(parfile):
 
     atmtyps = []
 
     # Get a list of input files
-    
+
     skf_files = sorted(glob.glob(parfile + "/*skf"))
-    
+
     for i in range(len(skf_files)):
-    
+
         tag = skf_files[i].split('/')[-1]
-        tag = tag.split('-')    
+        tag = tag.split('-')
         atmtyps.append(tag[0])
         tag = tag[1].split('.')
-        atmtyps.append(tag[0])    
-    
+        atmtyps.append(tag[0])
+
     atmtyps = list(set(atmtyps))
     atmtyps.sort()
-    
+
     return atmtyps
 
 def gen_input_file(xyz_file):
-    
-    """ 
-    
+
+    """
+
     Converts user-provided xyz file to .gen
-    
-    Usage: gen_input_file(xyz_file)
-    
+
+    Usage: atom_types = gen_input_file(xyz_file)
+
+    Notes: Single frame, in-process version of helpers.xyz_to_dftbgen;
+           writes tmp.gen for tmp.xyz. Returns the frame's atom types, in
+           order.
+
+    """
+
+    contents = helpers.readlines(xyz_file)
+    natoms   = int(contents[0])
+    boxline  = contents[1].split()
+
+    if boxline[0] == "NON_ORTHO":
+        box = [boxline[1], boxline[5], boxline[9]]
+    else:
+        box = boxline[0:3]
+
+    atoms             = [line.split() for line in contents[2:natoms+2]]
+    atom_types        = [line[0] for line in atoms]
+    unique_atom_types = sorted(set(atom_types))
+
+    gen = [str(natoms) + " S\n", ' '.join(unique_atom_types) + '\n']
+
+    for i in range(natoms):
+        gen.append(str(i+1) + " " + str(unique_atom_types.index(atom_types[i])+1) + " " + ' '.join(atoms[i][1:4]) + "\n")
+
+    gen.append("0.0 0.0 0.0\n")
+    gen.append(str(float(box[0])) + " 0.0 0.0\n")
+    gen.append("0.0 " + str(float(box[1])) + " 0.0\n")
+    gen.append("0.0 0.0 " + str(float(box[2])) + "\n")
+
+    helpers.writelines('.'.join(xyz_file.split('.')[0:-1]) + ".gen", gen)
+
+    return atom_types
+
+def warm_start_input(contents):
+
+    """
+
+    Returns a dftb_in.hsd that reads SCC starting charges from charges.bin
+
+    Usage: warm = warm_start_input(helpers.readlines("300.dftb_in.hsd"))
+
+    Notes: Adds ReadInitialCharges = Yes to the DFTB Hamiltonian block.
+           Returns None (no warm start) for non-SCC inputs, inputs that
+           already set ReadInitialCharges, or Hamiltonians that can't be
+           found.
+
+    """
+
+    text = ''.join(contents)
+
+    if not re.search(r"SCC\s*=\s*Yes", text, re.IGNORECASE):
+        return None
+
+    if re.search(r"ReadInitialCharges", text, re.IGNORECASE):
+        return None
+
+    warm, found = re.subn(r"(Hamiltonian\s*=\s*DFTB\s*\{)", r"\1\n  ReadInitialCharges = Yes", text, count=1, flags=re.IGNORECASE)
+
+    if found == 0:
+        return None
+
+    return warm
+
+def start_session(param_file, temperature):
+
+    """
+
+    Stages the SK files and dftb_in.hsd for a parameter directory and electron temperature
+
+    Usage: cold, warm = start_session("DFTB_FILES", 300)
+
+    Notes: SK files are only copied when the parameter directory changes,
+           and the input file only re-read when the temperature changes.
+           Returns the cold and warm start (see warm_start_input) input
+           file contents.
+
+    """
+
+    if SESSION[0] != param_file:
+
+        fileops.rm(glob.glob("*.skf"))
+        fileops.cp(glob.glob(param_file + "/*skf"), ".")
+        fileops.rm("charges.bin")
+
+        SESSION[0] = param_file
+        SESSION[1] = None
+        SESSION[2] = None
+
+    if (SESSION[1] is None) or (SESSION[1][0] != temperature):
+
+        cold = helpers.readlines(param_file + "/" + str(temperature).strip() + ".dftb_in.hsd")
+
+        SESSION[1] = [temperature, ''.join(cold), warm_start_input(cold)]
+
+    return SESSION[1][1], SESSION[1][2]
+
+def run_dftb(md_driver, hsd):
+
     """
 
-    return helpers.xyz_to_dftbgen(xyz_file) # Returns name of the xyz_file
+    Runs a DFTB+ single point with the given input file contents
+
+    Usage: converged = run_dftb("dftb+", hsd_contents)
+
+    Notes: Writes dftb.out. Returns False if the SCC cycle didn't converge.
+
+    """
+
+    helpers.writelines("dftb_in.hsd", [hsd])
+
+    output = helpers.run_bash_cmnd(md_driver)
+
+    helpers.writelines("dftb.out", [output])
+
+    return "SCC is NOT converged, maximal SCC iterations exceeded" not in output
+
+def get_FES(xyz_file, param_file, md_driver, temperature, warm_start=False):
 
-def get_FES(xyz_file, param_file, md_driver, temperature):
-    
     # Tasks:
-    
+
     # Setup files for a dftbplus single point energy calculation
-    # Assume user has specified the correct file format and provided 
+    # Assume user has specified the correct file format and provided
     # all slater koster files
     # User should also set gen file to tmp.gen
-    
+
+    # SK files and the input file are staged once per session; with 
+    # warm_start, SCC charges from the last configuration run here are used
+    # as the starting guess when it had the same atoms, in the same order.
+    # Callers only request this for consecutive frames of a trajectory
+
     kcalpermolAng2HperB = 1/627.50960803/1.889725989 # Multiply a value in kcal/mol/Ang by this to get H/B
-    
-    #### NEED TO SET THE ELECTRON TEMPERATURE
-    
-    cmnd_1 = "cp " + param_file + "/" + str(temperature).strip() + ".dftb_in.hsd ./dftb_in.hsd"
-    cmnd_2 = glob.glob(param_file + "/*skf")
-    cmnd_2 = "cp " + ' '.join(cmnd_2) + " ."
-
-    helpers.run_bash_cmnd(cmnd_1)
-    helpers.run_bash_cmnd(cmnd_2)
-    
-    gen_file = gen_input_file(xyz_file)
-    
-    # Run the single point calculation
-    
-    helpers.writelines("dftb.out",helpers.run_bash_cmnd(md_driver))
-    
-    # Verify the job converged
-    
-    ifstream = open("dftb.out",'r')
-    contents = ifstream.readlines()
-    ifstream.close()
-    
-    for i in range(len(contents)):
-        if "SCC is NOT converged, maximal SCC iterations exceeded" in contents[i]:
-            print("        ERROR: DFTB+ job not converged within MaxSCCIterations.")    
-            print("        ...try incresing SCCTolerance or Broyden MixingParameter, if using.")
-            print("        Job:",xyz_file, "run in", helpers.run_bash_cmnd("pwd"))
-            print("        Tailed output:")
-            print(''.join(helpers.tail("dftb.out",25)))
-            helpers.run_bash_cmnd("rm -f charges.bin tmp-broyden* dftb_pin.hsd dftbjob.gen geo_end.*")
-            exit()
-    
+
+    cold, warm = start_session(param_file, temperature)
+
+    atom_types = gen_input_file(xyz_file)
+    natoms     = len(atom_types)
+
+    # Run the single point calculation, and verify the job converged
+
+    converged = False
+
+    if warm_start and (warm is not None) and (SESSION[2] == atom_types) and os.path.isfile("charges.bin"):
+
+        converged = run_dftb(md_driver, warm)
+
+        if not converged:
+            print("        WARNING: DFTB+ job not converged from previous frame's charges; retrying from scratch")
+
+    if not converged:
+
+        fileops.rm("charges.bin")
+
+        converged = run_dftb(md_driver, cold)
+
+    if not converged:
+        print("        ERROR: DFTB+ job not converged within MaxSCCIterations.")
+        print("        ...try incresing SCCTolerance or Broyden MixingParameter, if using.")
+        print("        Job:",xyz_file, "run in", fileops.pwd())
+        print("        Tailed output:")
+        print(''.join(helpers.tail("dftb.out",25)))
+        fileops.rm("charges.bin", glob.glob("tmp-broyden*"), "dftb_pin.hsd", "dftbjob.gen", glob.glob("geo_end.*"))
+        exit()
+
+    SESSION[2] = atom_types
+
     # Parse/save the output
-    
+
     # Energy and stress
-    
-    natoms = int(helpers.head(xyz_file,1)[0])
-
-    ifstream = open("results.tag",'r')
-    contents = ifstream.readlines()
-    ifstream.close()
-    
-    energy     = None
+
+    tmp_ener   = None
     tmp_stress = []
-    
-    for i in range(len(contents)):
-    
-        if "total_energy" in contents[i]:
-            tmp_ener = float(contents[i+1])*627.50960803
-        if "stress" in contents[i]:
-            sx = contents[i+1].split() # sxx, sxy, sxz
-            sy = contents[i+2].split() # syx, syy, syz
-            sz = contents[i+3].split() # szx, szy, szz
-            
-            # Convert stresses to GPa
-            
-            tmp_stress.append(float(sx[0])*29421.9091) # xx
-            tmp_stress.append(float(sy[1])*29421.9091) # yy
-            tmp_stress.append(float(sz[2])*29421.9091) # zz
-            
-            tmp_stress.append(float(sx[1])*29421.9091) # xy
-            tmp_stress.append(float(sx[2])*29421.9091) # xz
-            tmp_stress.append(float(sy[2])*29421.9091) # yz                    
-    
-    # Forces
-    
-    ifstream = open("detailed.out",'r')
-    contents = ifstream.readlines()
-    ifstream.close()
 
+    with open("results.tag",'r') as ifstream:
 
-    kcalpermolAng2HperB = 1/627.50960803/1.889725989 # Multiply a value in kcal/mol/Ang by this to get H/B
+        for line in ifstream:
+
+            if "total_energy" in line:
+                tmp_ener = float(next(ifstream))*627.50960803
+
+            elif "stress" in line:
+                sx = next(ifstream).split() # sxx, sxy, sxz
+                sy = next(ifstream).split() # syx, syy, syz
+                sz = next(ifstream).split() # szx, szy, szz
 
+                # Convert stresses to GPa
+
+                tmp_stress.append(float(sx[0])*29421.9091) # xx
+                tmp_stress.append(float(sy[1])*29421.9091) # yy
+                tmp_stress.append(float(sz[2])*29421.9091) # zz
+
+                tmp_stress.append(float(sx[1])*29421.9091) # xy
+                tmp_stress.append(float(sx[2])*29421.9091) # xz
+                tmp_stress.append(float(sy[2])*29421.9091) # yz
+
+    # Forces
 
     forces = []
-    
-    for i in range(len(contents)):
-    
-        if "Total Forces" in contents[i]:
-        
-            for j in range(natoms):
-            
-                temp = contents[i+j+1].split()
-
-                forces.append(str(float(temp[0])/kcalpermolAng2HperB)+'\n')
-                forces.append(str(float(temp[1])/kcalpermolAng2HperB)+'\n')
-                forces.append(str(float(temp[2])/kcalpermolAng2HperB)+'\n')
-                
-    helpers.writelines("forceout.txt",forces)
-
-    # Clean up
-    
-    helpers.run_bash_cmnd("rm -f charges.bin tmp-broyden* dftb_pin.hsd dftbjob.gen geo_end.*")
-    
+
+    with open("detailed.out",'r') as ifstream:
+
+        for line in ifstream:
+
+            if "Total Forces" in line:
+
+                for j in range(natoms):
+
+                    temp = next(ifstream).split()
+
+                    forces.append(str(float(temp[0])/kcalpermolAng2HperB)+'\n')
+                    forces.append(str(float(temp[1])/kcalpermolAng2HperB)+'\n')
+                    forces.append(str(float(temp[2])/kcalpermolAng2HperB)+'\n')
+
+                break
+
+    # Clean up; charges.bin is kept for the next frame
+
+    fileops.rm(glob.glob("tmp-broyden*"), "dftb_pin.hsd", "dftbjob.gen", glob.glob("geo_end.*"))
+
     # Return results
-    
-    return tmp_ener, tmp_stress, "forceout.txt"
+
+    return tmp_ener, tmp_stress, forces
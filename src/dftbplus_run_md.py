@@ -291,7 +291,7 @@ def run_md(my_ALC, my_case, my_indep, *argv, **kwargs):
     
     job_task  = "-n 1 " + args["job_executable"] + " > dftb.out"    
 
-    if args["job_system"] == "slurm":
+    if args["job_system"] in ["slurm", "pilot"]:
         job_task = "srun "   + job_task
     else:
         job_task = "mpirun " + job_task    
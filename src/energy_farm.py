@@ -0,0 +1,406 @@
+# Global (python) modules
+
+import os
+import re
+import sys
+import time
+import shutil
+import threading
+import subprocess
+import collections
+import concurrent.futures
+
+# Local modules
+
+import chimes_single_point
+
+"""
+
+Task farm for ChIMES single-point energies of repository clusters.
+
+Replaces utilities/new-get_dumb_ener.sh, which split xyzlist.dat into
+equal-count chunks, one per core, so the cores given chunks of large clusters
+finished last while the rest sat idle. Here, one worker process is started per
+node (with srun, when running under SLURM), each with one slot per core, and
+the job script's process hands out clusters one at a time from a single
+queue, largest (most atoms) first, as slots free up. Energies are written in
+xyzlist order.
+
+"""
+
+
+def awk_number(value):
+
+    """
+
+    Formats a number as awk's print does
+
+    Usage: awk_number(1.0) # Returns "1"; awk_number(-0.1234567) returns "-0.123457"
+
+    Notes: Keeps energy files identical to those of new-get_dumb_ener.sh.
+
+    """
+
+    if value != value:
+        return "nan"
+
+    if (value == int(value)) and (abs(value) < 1E16):
+        return str(int(value))
+
+    return "%.6g" % value
+
+
+def read_xyzlist(xyzlist):
+
+    """
+
+    Reads a cluster list written by cluster.list_clusters
+
+    Usage: tasks = read_xyzlist("xyzlist.dat")
+
+    Notes: Returns a list of [index, no. atoms, cluster file] entries. Line
+           format is: <natoms> <n_type1> ... <n_typeN> </path/to/xyz/file>
+
+    """
+
+    tasks = []
+
+    with open(xyzlist, "r") as ifstream:
+
+        for line in ifstream:
+
+            line = line.split()
+
+            if len(line) == 0:
+                continue
+
+            tasks.append([len(tasks), int(line[0]), line[-1]])
+
+    return tasks
+
+
+def single_point(executable, scratch, xyzfile):
+
+    """
+
+    Returns the total energy of one cluster
+
+    Usage: energy = single_point("chimes_md", "FARM-0-1", "CFG_REPO/tight.1.wrap.xyz")
+
+    Notes: The scratch directory must be set up with
+           chimes_single_point.write_input. Energies are read as
+           new-get_dumb_ener_subjob.sh did (3rd line, 5th field of
+           md_statistics.out, times the atom count).
+
+    """
+
+    return chimes_single_point.evaluate(executable, scratch, [xyzfile], energy_line=2, energy_field=4, stresses=False, forces=False)[0][0]
+
+
+def worker(executable, base, nslots, tag):
+
+    """
+
+    Runs single points for clusters read from stdin, on nslots cores
+
+    Usage: python3 energy_farm.py worker <executable> <run_md.base> <nslots> <tag>
+
+    Notes: Reads "<index> <natoms> <cluster file>" lines from stdin and
+           writes "<index> <energy>" to stdout as each finishes, so the farm
+           can send the next cluster; clusters that fail (e.g. a missing
+           file) get a nan energy, with a warning on stderr. Exits once
+           stdin is closed and all clusters are done. Each slot uses its
+           own FARM-<tag>-<slot> scratch directory, removed when done.
+
+    """
+
+    slots    = collections.deque()
+    out_lock = threading.Lock()
+
+    for i in range(nslots):
+
+        scratch = "FARM-" + tag + "-" + str(i)
+
+        if not os.path.isdir(scratch):
+            os.mkdir(scratch)
+
+        chimes_single_point.write_input(scratch, base_file=base)
+
+        slots.append(scratch)
+
+    # Every cluster must be answered, or the farm waits on it forever; one
+    # that fails gets a nan energy
+
+    def run(task):
+
+        scratch = slots.popleft()
+
+        try:
+            energy = single_point(executable, scratch, task[2])
+        except Exception as error:
+            print("WARNING: Single point failed for " + task[2] + ": " + repr(error), file=sys.stderr)
+            energy = float("nan")
+        finally:
+            slots.append(scratch)
+
+        with out_lock:
+            sys.stdout.write(task[0] + " " + repr(energy) + '\n')
+            sys.stdout.flush()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nslots) as pool:
+
+        for line in sys.stdin:
+            pool.submit(run, line.split())
+
+    for scratch in slots:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def allocation():
+
+    """
+
+    Returns the nodes and cores per node available to the farm
+
+    Usage: nodes, cores = allocation()
+
+    Notes: Under SLURM, reads the job's node list and cores per node.
+           Otherwise (e.g. HPC_SYSTEM = "local"), returns no nodes, and the
+           core count of this machine, or $SLURM_JOB_CPUS_PER_NODE if set.
+
+    """
+
+    cores = os.environ.get("SLURM_JOB_CPUS_PER_NODE", "")
+    cores = re.split(r"[^0-9]", cores)[0]
+
+    if cores:
+        cores = int(cores)
+    else:
+        cores = os.cpu_count() or 1
+
+    nodes = []
+
+    if "SLURM_JOB_NODELIST" in os.environ:
+        nodes = subprocess.check_output(["scontrol", "show", "hostnames", os.environ["SLURM_JOB_NODELIST"]]).decode().split()
+
+    return nodes, cores
+
+
+def farm(tasks, executable, base, nodes, cores):
+
+    """
+
+    Computes energies for a list of clusters, balancing them across nodes and cores
+
+    Usage: energies = farm(read_xyzlist("xyzlist.dat"), "chimes_md", "run_md.base", ["node1", "node2"], 36)
+
+    Notes: Returns energies in task order. Clusters are handed out largest
+           first, one per free core, so no core idles while clusters remain.
+           One worker per node is launched with srun; with no nodes, a single
+           worker runs on this machine.
+
+    """
+
+    energies = [float("nan")]*len(tasks)
+    queue    = collections.deque(sorted(tasks, key=lambda task: -task[1]))
+    lock     = threading.Lock()
+
+    # Don't start more slots than there are clusters
+
+    nworkers = max(1, min(len(nodes), (len(tasks) + cores - 1)//cores))
+    nslots   = max(1, min(cores, (len(tasks) + nworkers - 1)//nworkers))
+
+    if len(nodes) == 0:
+        nodes = [None]
+
+    env = os.environ.copy()
+
+    # Pilot mode places job steps with a host file; workers are pinned with -w instead
+
+    env.pop("SLURM_HOSTFILE"    , None)
+    env.pop("SLURM_DISTRIBUTION", None)
+
+    def next_task():
+
+        with lock:
+            if len(queue) == 0:
+                return None
+            return queue.popleft()
+
+    def feed(node, tag):
+
+        cmnd = [sys.executable, os.path.abspath(__file__), "worker", executable, base, str(nslots), tag]
+
+        if node is not None:
+            cmnd = ["srun", "-N", "1", "-n", "1", "-c", str(nslots), "-w", node] + cmnd
+
+        proc = subprocess.Popen(cmnd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env, universal_newlines=True, bufsize=1)
+
+        # Fill every slot, then send a new cluster as each one finishes
+
+        sent = {}
+
+        def send():
+
+            task = next_task()
+
+            if task is not None:
+                sent[task[0]] = task
+                proc.stdin.write(str(task[0]) + " " + str(task[1]) + " " + task[2] + '\n')
+
+        for i in range(nslots):
+            send()
+
+        while len(sent) > 0:
+
+            line = proc.stdout.readline().split()
+
+            if len(line) == 0:
+
+                # Return this worker's unfinished clusters to the queue
+
+                print("WARNING: Energy farm worker", tag, "exited early")
+
+                with lock:
+                    queue.extend(sent.values())
+                break
+
+            energies[int(line[0])] = float(line[1])
+
+            del sent[int(line[0])]
+
+            send()
+
+        proc.stdin.close()
+        proc.wait()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nworkers) as pool:
+        for future in [pool.submit(feed, nodes[i], str(i)) for i in range(nworkers)]:
+            future.result()
+
+    # Clusters left if a worker failed are run here, so nothing is skipped
+
+    if len(queue) > 0:
+
+        print("WARNING: Running", len(queue), "remaining clusters serially")
+
+        if not os.path.isdir("FARM-serial"):
+            os.mkdir("FARM-serial")
+
+        chimes_single_point.write_input("FARM-serial", base_file=base)
+
+        for task in queue:
+            energies[task[0]] = single_point(executable, "FARM-serial", task[2])
+
+        shutil.rmtree("FARM-serial", ignore_errors=True)
+
+    return energies
+
+
+def get_energies(params, executable, base, repo_only=False):
+
+    """
+
+    Computes ChIMES energies for the clusters in xyzlist.dat (and ts_xyzlist.dat)
+
+    Usage: get_energies("GEN_FF/params.txt.reduced", "chimes_md", "run_md.cluster")
+
+    Notes: Drop-in for new-get_dumb_ener.sh: points the base run_md file at
+           the parameter file, then writes <target>xyzlist.energies and
+           <target>xyzlist.energies_normed for each target, and
+           all.xyzlist.dat, all.energies, and all.energies_normed, in
+           xyzlist order. With repo_only, only xyzlist.dat (tight clusters)
+           is processed.
+
+    """
+
+    start = time.time()
+
+    with open(base, "r") as ifstream:
+        template = chimes_single_point.replace_after(ifstream.readlines(), "PRMFILE", "../" + params)
+
+    with open(base, "w") as ofstream:
+        ofstream.writelines(template)
+
+    nodes, cores = allocation()
+
+    print("Using parameter file:", params)
+    print("Using executable:", executable)
+    print("Running on", max(1, len(nodes)), "node(s) with", cores, "cores each")
+
+    targets = ["ts_", ""]
+
+    if repo_only:
+        targets = [""]
+
+    for target in ["all."] + [target + "xyzlist." for target in targets]:
+        for suffix in ["energies", "energies_normed"]:
+            if os.path.isfile(target + suffix):
+                os.remove(target + suffix)
+
+    all_lists = []
+
+    for target in targets:
+
+        if not os.path.isfile(target + "xyzlist.dat"):
+            print("Warning: Cannot find file " + target + "xyzlist.dat ... skipping this loop.")
+            continue
+
+        tasks = read_xyzlist(target + "xyzlist.dat")
+
+        if len(tasks) == 0:
+            print("No clusters in " + target + "xyzlist.dat ... skipping.")
+            continue
+
+        print("Processing", len(tasks), "configurations in", target + "xyzlist.dat")
+
+        energies = farm(tasks, executable, base, nodes, cores)
+
+        with open(target + "xyzlist.energies", "w") as ofstream:
+            for energy in energies:
+                ofstream.write(awk_number(energy) + '\n')
+
+        with open(target + "xyzlist.energies_normed", "w") as ofstream:
+            for i in range(len(tasks)):
+                ofstream.write(awk_number(float(awk_number(energies[i]))/tasks[i][1]) + '\n')
+
+        all_lists.append(target)
+
+    with open("all.xyzlist.dat", "w") as xyzstream, open("all.energies", "w") as enerstream, open("all.energies_normed", "w") as normstream:
+
+        for target in all_lists:
+
+            with open(target + "xyzlist.dat", "r") as ifstream:
+                xyzstream.write(ifstream.read())
+
+            with open(target + "xyzlist.energies", "r") as ifstream:
+                enerstream.write(ifstream.read())
+
+            with open(target + "xyzlist.energies_normed", "r") as ifstream:
+                normstream.write(ifstream.read())
+
+    print("Energy farm finished in", "%.1f" % (time.time() - start), "s")
+
+
+if __name__=='__main__':
+
+    """
+
+    Allows commandline calls to the energy farm.
+
+    Usage: python3 energy_farm.py <params file> <executable> <run_md.base> [REPO]
+           python3 energy_farm.py worker <executable> <run_md.base> <nslots> <tag>
+
+    Notes: The first form is run from a job script (see
+           cluster.get_repo_energies); the second is launched by the first,
+           once per node.
+
+    """
+
+    if sys.argv[1] == "worker":
+
+        worker(sys.argv[2], sys.argv[3], int(sys.argv[4]), sys.argv[5])
+
+    else:
+
+        get_energies(sys.argv[1], sys.argv[2], sys.argv[3], repo_only=(len(sys.argv) > 4))
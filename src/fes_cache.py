@@ -0,0 +1,244 @@
+# Global (python) modules
+
+import os
+import json
+import math
+import shutil
+import hashlib
+
+# Local modules
+
+import xyzf_store
+
+"""
+
+On-disk cache of the forces, energies, and stresses a reference model predicts
+for single configurations.
+
+Hierarchical and correction fits subtract the same reference model
+contributions from the same ALC-0 trajectories on every rebuild (and on
+restarts after a failed build_amat). modify_FES.subtract_off looks frames up
+here before running the reference model, so only frames whose inputs changed
+are evaluated again.
+
+Entries are keyed by a hash of the method, the electron temperature, the
+contents of the parameter file (or of every file in a DFTB+ parameter
+directory), the executable's path and modification time, and the frame's
+cell, atom types and coordinates. Results with non-finite values (failed
+single points) are never stored. Each entry is a
+small JSON file, <cache_dir>/<key[:2]>/<key>.json. Lookups update the entry's
+modification time, and prune removes the least recently used entries once
+the cache exceeds its size limit.
+
+"""
+
+
+def model_digest(param_file):
+
+    """
+
+    Returns a hash of a parameter file's contents, or of all files in a parameter directory
+
+    Usage: digest = model_digest("params.txt") or model_digest("DFTB_FILES")
+
+    Notes: Directory contents are hashed in sorted file name order, along
+           with the file names.
+
+    """
+
+    digest = hashlib.sha256()
+
+    if os.path.isdir(param_file):
+
+        for name in sorted(os.listdir(param_file)):
+
+            path = os.path.join(param_file, name)
+
+            if not os.path.isfile(path):
+                continue
+
+            digest.update(name.encode() + b'\0')
+
+            with open(path, "rb") as ifstream:
+                digest.update(ifstream.read())
+
+    else:
+
+        with open(param_file, "rb") as ifstream:
+            digest.update(ifstream.read())
+
+    return digest.hexdigest()
+
+
+def driver_stamp(md_driver):
+
+    """
+
+    Returns a string identifying the executable a model is evaluated with
+
+    Usage: stamp = driver_stamp("/path/to/chimes_md")
+
+    Notes: The stamp is the command, with the executable resolved to an
+           absolute path (searching PATH, if needed) followed by its
+           modification time, so rebuilding or replacing it changes
+           cache keys. Launchers (e.g. srun) should not be included.
+
+    """
+
+    words = md_driver.split()
+    path  = shutil.which(words[0]) or words[0]
+    mtime = "missing"
+
+    if os.path.exists(path):
+        path  = os.path.abspath(path)
+        mtime = str(os.stat(path).st_mtime_ns)
+
+    return ' '.join([path, mtime] + words[1:])
+
+
+def frame_key(digest, driver, method, temperature, contents, previous=None):
+
+    """
+
+    Returns the cache key for one model evaluation of an .xyz(f) frame
+
+    Usage: key = frame_key(model_digest("params.txt"), driver_stamp("chimes_md"), "CHIMES", None, frame_lines)
+
+    Notes: contents are the frame lines passed to the model. Only the cell
+           and the atom types and coordinates are hashed, so stresses,
+           energies, and forces in the frame don't change the key.
+           
+           previous is the key of the frame a warm started evaluation 
+           started from, if any, since that changes the result.
+
+    """
+
+    box = xyzf_store.parse_header(contents[1])[0]
+
+    key = [method, str(temperature), digest, driver, ' '.join([repr(float(i)) for i in box])]
+    
+    if previous is not None:
+        key.append("warm " + previous)
+
+    for line in contents[2:int(contents[0])+2]:
+
+        line = line.split()
+
+        key.append(line[0] + ' ' + ' '.join([repr(float(i)) for i in line[1:4]]))
+
+    return hashlib.sha256('\n'.join(key).encode()).hexdigest()
+
+
+def entry_path(cache_dir, key):
+
+    """
+
+    Returns the path of a cache entry
+
+    Usage: entry_path("SUBTRACT_CACHE", key)
+
+    """
+
+    return os.path.join(cache_dir, key[:2], key + ".json")
+
+
+def lookup(cache_dir, key):
+
+    """
+
+    Returns a cached [energy, stress, force_lines] entry, or None
+
+    Usage: result = lookup("SUBTRACT_CACHE", key)
+
+    Notes: Marks the entry as recently used. Unreadable entries are treated
+           as missing.
+
+    """
+
+    path = entry_path(cache_dir, key)
+
+    try:
+        with open(path, "r") as ifstream:
+            entry = json.load(ifstream)
+    except (IOError, ValueError):
+        return None
+
+    os.utime(path)
+
+    return [entry["energy"], entry["stress"], entry["forces"]]
+
+
+def store(cache_dir, key, result):
+
+    """
+
+    Saves an [energy, stress, force_lines] entry
+
+    Usage: stored = store("SUBTRACT_CACHE", key, [energy, stress, force_lines])
+
+    Notes: Entries are written to a temporary file and renamed, so a crashed
+           run can't leave a partial entry behind. Results with a nan or inf
+           energy, stress, or force are not stored, so a failed single point
+           is run again next time; returns whether the entry was stored.
+
+    """
+
+    try:
+        values = [float(result[0])] + [float(i) for i in result[1]] + [float(line) for line in result[2]]
+    except (TypeError, ValueError):
+        return False
+
+    if not all([math.isfinite(value) for value in values]):
+        return False
+
+    path = entry_path(cache_dir, key)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path + ".tmp." + str(os.getpid()), "w") as ofstream:
+        json.dump({"energy" : result[0], "stress" : result[1], "forces" : result[2]}, ofstream)
+
+    os.replace(path + ".tmp." + str(os.getpid()), path)
+
+    return True
+
+
+def prune(cache_dir, max_size):
+
+    """
+
+    Removes the least recently used entries until the cache is at most max_size MB
+
+    Usage: prune("SUBTRACT_CACHE", 1000)
+
+    """
+
+    if not os.path.isdir(cache_dir):
+        return
+
+    entries = []
+    total   = 0
+
+    for path, dirs, files in os.walk(cache_dir):
+
+        for name in files:
+
+            stat = os.stat(os.path.join(path, name))
+
+            entries.append([stat.st_mtime, stat.st_size, os.path.join(path, name)])
+
+            total += stat.st_size
+
+    entries.sort()
+
+    removed = 0
+
+    while (total > max_size*1024*1024) and (removed < len(entries)):
+
+        os.remove(entries[removed][2])
+
+        total   -= entries[removed][1]
+        removed += 1
+
+    if removed > 0:
+        print("\tRemoved", removed, "least recently used entries from cache:", cache_dir)
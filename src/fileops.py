@@ -0,0 +1,280 @@
+# Global (python) modules
+
+import os
+import glob
+import time
+import shutil
+
+# Local modules
+
+import helpers
+
+""" In-process replacements for rm, mv, cp, mkdir, and pwd shell-outs. """
+
+# Number of calls and total time spent in each operation
+
+FILEOPS_STATS = {}
+
+
+def record(operation, start):
+
+    """
+
+    Updates the call count and timer for an operation
+
+    Usage: record("rm", start_time)
+
+    """
+
+    if operation not in FILEOPS_STATS:
+        FILEOPS_STATS[operation] = [0, 0.0]
+
+    FILEOPS_STATS[operation][0] += 1
+    FILEOPS_STATS[operation][1] += time.time() - start
+
+
+def expand(*argv):
+
+    """
+
+    Flattens paths into a single list
+
+    Usage: expand("a.txt", "b.txt c.txt", ["d.txt", "e.txt"])
+
+    Notes: Arguments can be paths or lists of paths. Strings containing 
+           whitespace are split, for drop-in compatibility with strings built 
+           for run_bash_cmnd. As with run_bash_cmnd, wildcards are NOT 
+           expanded; use matching for that.
+
+    """
+
+    paths = []
+
+    for arg in argv:
+
+        if isinstance(arg, (list, tuple)):
+            paths += expand(*arg)
+        else:
+            paths += arg.split()
+
+    return paths
+
+
+def matching(*argv):
+
+    """
+
+    Expands linux wildcard patterns
+
+    Usage: rm(matching("*FORCES*", "*.tries"))
+
+    Notes: Returns a sorted list of matching paths for each pattern, in the 
+           order the patterns were given. Patterns with no matches are dropped.
+
+    """
+
+    paths = []
+
+    for pattern in expand(*argv):
+        paths += sorted(glob.glob(pattern))
+
+    return paths
+
+
+def rm(*argv):
+
+    """
+
+    Mimics functionality of Linux rm -f
+
+    Usage: rm("a.txt", "b.dat") or rm(["a.txt", "b.txt"]) or rm(matching("*.dat"))
+
+    Notes: Missing files are silently ignored. Directories are left alone
+           (see rm_rf).
+
+    """
+
+    start = time.time()
+
+    for path in expand(*argv):
+
+        if os.path.isdir(path) and not os.path.islink(path):
+            continue
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    record("rm", start)
+
+
+def rm_rf(*argv):
+
+    """
+
+    Mimics functionality of Linux rm -rf
+
+    Usage: rm_rf("GEN_FF") or rm_rf(matching("VASP-20/*"))
+
+    """
+
+    start = time.time()
+
+    for path in expand(*argv):
+
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            os.remove(path)
+
+    record("rm_rf", start)
+
+
+def mv(*argv):
+
+    """
+
+    Mimics functionality of Linux mv
+
+    Usage: mv("tmp.dat", "OUTCAR.xyzf") or mv(matching("*.dat"), "some_dir")
+
+    Notes: The last argument is the destination. With multiple sources, it
+           must be a directory. Existing destination files are overwritten,
+           including files of the same name in a destination directory. As
+           with mv, a directory is not moved onto an existing directory.
+
+    """
+
+    start = time.time()
+
+    paths = expand(*argv)
+    dest  = paths.pop()
+
+    if (len(paths) > 1) and (not os.path.isdir(dest)):
+        print("ERROR: Destination for multiple files must be a directory:", dest)
+        exit()
+
+    for path in paths:
+
+        if not os.path.lexists(path):
+            print("WARNING: mv cannot find:", path)
+            continue
+
+        target = dest
+
+        if os.path.isdir(dest):
+            target = os.path.join(dest, os.path.basename(os.path.normpath(path)))
+
+        if os.path.isdir(target) and not os.path.islink(target):
+            print("WARNING: mv cannot overwrite directory:", target)
+            continue
+
+        shutil.move(path, target)
+
+    record("mv", start)
+
+
+def cp(*argv):
+
+    """
+
+    Mimics functionality of Linux cp
+
+    Usage: cp("restart.txt", "run-1") or cp(matching("basefiles/*"), ".")
+
+    Notes: The last argument is the destination. With multiple sources, it
+           must be a directory. Permission bits are copied, as cp does for
+           new files, so scripts remain executable. Like cp without -r,
+           directories are skipped.
+
+    """
+
+    start = time.time()
+
+    paths = expand(*argv)
+    dest  = paths.pop()
+
+    if (len(paths) > 1) and (not os.path.isdir(dest)):
+        print("ERROR: Destination for multiple files must be a directory:", dest)
+        exit()
+
+    for path in paths:
+
+        if not os.path.exists(path):
+            print("WARNING: cp cannot find:", path)
+            continue
+
+        if os.path.isdir(path):
+            print("WARNING: cp skipping directory:", path)
+            continue
+
+        shutil.copy(path, dest)
+
+    record("cp", start)
+
+
+def mkdir(*argv, **kwargs):
+
+    """
+
+    Mimics functionality of Linux mkdir, or mkdir -p with parents=True
+
+    Usage: mkdir("GEN_FF") or mkdir("VASP-all/CASE-0", parents=True)
+
+    """
+
+    start = time.time()
+
+    for path in expand(*argv):
+
+        if kwargs.get("parents", False):
+            os.makedirs(path, exist_ok=True)
+        elif not os.path.isdir(path):
+            os.mkdir(path)
+
+    record("mkdir", start)
+
+
+def pwd():
+
+    """
+
+    Mimics functionality of Linux pwd
+
+    Usage: pwd()
+
+    Notes: Like run_bash_cmnd("pwd"), includes a trailing newline.
+
+    """
+
+    start = time.time()
+
+    path = os.getcwd() + '\n'
+
+    record("pwd", start)
+
+    return path
+
+
+def print_stats():
+
+    """
+
+    Prints the number of, and time spent in, spawned shell commands and in-process file operations
+
+    Usage: print_stats()
+
+    Notes: Counts are cumulative over the driver run.
+
+    """
+
+    calls, spent = helpers.BASH_CMND_STATS
+
+    print("Spawned shell commands:", calls, "taking", "%.3f" % spent, "s")
+
+    for operation in sorted(FILEOPS_STATS):
+
+        calls, spent = FILEOPS_STATS[operation]
+
+        print("In-process " + operation + ":", calls, "taking", "%.3f" % spent, "s")
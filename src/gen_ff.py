@@ -5,10 +5,13 @@ import os
 import glob # Warning: glob is unsorted... set my_list = sorted(glob.glob(<str>)) if sorting needed
 import copy
 import math as m
+import sys
+import ast
 
 # Local modules
 
 import helpers
+import fileops
 import hierarch
 import modify_FES
 
@@ -39,8 +42,8 @@ def subtract(**kwargs):
     # 0. Set up an argument parser
     ################################
     
-    default_keys   = [""]*5
-    default_values = [""]*5
+    default_keys   = [""]*11
+    default_values = [""]*11
 
 
     default_keys[0 ] = "md_driver"        ; default_values[0 ] = None      # MD code executable to use when evaluating interactions
@@ -48,6 +51,12 @@ def subtract(**kwargs):
     default_keys[2 ] = "trajectories"    ; default_values[2 ] = []         # List of trajectory files to modify
     default_keys[3 ] = "temperatures"    ; default_values[3 ] = []         # List of temperatures files for each trajectory file
     default_keys[4 ] = "parameters"        ; default_values[4 ] = []       # List of parameter files to use
+    default_keys[5 ] = "nprocs"            ; default_values[5 ] = 1        # Number of worker processes evaluating frames
+    default_keys[6 ] = "launcher"          ; default_values[6 ] = ""       # Command prepended to md_driver (e.g. "srun -N 1 -n 1 --exact")
+    default_keys[7 ] = "cache"             ; default_values[7 ] = None     # Directory of cached single point results (None to disable)
+    default_keys[8 ] = "cache_size"        ; default_values[8 ] = 1000     # Maximum cache size, in MB
+    default_keys[9 ] = "warm_start"        ; default_values[9 ] = False    # Start DFTB+ SCC cycles from the previous frame's charges?
+    default_keys[10] = "stores"            ; default_values[10] = None     # Binary store (see xyzf_store) for each trajectory file, or None
 
     args = dict(list(zip(default_keys, default_values)))
     args.update(kwargs)    
@@ -73,10 +82,11 @@ def subtract(**kwargs):
     
     print("Saving original forces to files named like:  b-labeled_full.traj_file_idx-X.dat:")
     
-    modify_FES.write_full_FES(args["trajectories"])
+    modify_FES.write_full_FES(args["trajectories"], args["stores"])
     
-    for i in range(len(params)):
-        modify_FES.subtract_off(params[i], args["md_driver"], args["method"], args["trajectories"], args["temperatures"])
+    # All parameter files are subtracted in a single pass over the trajectories
+    
+    modify_FES.subtract_off(params, args["md_driver"], args["method"], args["trajectories"], args["temperatures"], args["nprocs"], args["launcher"], args["cache"], args["cache_size"], args["warm_start"])
         
     modify_FES.clean_up(args["method"])
         
@@ -448,19 +458,19 @@ def restart_solve_amat(my_ALC, **kwargs):
     this_restart = "restart-1.txt"
     
     if len(prev_restarts) == 1:
-        helpers.run_bash_cmnd("cp restart.txt " + this_restart)
+        fileops.cp("restart.txt " + this_restart)
     else:
         this_restart  = "restart-"
         this_restart += repr(int(prev_restarts[-2].split("-")[1].split(".")[0])+1)
         this_restart += ".txt"
     
-        helpers.run_bash_cmnd("cp restart.txt " + this_restart)
+        fileops.cp("restart.txt " + this_restart)
         
         
     run_no = int(this_restart.split("-")[1].split(".")[0])
 
-    helpers.run_bash_cmnd("mkdir run-"+repr(run_no))
-    helpers.run_bash_cmnd("cp restart.txt dlars.log traj.txt run-"+repr(run_no))
+    fileops.mkdir("run-"+repr(run_no))
+    fileops.cp("restart.txt dlars.log traj.txt run-"+repr(run_no))
 
     # Determine whether this was a job with a split amat, and if so, ensure files are correct
     
@@ -573,8 +583,8 @@ def build_amat(my_ALC, **kwargs):
     # 0. Set up an argument parser
     ################################
     
-    default_keys   = [""]*24
-    default_values = [""]*24
+    default_keys   = [""]*29
+    default_values = [""]*29
     
     # Paths
     
@@ -593,6 +603,11 @@ def build_amat(my_ALC, **kwargs):
     default_keys[12] = "correction_files"  ; default_values[12] =     None                   # Path to directory containng files needed for calculating interactions via method to be corrected
     default_keys[13] = "correction_exe"    ; default_values[13] =     None                   # Executable for method being corrected
     default_keys[14] = "correction_temps"  ; default_values[14] =     None                   # How to handle electron temperatures for 1st ALC
+    default_keys[24] = "subtract_nprocs"   ; default_values[24] =     1                      # Worker processes for hierarchical/correction subtraction
+    default_keys[25] = "subtract_launcher" ; default_values[25] =     ""                     # Command prepended to the subtraction executable (e.g. "srun -N 1 -n 1 --exact")
+    default_keys[26] = "subtract_cache"    ; default_values[26] =     None                   # Directory of cached subtraction single points (None to disable)
+    default_keys[27] = "subtract_cache_size"; default_values[27] =    1000                   # Maximum subtraction cache size, in MB
+    default_keys[28] = "subtract_warm_start"; default_values[28] =    False                  # Warm start subtraction SCC cycles from the previous frame?
     
     
         
@@ -615,8 +630,8 @@ def build_amat(my_ALC, **kwargs):
     # 1. Create the GEN_FF directory
     ################################
     
-    helpers.run_bash_cmnd("rm -rf GEN_FF")
-    helpers.run_bash_cmnd("mkdir  GEN_FF")
+    fileops.rm_rf("GEN_FF")
+    fileops.mkdir("GEN_FF")
     
     ################################
     # 2. grab the fm.in and trajlist.in previous iteration, update the contents
@@ -627,16 +642,16 @@ def build_amat(my_ALC, **kwargs):
     nframes_20  = 0    
         
     if (my_ALC == 0) or ((my_ALC == 1) and (not args["do_cluster"])):
-        helpers.run_bash_cmnd("cp " + args["prev_gen_path"] + "/fm_setup.in"   + " GEN_FF/fm_setup.in")
-        helpers.run_bash_cmnd("cp " + args["prev_gen_path"] + "/traj_list.dat" + " GEN_FF/traj_list.dat")
+        fileops.cp(args["prev_gen_path"] + "/fm_setup.in"   + " GEN_FF/fm_setup.in")
+        fileops.cp(args["prev_gen_path"] + "/traj_list.dat" + " GEN_FF/traj_list.dat")
         
         if len(glob.glob(args["prev_gen_path"] + "/*xyzf"  )) > 0:
-            helpers.run_bash_cmnd("cp " + ' '.join(glob.glob(args["prev_gen_path"] + "/*xyzf"  )) + " GEN_FF/")
+            fileops.cp(fileops.matching(args["prev_gen_path"] + "/*xyzf"  ), "GEN_FF/")
         else:
             print("FYI: No .xyzf files to copy from basefiles to GEN_FF")
         
         if (args["do_correction"] and args["correction_temps"]) or (args["do_hierarch"]):
-            helpers.run_bash_cmnd("cp " + ' '.join(glob.glob(args["prev_gen_path"] + "/*temps"  )) + " GEN_FF/")
+            fileops.cp(fileops.matching(args["prev_gen_path"] + "/*temps"  ), "GEN_FF/")
             
         nfiles = int(helpers.head("GEN_FF/traj_list.dat",1)[0])
         
@@ -663,8 +678,8 @@ def build_amat(my_ALC, **kwargs):
                     ofstream.close()    
     else:
 
-        helpers.run_bash_cmnd("cp " + ' '.join(glob.glob(args["prev_gen_path"] + "/*fm_setup.in"  )) + " GEN_FF/fm_setup.in")
-        helpers.run_bash_cmnd("cp " + ' '.join(glob.glob(args["prev_gen_path"] + "/*traj_list.dat")) + " GEN_FF/traj_list.dat")
+        fileops.cp(fileops.matching(args["prev_gen_path"] + "/*fm_setup.in"  ), "GEN_FF/fm_setup.in")
+        fileops.cp(fileops.matching(args["prev_gen_path"] + "/*traj_list.dat"), "GEN_FF/traj_list.dat")
 
         # Get the number of files and number of frames in each file
 
@@ -743,7 +758,7 @@ def build_amat(my_ALC, **kwargs):
         ofstream.close()
         ifstream.close()
                         
-        helpers.run_bash_cmnd("mv tmp GEN_FF/fm_setup.in")                
+        fileops.mv("tmp GEN_FF/fm_setup.in")
 
 
         # Update the traj_list file
@@ -793,7 +808,12 @@ def build_amat(my_ALC, **kwargs):
             method       = "CHIMES",
             trajectories = traj_files,
             temperatures = temper_file,
-            parameters   = args["hierarch_files"])
+            parameters   = args["hierarch_files"],
+            nprocs       = args["subtract_nprocs"],
+            launcher     = args["subtract_launcher"],
+            cache        = args["subtract_cache"],
+            cache_size   = args["subtract_cache_size"],
+            warm_start   = args["subtract_warm_start"])
     
     ################################
     # Correction
@@ -806,7 +826,12 @@ def build_amat(my_ALC, **kwargs):
             method       = args["correction_method"],
             trajectories = traj_files,
             temperatures = temper_file,
-            parameters   = args["correction_files"])
+            parameters   = args["correction_files"],
+            nprocs       = args["subtract_nprocs"],
+            launcher     = args["subtract_launcher"],
+            cache        = args["subtract_cache"],
+            cache_size   = args["subtract_cache_size"],
+            warm_start   = args["subtract_warm_start"])
         
     ################################
     # 3. Set up and submit the .cmd file for the job
@@ -819,7 +844,7 @@ def build_amat(my_ALC, **kwargs):
     
     job_task = "-n " + repr(int(args["job_nodes"])*int(args["job_ppn"])) + " " + args["job_executable"] + " fm_setup.in | tee fm_setup.log"
     
-    if args["job_system"] == "slurm":
+    if args["job_system"] in ["slurm", "pilot"]:
         job_task = "srun "   + job_task
     else:
         job_task = "mpirun " + job_task    
@@ -843,81 +868,27 @@ def build_amat(my_ALC, **kwargs):
     return lsq_jobid_1.split()[0]
     
 
-def solve_amat(my_ALC, **kwargs):  
+def prepare_solve(my_ALC, args):
 
     """ 
     
-    Generates parameters based on generated A- and b-matrices.
+    Generates weights, combines fitting data with the previous ALC's, and builds the fit command.
     
-    Usage: solve_amat(1, <arguments>)
+    Usage: job_task = prepare_solve(1, args)
     
-    Notes: See function definition in helpers.py for a full list of options. 
-           Requrires config.CHIMES_SOLVER.
-           Currently only supports lassolars and svd.
-           Returns a job_id for the submitted job.
-           Assumes last ALC's GEN_FF folder can be accessed from current 
-           ALC's base folder via ../ALC-(n-1)/GEN_FF.
-               
-    WARNING: This driver does NOT support SPLITFI functionality in fm_setup.in file. A-matrix
-             is handled by the driver itself, based on CHIMES_SOLVE_NODES and CHIMES_SOLVE_QUEUE
-             (see split_amat function definition)        
-    
-    WARNING: The DLARS/DLASSO code zero pads for ints of *4 MAXIMUM* digits
-    
-    WARNING: Currently only writtien with DLASSO support, NOT DLARS!
+    Notes: args is solve_amat's full argument dictionary. Expects to be called
+           from the ALC's base folder; returns from GEN_FF. Called by 
+           solve_amat directly, or by the fit job itself when it is chained 
+           onto the build_amat job.
                
     """
 
-    ################################
-    # 0. Set up an argument parser
-    ################################
-    
-    default_keys   = [""]*22
-    default_values = [""]*22
-    
-    # Weights
-    
-    default_keys[20] = "weights_set_alc_0" ; default_values[20] =     False   # Weights to be added to per-atom forces
-    default_keys[21] = "weights_alc_0"     ; default_values[21] =     None    # Weights to be added to per-atom forces for clusters  
-    
-    default_keys[0 ] = "weights_force"     ; default_values[0 ] =     "1.0"   # Weights to be added to per-atom forces
-    default_keys[1 ] = "weights_force_gas" ; default_values[1 ] =     "5.0"   # Weights to be added to per-atom forces for clusters  
-    default_keys[2 ] = "weights_energy"    ; default_values[2 ] =     "0.1"   # Weights to be added to per-frame energies
-    default_keys[3 ] = "weights_energy_gas"; default_values[3 ] =     "0.01"  # Weights to be added to per cluster energies
-    default_keys[4 ] = "weights_stress"    ; default_values[4 ] =     "250.0" # Weights to be added to stress tensor components
-    default_keys[5 ] = "do_cluster"        ; default_values[5 ] =    True     # Should cluser configurations be considered 
-    
-    # LSQ controls
-    
-    default_keys[6 ] = "regression_alg"    ; default_values[6 ] =     "lassolars" # Regression algorithm to be used in lsq2
-    default_keys[7 ] = "regression_var"    ; default_values[7 ] =     "1.0E-4"    # SVD eps or Lasso alpha
-    default_keys[8 ] = "regression_nrm"    ; default_values[8 ] =     "True"      # Normalizes the a-mat by default ... may not give best result
-    default_keys[9 ] = "split_files"       ; default_values[9 ] =     False       # !!! UNUSED
-    
-    # Overall job controls
-    
-    default_keys[10] = "job_name"           ; default_values[10] =     "ALC-"+ repr(my_ALC)+"-lsq-2"        # Name for ChIMES lsq job
-    default_keys[11] = "job_nodes"         ; default_values[11] =     "1"                     # Number of nodes for ChIMES lsq job
-    default_keys[12] = "job_ppn"           ; default_values[12] =     "36"                    # Number of processors per node for ChIMES lsq job
-    default_keys[13] = "job_walltime"      ; default_values[13] =     "1"                     # Walltime in hours for ChIMES lsq job
-    default_keys[14] = "job_queue"         ; default_values[14] =     "pdebug"                # Queue for ChIMES lsq job
-    default_keys[15] = "job_account"       ; default_values[15] =     "pbronze"               # Account for ChIMES lsq job
-    default_keys[16] = "job_executable"    ; default_values[16] =     ""                      # Full path to executable for ChIMES lsq job
-    default_keys[17] = "job_system"        ; default_values[17] =     "slurm"                 # slurm or torque    
-    default_keys[18] = "job_email"         ; default_values[18] =     True                    # Send slurm emails?
-    default_keys[19] = "node_ppn"          ; default_values[19] =     "36"                    # The actual number of procs per node
-    
-    
-
-    args = dict(list(zip(default_keys, default_values)))
-    args.update(kwargs)
-
     ################################
     # 1. Generate weights for the current ALC's trajectory
     ################################
     
     os.chdir("GEN_FF")
-    helpers.run_bash_cmnd("rm -f weights.dat")
+    fileops.rm("weights.dat")
     
     # If the user wants to specify the first ALC's weights, do so. Otherwise, construct them.
     
@@ -925,7 +896,7 @@ def solve_amat(my_ALC, **kwargs):
     
     if (my_ALC == 0) or ((my_ALC == 1) and (not args["do_cluster"])):
         if args["weights_set_alc_0"]:
-            helpers.run_bash_cmnd("cp " + args["weights_alc_0"] + " weights.dat")
+            fileops.cp(args["weights_alc_0"] + " weights.dat")
             user_specified = True
         
     if (not user_specified):
@@ -975,11 +946,11 @@ def solve_amat(my_ALC, **kwargs):
         os.chdir("GEN_FF")
         
         if not os.path.isfile("A_comb.txt"): # for restarted jobs that died at this stage
-            helpers.run_bash_cmnd("mv A.txt         A_comb.txt"        )
-            helpers.run_bash_cmnd("mv b.txt         b_comb.txt"        ) 
-            helpers.run_bash_cmnd("mv b-labeled.txt b-labeled_comb.txt")  
-            helpers.run_bash_cmnd("mv natoms.txt    natoms_comb.txt"   )
-            helpers.run_bash_cmnd("mv weights.dat   weights_comb.dat"  )
+            fileops.mv("A.txt         A_comb.txt")
+            fileops.mv("b.txt         b_comb.txt")
+            fileops.mv("b-labeled.txt b-labeled_comb.txt")
+            fileops.mv("natoms.txt    natoms_comb.txt")
+            fileops.mv("weights.dat   weights_comb.dat")
 
 
     
@@ -988,16 +959,18 @@ def solve_amat(my_ALC, **kwargs):
         # A-files
     
         #prevfile    = "../ALC-" + `my_ALC-1` + "/GEN_FF/A_comb.txt"
+        
+        # The previous ALC's *_comb files are cloned rather than copied where the filesystem allows
     
-        helpers.cat_specific("GEN_FF/A_comb.txt",        ["../ALC-" + repr(my_ALC-1) + "/GEN_FF/A_comb.txt",        "GEN_FF/A.txt"]         )
+        helpers.cat_specific("GEN_FF/A_comb.txt",        ["../ALC-" + repr(my_ALC-1) + "/GEN_FF/A_comb.txt",        "GEN_FF/A.txt"], link_first="reflink")
     
-        helpers.cat_specific("GEN_FF/b_comb.txt",        ["../ALC-" + repr(my_ALC-1) + "/GEN_FF/b_comb.txt",        "GEN_FF/b.txt"]         )
+        helpers.cat_specific("GEN_FF/b_comb.txt",        ["../ALC-" + repr(my_ALC-1) + "/GEN_FF/b_comb.txt",        "GEN_FF/b.txt"], link_first="reflink")
 
-        helpers.cat_specific("GEN_FF/b-labeled_comb.txt",["../ALC-" + repr(my_ALC-1) + "/GEN_FF/b-labeled_comb.txt","GEN_FF/b-labeled.txt"] )
+        helpers.cat_specific("GEN_FF/b-labeled_comb.txt",["../ALC-" + repr(my_ALC-1) + "/GEN_FF/b-labeled_comb.txt","GEN_FF/b-labeled.txt"], link_first="reflink")
         
-        helpers.cat_specific("GEN_FF/natoms_comb.txt",   ["../ALC-" + repr(my_ALC-1) + "/GEN_FF/natoms_comb.txt",   "GEN_FF/natoms.txt"]    )
+        helpers.cat_specific("GEN_FF/natoms_comb.txt",   ["../ALC-" + repr(my_ALC-1) + "/GEN_FF/natoms_comb.txt",   "GEN_FF/natoms.txt"], link_first="reflink")
 
-        helpers.cat_specific("GEN_FF/weights_comb.dat",  ["../ALC-" + repr(my_ALC-1) + "/GEN_FF/weights_comb.dat",  "GEN_FF/weights.dat"]   )
+        helpers.cat_specific("GEN_FF/weights_comb.dat",  ["../ALC-" + repr(my_ALC-1) + "/GEN_FF/weights_comb.dat",  "GEN_FF/weights.dat"], link_first="reflink")
 
         os.chdir("GEN_FF")
 
@@ -1082,10 +1055,108 @@ def solve_amat(my_ALC, **kwargs):
         print("ERROR: unknown regression algorithm: ", args["regression_alg"])
         exit()
     
+    job_task += " | tee params.txt "
+    
+    return job_task
+
+
+def solve_amat(my_ALC, **kwargs):  
 
+    """ 
+    
+    Generates parameters based on generated A- and b-matrices.
+    
+    Usage: solve_amat(1, <arguments>)
+    
+    Notes: See function definition in helpers.py for a full list of options. 
+           Requrires config.CHIMES_SOLVER.
+           Currently only supports lassolars and svd.
+           Returns a job_id for the submitted job.
+           Assumes last ALC's GEN_FF folder can be accessed from current 
+           ALC's base folder via ../ALC-(n-1)/GEN_FF.
+           If job_dependency is set to the build_amat job id, the job can be 
+           submitted before the A-matrix exists; it is held until the build
+           job succeeds, then prepares the fit itself (see prepare_solve).
+               
+    WARNING: This driver does NOT support SPLITFI functionality in fm_setup.in file. A-matrix
+             is handled by the driver itself, based on CHIMES_SOLVE_NODES and CHIMES_SOLVE_QUEUE
+             (see split_amat function definition)        
+    
+    WARNING: The DLARS/DLASSO code zero pads for ints of *4 MAXIMUM* digits
+    
+    WARNING: Currently only writtien with DLASSO support, NOT DLARS!
+               
+    """
+
+    ################################
+    # 0. Set up an argument parser
+    ################################
+    
+    default_keys   = [""]*25
+    default_values = [""]*25
+    
+    # Weights
+    
+    default_keys[20] = "weights_set_alc_0" ; default_values[20] =     False   # Weights to be added to per-atom forces
+    default_keys[21] = "weights_alc_0"     ; default_values[21] =     None    # Weights to be added to per-atom forces for clusters  
+    
+    default_keys[0 ] = "weights_force"     ; default_values[0 ] =     "1.0"   # Weights to be added to per-atom forces
+    default_keys[1 ] = "weights_force_gas" ; default_values[1 ] =     "5.0"   # Weights to be added to per-atom forces for clusters  
+    default_keys[2 ] = "weights_energy"    ; default_values[2 ] =     "0.1"   # Weights to be added to per-frame energies
+    default_keys[3 ] = "weights_energy_gas"; default_values[3 ] =     "0.01"  # Weights to be added to per cluster energies
+    default_keys[4 ] = "weights_stress"    ; default_values[4 ] =     "250.0" # Weights to be added to stress tensor components
+    default_keys[5 ] = "do_cluster"        ; default_values[5 ] =    True     # Should cluser configurations be considered 
+    
+    # LSQ controls
+    
+    default_keys[6 ] = "regression_alg"    ; default_values[6 ] =     "lassolars" # Regression algorithm to be used in lsq2
+    default_keys[7 ] = "regression_var"    ; default_values[7 ] =     "1.0E-4"    # SVD eps or Lasso alpha
+    default_keys[8 ] = "regression_nrm"    ; default_values[8 ] =     "True"      # Normalizes the a-mat by default ... may not give best result
+    default_keys[9 ] = "split_files"       ; default_values[9 ] =     False       # !!! UNUSED
+    
+    # Overall job controls
+    
+    default_keys[10] = "job_name"           ; default_values[10] =     "ALC-"+ repr(my_ALC)+"-lsq-2"        # Name for ChIMES lsq job
+    default_keys[11] = "job_nodes"         ; default_values[11] =     "1"                     # Number of nodes for ChIMES lsq job
+    default_keys[12] = "job_ppn"           ; default_values[12] =     "36"                    # Number of processors per node for ChIMES lsq job
+    default_keys[13] = "job_walltime"      ; default_values[13] =     "1"                     # Walltime in hours for ChIMES lsq job
+    default_keys[14] = "job_queue"         ; default_values[14] =     "pdebug"                # Queue for ChIMES lsq job
+    default_keys[15] = "job_account"       ; default_values[15] =     "pbronze"               # Account for ChIMES lsq job
+    default_keys[16] = "job_executable"    ; default_values[16] =     ""                      # Full path to executable for ChIMES lsq job
+    default_keys[17] = "job_system"        ; default_values[17] =     "slurm"                 # slurm or torque    
+    default_keys[18] = "job_email"         ; default_values[18] =     True                    # Send slurm emails?
+    default_keys[19] = "node_ppn"          ; default_values[19] =     "36"                    # The actual number of procs per node
+    default_keys[22] = "job_dependency"    ; default_values[22] =     ""                      # build_amat job id to chain this job onto
+    default_keys[23] = "local_python"      ; default_values[23] =     "python3"               # Python used to prepare a chained fit
+    default_keys[24] = "driver_dir"        ; default_values[24] =     ""                      # Path to the al_driver code, for chained fits
+    
+    
+
+    args = dict(list(zip(default_keys, default_values)))
+    args.update(kwargs)
+    
+    if args["job_dependency"]:
+    
+        # The A-matrix doesn't exist yet, so have the job prepare the fit once it does
+    
+        ofstream = open("GEN_FF/solve_amat.args",'w')
+        ofstream.write(repr(args) + '\n')
+        ofstream.close()
+        
+        fileops.rm("GEN_FF/solve_amat.sh")
+        
+        os.chdir("GEN_FF")
+        
+        job_task  = "cd .. && "
+        job_task += args["local_python"] + " " + args["driver_dir"] + "/src/gen_ff.py prepare_solve " + repr(my_ALC) + " GEN_FF/solve_amat.args && "
+        job_task += "cd GEN_FF && "
+        job_task += "bash solve_amat.sh"
+        
+    else:
+    
+        job_task = prepare_solve(my_ALC, args)
+        
     # Launch the job
-     
-    job_task += " | tee params.txt "
 
     run_py_jobid = helpers.create_and_launch_job(
         job_name       =     args["job_name"    ] ,
@@ -1097,7 +1168,8 @@ def solve_amat(my_ALC, **kwargs):
         job_account    =     args["job_account" ] ,
         job_executable =     job_task,
         job_system     =     args["job_system"  ] ,
-        job_file       =     "run_lsqpy.cmd")
+        job_file       =     "run_lsqpy.cmd",
+        job_dependency =     args["job_dependency"])
 
     os.chdir("..")
     
@@ -1158,3 +1230,31 @@ def split_weights():
     
     exit()
 
+
+if __name__=='__main__':
+
+    """ 
+    
+    Allows commandline calls to prepare_solve(), for fit jobs chained onto build_amat jobs.
+    
+    Usage: python3 gen_ff.py prepare_solve <ALC> GEN_FF/solve_amat.args
+    
+    Notes: Writes the fit command to GEN_FF/solve_amat.sh.
+              
+    """
+
+    if sys.argv[1] == "prepare_solve":
+    
+        ifstream = open(sys.argv[3],'r')
+        args     = ast.literal_eval(ifstream.read())
+        ifstream.close()
+    
+        job_task = prepare_solve(int(sys.argv[2]), args)
+        
+        ofstream = open("solve_amat.sh",'w')
+        ofstream.write(job_task + '\n')
+        ofstream.close()
+    
+    else:
+        print("ERROR: Unknown option in call to gen_ff.py: ", sys.argv[1])
+        exit()
@@ -3,7 +3,9 @@
 import glob # Warning: glob is unserted... set my_list = sorted(glob.glob(<str>)) if sorting needed
 import os
 import sys
+import time
 import argparse
+import concurrent.futures
 import numpy as np
 import random
 import matplotlib             # This and the next command prevents matplotlib from requiring an x-server (useful when screen is used)
@@ -19,6 +21,7 @@ import math as m
 # Local modules
   
 import helpers
+import fileops
 
 
 def populate_repo(my_ALC):
@@ -32,14 +35,14 @@ def populate_repo(my_ALC):
     """
 
     if not os.path.isdir("../CENTRAL_REPO"):
-        helpers.run_bash_cmnd("mkdir ../CENTRAL_REPO")
+        fileops.mkdir("../CENTRAL_REPO")
         
-    currdir = helpers.run_bash_cmnd("pwd").rstrip()
+    currdir = fileops.pwd().rstrip()
     os.chdir("../ALC-" + repr(my_ALC))
 
     # Create the list of selected species for the current ALC
     
-    helpers.run_bash_cmnd("rm -f ../CENTRAL_REPO/ALC-" + repr(my_ALC) + ".all_selections.xyzlist")
+    fileops.rm("../CENTRAL_REPO/ALC-" + repr(my_ALC) + ".all_selections.xyzlist")
     
     ifstream = open("all.xyzlist.dat",'r')
     all_xyz  = ifstream.readlines()
@@ -68,7 +71,7 @@ def populate_repo(my_ALC):
     
     # Recompile the central repo list of files
 
-    helpers.run_bash_cmnd("rm -f ../CENTRAL_REPO/full_repo.xyzlist")
+    fileops.rm("../CENTRAL_REPO/full_repo.xyzlist")
 
     helpers.cat_specific("../CENTRAL_REPO/full_repo.xyzlist", sorted(glob.glob("../CENTRAL_REPO/*.all_selections.xyzlist")))
 
@@ -95,7 +98,7 @@ def cleanup_repo(my_ALC):
         
     print("Cleaning up the current CENTRAL_REPO...")
     
-    currdir = helpers.run_bash_cmnd("pwd").rstrip()
+    currdir = fileops.pwd().rstrip()
     os.chdir("../CENTRAL_REPO")        
         
     # Get a list of all present 'ALC-X.all_selections.xyzlist' files
@@ -109,7 +112,7 @@ def cleanup_repo(my_ALC):
         
         if int(idx) >= my_ALC:
             
-            helpers.run_bash_cmnd("rm -f " + i)
+            fileops.rm(i)
         
     os.chdir(currdir)
     
@@ -119,60 +122,103 @@ def cleanup_repo(my_ALC):
     print("...done.")
     
 
-def GET_BIN(val,bins):
+def LOAD_ENERGIES(ener_file):
 
     """ 
     
-    Determines a bin number for a given energy. 
+    Reads a list of energies, one per line. 
     
-    Usage: GET_BIN(12.2573,bins)
+    Usage: LOAD_ENERGIES("all.energies_normed")
     
-    Notes: This function is intended for use by gen_subset only.
+    Notes: This function is intended for use by gen_subset only. Values are
+           kept in a hidden binary sidecar (e.g. .all.energies_normed.npz), 
+           which is used instead of parsing the text whenever the file's 
+           size and mtime are unchanged (as for helpers.index_xyzframes).
+           Compressed files are read through helpers.open_file. Always 
+           returns a 1-D array.
     
     """
 
-    for i in range(len(bins)-1):
+    path, name = os.path.split(helpers.resolve_file(ener_file))
     
-        if (val >= bins[i]) and (val < bins[i+1]):
-            return i
-        elif val == bins[i+1]:
-            return i
-            
-    print("PROBLEM: No bin was found for value ", val)
-    print(bins[0])
-    print(bins[len(bins)-1])
-    exit()
+    sidecar = os.path.join(path, "." + name + ".npz")
+    stats   = os.stat(os.path.join(path, name))
+    stamp   = np.array([stats.st_size, stats.st_mtime_ns], dtype=np.int64)
+    
+    if os.path.isfile(sidecar):
+        try:
+            with np.load(sidecar) as cached:
+                if np.array_equal(cached["stamp"], stamp):
+                    return cached["energies"]
+        except (IOError, ValueError, KeyError):
+            pass
             
-def GEN_NORM_HIST(idx_list, ener_list, central_repo_enerlist, minval, maxval, nbins):
+    with helpers.open_file(ener_file) as ifstream:
+        energies = np.loadtxt(ifstream, ndmin=1)
+    
+    # The sidecar is renamed into place, so concurrent readers never see a
+    # partial file; one that can't be written (e.g. a read-only directory) 
+    # is skipped
+    
+    try:
+        with open(sidecar + ".tmp." + str(os.getpid()), "wb") as ofstream:
+            np.savez(ofstream, stamp=stamp, energies=energies)
+        os.replace(sidecar + ".tmp." + str(os.getpid()), sidecar)
+    except (IOError, OSError):
+        pass
+        
+    return energies
+    
+    
+def GET_BINS(vals, bins):
 
     """ 
     
-    Normalizes a histogram.
+    Determines bin numbers for an array of energies. 
     
-    Usage: GEN_NORM_HIST(idx_list, ener_list, central_repo_enerlist, minval, maxval, nbins)
+    Usage: GET_BINS(ENER,bins)
     
-    Notes: This function is intended for use by gen_subset only.
+    Notes: This function is intended for use by gen_subset only. Values on 
+           an interior bin edge are placed in the lower bin, as the former
+           (per-value, linear scan) GET_BIN did. Values outside the bins
+           are given -1.
     
     """
 
-    ener_vals = []
-
-    for i in range(len(idx_list)):
-        ener_vals.append(ener_list[idx_list[i]])
+    vals = np.asarray(vals)
+    
+    idx  = np.digitize(vals, bins, right=True) - 1
     
-    ener_vals += list(central_repo_enerlist)
+    idx[vals == bins[0]] = 0
+    idx[(vals < bins[0]) | (vals > bins[-1]) | np.isnan(vals)] = -1
+    
+    return idx
+    
+    
+def GET_HIST_BINS(vals, bins):
 
-    prob, bins = np.histogram(ener_vals, bins=nbins, range=(minval,maxval), density=False)
+    """ 
+    
+    Determines the bin numpy.histogram counts each energy in. 
+    
+    Usage: GET_HIST_BINS(ENER,bins)
+    
+    Notes: This function is intended for use by gen_subset only. Unlike 
+           GET_BINS, values on an interior bin edge are placed in the upper
+           bin; the last bin includes its upper edge. Values outside the 
+           bins (which numpy.histogram ignores) are given -1.
+    
+    """
 
-    if(float(np.sum(prob)) == 0.0):
-        print("Problem, found a zero sum:")
-        print(prob)
-        print() 
-        exit()
+    vals = np.asarray(vals)
     
-    prob = prob/float(np.sum(prob))
+    idx  = np.digitize(vals, bins) - 1
+    
+    idx[vals == bins[-1]] = len(bins) - 2
+    idx[(vals < bins[0]) | (vals > bins[-1]) | np.isnan(vals)] = -1
+    
+    return idx
 
-    return prob, bins    
         
     
 def SET_CONDITIONS(nsweeps):
@@ -199,6 +245,224 @@ def SET_CONDITIONS(nsweeps):
     return arr
 
 
+def DRAW_MOVES(rng, nsteps, nsele, nrepo):
+
+    """ 
+    
+    Draws the random numbers for one MC sweep.
+    
+    Usage: DRAW_MOVES(rng, nsteps, nsele, nrepo)
+    
+    Notes: This function is intended for use by MC_CHAIN only. Returns 
+           nsteps [SELE index, REPO index, acceptance draw] moves. rng is 
+           either a random.Random, drawn from in the order gen_subset 
+           always has, or a numpy Generator, drawn from in bulk.
+    
+    """
+    
+    if isinstance(rng, random.Random):
+        return [(rng.randint(0,nsele-1), rng.randint(0,nrepo-1), rng.random()) for i in range(nsteps)]
+        
+    return zip(rng.integers(0,nsele,nsteps).tolist(), rng.integers(0,nrepo,nsteps).tolist(), rng.random(nsteps).tolist())
+    
+    
+def MC_CHAIN(rng, POP_MASK, NSELE, ENER_BIN, ENER_HIST_BIN, FIXED_COUNT, NBINS, NHIST, NSWEEPS, CONDITIONS, CONV_TOL, CONV_WIN, MAX_TIME, verbose=False):
+
+    """ 
+    
+    Runs one MC chain of the cluster selection.
+    
+    Usage: SELE, SSQR, SSQR_LIST, SNAPSHOTS, SWEEPS, STOP_REASON, ELAPSED = MC_CHAIN(rng, <gen_subset data>)
+    
+    Notes: This function is intended for use by gen_subset only, which 
+           sets up its arguments. Selects NSELE energies not in POP_MASK 
+           at random, then sweeps as described in gen_subset. Returns the
+           selected ENER indices, the final SSQR, the SSQR after each sweep,
+           the [label, histogram] of the selection at sweeps to plot, the
+           number of sweeps run, why the chain stopped, and its run time.
+           Progress is only printed if verbose.
+    
+    """
+    
+    START_TIME = time.time()
+    
+    # Step 1: Select NSELECT-NPOPPED random energies only from SELE elemnts from ENER! (repetition not allowed)
+    
+    POP_MASK = POP_MASK.copy()
+    REPO     = np.flatnonzero(~POP_MASK)
+    
+    if isinstance(rng, random.Random):
+        SELE = rng.sample(REPO.tolist(), NSELE)     # random sample returns *VALUES* of REPO to SELE... so SELE[i] = energy list index
+    else:
+        SELE = rng.choice(REPO, NSELE, replace=False)
+        
+    SELE = np.array(SELE, dtype=int)
+
+    # Remove the values stored in SELE from REPO
+
+    POP_MASK[SELE] = True
+    
+    REPO = np.flatnonzero(~POP_MASK)
+        
+    # Determine the number of elements in SELE arising from ENER, and in REPO arising from ENER
+    
+    N_ENER_SELE = len(SELE)
+    N_ENER_REPO = len(REPO)
+    
+    # The selection's histogram is kept as integer counts, updated only 
+    # when a move is accepted. Moves swap one selected energy for another,
+    # so the total count never changes.
+    
+    HIST_BINS  = ENER_HIST_BIN[SELE]
+    
+    SELE_COUNT = (FIXED_COUNT + np.bincount(HIST_BINS[HIST_BINS >= 0], minlength=NBINS)).tolist()
+    SELE_TOTAL = float(sum(SELE_COUNT))
+    
+    if SELE_TOTAL == 0.0:
+        print("Problem, found a zero sum:")
+        print(SELE_COUNT)
+        print() 
+        exit()
+        
+    ENER_BIN      = ENER_BIN     .tolist()
+    ENER_HIST_BIN = ENER_HIST_BIN.tolist()
+    
+    # Sum of squared residuals from a flat histogram, in integer units of 
+    # 1/(NBINS*SELE_TOTAL)**2, kept up to date with SELE_COUNT
+    
+    SSQR_SUM = 0
+    
+    for i in range(NBINS):
+        SSQR_SUM += (int(SELE_TOTAL) - NBINS*SELE_COUNT[i])**2
+    
+    ########################
+    # Do a MC sweep to update selections
+    ########################
+    #
+    # Our scheme: accept if P_OLD - P_NEW > rand(0,1)
+    # This will bias toward new configurations that were 
+    # lower in probability, and should flatten our hist
+    
+    # The pools are swept as lists, which are faster than numpy arrays to 
+    # index one element at a time, with the same O(1) updates. There are
+    # no moves to make once every energy is selected.
+
+    SELE = SELE.tolist()
+    REPO = REPO.tolist()
+    
+    NSTEPS = N_ENER_SELE
+    
+    if N_ENER_REPO == 0:
+        NSTEPS = 0
+
+    SSQR_LIST = []
+    SSQR_CUM  = [0.0] # SSQR_CUM[k] is the sum of the first k SSQR_LIST entries
+    SSQR      = "not yet calculated"
+    SNAPSHOTS = []
+    SWEEPS    = 0
+    
+    STOP_REASON = "completed all sweeps"
+    
+    for sweep in range(NSWEEPS):
+
+        if verbose and (sweep in CONDITIONS): #if ((NSWEEPS/5>0) and (sweep+1)%(NSWEEPS/5)==0):
+            print("Running MC sweep " + repr(sweep) + " of " + repr(NSWEEPS) + " ... SSQR: " +  repr(SSQR)) 
+        
+        NONE_ACC = True
+
+        # Select an existing and new energy (OLD and NEW = index)
+        
+        for OLD, NEW, RAND in DRAW_MOVES(rng, NSTEPS, N_ENER_SELE, N_ENER_REPO):
+        
+            # Apply the acceptance criteria
+
+            P_OLD = SELE_COUNT[ENER_BIN[SELE[OLD]]]/SELE_TOTAL
+            P_NEW = SELE_COUNT[ENER_BIN[REPO[NEW]]]/SELE_TOTAL
+                    
+            CRIT  = 0.5*(P_NEW-P_OLD) + 1.0
+            #CRIT  = (P_NEW-P_OLD) #  + 1.0    
+            #CRIT = 1.0 + (P_OLD - P_NEW)*0.5
+        
+            if ( CRIT > RAND): # This is a high prob cfg... we want to bias against it
+                continue
+
+            NONE_ACC = False
+                
+            # We've accepted the move... update the selected and stored respositories and the histogram
+
+            # Each value is removed from its pool by moving the pool's last 
+            # element into its place, and the incoming value takes the last slot
+
+            SELE_VAL = SELE[OLD]
+            REPO_VAL = REPO[NEW]
+        
+            SELE[OLD] = SELE[N_ENER_SELE-1]; SELE[N_ENER_SELE-1] = REPO_VAL
+            REPO[NEW] = REPO[N_ENER_REPO-1]; REPO[N_ENER_REPO-1] = SELE_VAL
+            
+            BIN_OUT = ENER_HIST_BIN[SELE_VAL]
+            BIN_IN  = ENER_HIST_BIN[REPO_VAL]
+            
+            if BIN_OUT != BIN_IN:
+            
+                SSQR_SUM -= (int(SELE_TOTAL) - NBINS*SELE_COUNT[BIN_OUT])**2 + (int(SELE_TOTAL) - NBINS*SELE_COUNT[BIN_IN])**2
+            
+                SELE_COUNT[BIN_OUT] -= 1
+                SELE_COUNT[BIN_IN ] += 1
+                
+                SSQR_SUM += (int(SELE_TOTAL) - NBINS*SELE_COUNT[BIN_OUT])**2 + (int(SELE_TOTAL) - NBINS*SELE_COUNT[BIN_IN])**2
+            
+        SWEEPS = sweep + 1
+            
+        # Compute sum of squared residuals (our "equilibration" criteria)    
+            
+        if NONE_ACC:
+            if len(SSQR_LIST) == 0:
+                SSQR_LIST.append(-1)
+                
+            SSQR = SSQR_LIST[len(SSQR_LIST)-1]
+            SSQR_LIST.append(SSQR)
+        else:
+            SSQR = m.sqrt( SSQR_SUM / (NBINS*SELE_TOTAL)**2 / NHIST) 
+        
+            SSQR_LIST.append(SSQR)    
+            
+        while len(SSQR_CUM) <= len(SSQR_LIST):
+            SSQR_CUM.append(SSQR_CUM[-1] + SSQR_LIST[len(SSQR_CUM)-1])
+            
+        # Stop early once SSQR has leveled off: the mean over the newer half
+        # of the last CONV_WIN entries differs from that over the older half
+        # by less than CONV_TOL, relative to the latter. Windows reaching 
+        # back to before the first accepted move (SSQR = -1) are skipped.
+        
+        if (CONV_TOL is not None) and (len(SSQR_LIST) >= CONV_WIN) and (SSQR_LIST[-CONV_WIN] > 0):
+        
+            HALF    = CONV_WIN//2
+            NOW     = len(SSQR_LIST)
+            OLD_AVG = (SSQR_CUM[NOW-HALF] - SSQR_CUM[NOW-CONV_WIN])/(CONV_WIN-HALF)
+            NEW_AVG = (SSQR_CUM[NOW]      - SSQR_CUM[NOW-HALF]    )/HALF
+            TREND   = abs(NEW_AVG - OLD_AVG)/OLD_AVG
+            
+            if TREND < CONV_TOL:
+                STOP_REASON = "SSQR converged (relative change " + repr(TREND) + " over " + repr(CONV_WIN) + " sweeps < " + repr(CONV_TOL) + ")"
+                
+        if (MAX_TIME is not None) and (time.time() - START_TIME >= MAX_TIME):
+            STOP_REASON = "wall time budget of " + repr(MAX_TIME) + " s reached"
+            
+        STOPPED = (STOP_REASON != "completed all sweeps")
+        
+        # Save current selection results for plotting
+
+        if (sweep in CONDITIONS) or STOPPED: # if ((NSWEEPS/5>0) and (sweep+1)%(NSWEEPS/5)==0):
+            SNAPSHOTS.append(["sweep " + repr(sweep+1), np.array(SELE_COUNT)/SELE_TOTAL])
+            
+        if STOPPED:
+            break
+            
+    SSQR = m.sqrt( SSQR_SUM / (NBINS*SELE_TOTAL)**2 / NHIST) 
+            
+    return SELE, SSQR, SSQR_LIST, SNAPSHOTS, SWEEPS, STOP_REASON, time.time() - START_TIME
+    
+    
 def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELECTIONS $SWEEPS 0 # Last 2 args: # to select, # sweeps, (optional:) E-cutoff
 
     """ 
@@ -219,8 +483,8 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
     # 0. Set up an argument parser
     ################################    
     
-    default_keys   = [""]*7
-    default_values = [""]*7        
+    default_keys   = [""]*11
+    default_values = [""]*11        
     
     # Cluster specific controls
     
@@ -231,6 +495,10 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
     default_keys[4 ] = "ecut"     ; default_values[4 ] = '1.0E10'                  # Maximum energy to consider     
     default_keys[5 ] = "repo"     ; default_values[5 ] = ''                        # Location of central repo energies
     default_keys[6 ] = "seed"     ; default_values[6 ] = 1                         # Seed for random number generator
+    default_keys[7 ] = "conv_tol" ; default_values[7 ] = None                      # Stop once SSQR changes by less than this (relative) over conv_win sweeps; None to disable
+    default_keys[8 ] = "conv_win" ; default_values[8 ] = 1000                      # Sliding window, in sweeps, for the SSQR convergence test
+    default_keys[9 ] = "max_time" ; default_values[9 ] = None                      # Wall time budget for the MC sweeps, in seconds; None for no limit
+    default_keys[10] = "nchains"  ; default_values[10] = 1                         # Number of independent MC chains to run in parallel; the best is kept
 
         
     args = dict(list(zip(default_keys, default_values)))
@@ -242,6 +510,19 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
     NBINS   =   int(args["nbins"   ]) 
     ECUTOFF = float(args["ecut"    ])
     REPENER =       args["repo"    ]    
+    CONV_TOL =      args["conv_tol"]
+    CONV_WIN =  int(args["conv_win"])
+    MAX_TIME =      args["max_time"]
+    NCHAINS =   int(args["nchains" ])
+    SEED    =       args["seed"    ]
+    
+    if CONV_WIN < 2:
+        print("ERROR: conv_win must be at least 2 sweeps")
+        exit()
+        
+    if NCHAINS < 1:
+        print("ERROR: nchains must be at least 1")
+        exit()
     
     print("Parsed arguments: ")
     print("energies: ",ENER)   
@@ -250,6 +531,10 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
     print("nbins:    ",NBINS)
     print("ecut:     ",ECUTOFF)
     print("repo:     ",REPENER)    
+    print("conv_tol: ",CONV_TOL)
+    print("conv_win: ",CONV_WIN)
+    print("max_time: ",MAX_TIME)
+    print("nchains:  ",NCHAINS)
     
 
     ################################
@@ -258,7 +543,7 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
 
     # Energies to select from:
     
-    ENER    = np.loadtxt(ENER)
+    ENER    = LOAD_ENERGIES(ENER)
 
     if NSELECT > ENER.shape[0]:
         print("ERROR: NSELECT is larger than the number of available energies: ")
@@ -266,7 +551,10 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
         print("NENERGIES: ", ENER.shape[0])
         exit()
         
-    # Find the max and min energy values
+    # Find the max and min energy values, ignoring those past the cutoff. 
+    # Values start from the first energy, and are only replaced by strictly 
+    # larger (smaller) values, so ties go to the lowest index, and NaNs are 
+    # never picked (unless first)
     
     MAX_VAL = ENER[0]
     MIN_VAL = ENER[0]
@@ -276,24 +564,26 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
     
     MAX_IDX = 0
     MIN_IDX = 0
-
-    PAST_CUT_VAL = []
-    PAST_CUT_IDX = []
-
-    for i in range(len(ENER)):
     
-        if abs(ENER[i]) >= ECUTOFF:
-            PAST_CUT_VAL.append(ENER[i])
-            PAST_CUT_IDX.append(i)    
-        else:    
-
-            if MAX_VAL < ENER[i]:
-                MAX_VAL = ENER[i]
-                MAX_IDX = i
+    PAST_CUT_MASK = np.abs(ENER) >= ECUTOFF
+    PAST_CUT_VAL  = ENER[PAST_CUT_MASK]
+    PAST_CUT_IDX  = np.flatnonzero(PAST_CUT_MASK)
+    
+    IN_CUT_IDX    = np.flatnonzero(~PAST_CUT_MASK & ~np.isnan(ENER))
+    
+    if len(IN_CUT_IDX) > 0:
+    
+        i = int(IN_CUT_IDX[np.argmax(ENER[IN_CUT_IDX])])
+    
+        if MAX_VAL < ENER[i]:
+            MAX_VAL = ENER[i]
+            MAX_IDX = i
+            
+        i = int(IN_CUT_IDX[np.argmin(ENER[IN_CUT_IDX])])
 
-            if MIN_VAL > ENER[i]:
-                MIN_VAL = ENER[i]
-                MIN_IDX = i
+        if MIN_VAL > ENER[i]:
+            MIN_VAL = ENER[i]
+            MIN_IDX = i
             
     
     # Central repository energies
@@ -303,43 +593,34 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
     
     if REPENER != '':
     
-        REPENER = np.loadtxt(REPENER)    
+        REPENER = LOAD_ENERGIES(REPENER)    
         
-        REPO_POP_LIST = []
+        # Ignore repo energies past the cutoff, or outside the range of ENER
         
-        for i in range(len(REPENER)):
-            if abs(REPENER[i]) >= ECUTOFF:
-                print("WARNING: Repo energy is outside ECUTOFF!")
-                REPO_POP_LIST.append(i)
-                
-            if REPENER[i] > MAX_VAL and (i not in REPO_POP_LIST): # modified because i might repeat
-                #print "WARNING: Found central repo energy larger than current iteration\'s ... ignoring."
-                IGNORE_REPO_GTMAX += 1
-                REPO_POP_LIST.append(i)
-            elif REPENER[i] < MIN_VAL and (i not in REPO_POP_LIST): # modified
-                #print "WARNING: Found central repo energy smaller than current iteration\'s ... ignoring."
-                IGNORE_REPO_LTMIN += 1
-                REPO_POP_LIST.append(i)
+        REPO_CUT_MASK = np.abs(REPENER) >= ECUTOFF
+        REPO_GT_MASK  = (REPENER > MAX_VAL) & ~REPO_CUT_MASK
+        REPO_LT_MASK  = (REPENER < MIN_VAL) & ~REPO_CUT_MASK & ~REPO_GT_MASK
+        
+        if np.any(REPO_CUT_MASK):
+            print("WARNING: " + repr(int(np.sum(REPO_CUT_MASK))) + " repo energies are outside ECUTOFF!")
+        
+        IGNORE_REPO_GTMAX = int(np.sum(REPO_GT_MASK))
+        IGNORE_REPO_LTMIN = int(np.sum(REPO_LT_MASK))
                 
-        if len(    REPO_POP_LIST ) >  0:
+        REPENER = REPENER[~(REPO_CUT_MASK | REPO_GT_MASK | REPO_LT_MASK)]
         
-            TMP = list(REPENER)
-            
-            REPO_POP_LIST.sort(reverse=True)
-            
-            for i in range(len(REPO_POP_LIST)):
-            
-                TMP.pop(REPO_POP_LIST[i])
-            
-            REPENER = np.array(TMP)
-            
+        IN_CUT_IDX = np.flatnonzero(~np.isnan(REPENER))
         
-        for i in range(len(REPENER)):
+        if len(IN_CUT_IDX) > 0:
+        
+            i = int(IN_CUT_IDX[np.argmax(REPENER[IN_CUT_IDX])])
 
             if MAX_VAL < REPENER[i]:
                 MAX_VAL = REPENER[i]
                 MAX_IDX = i
                 MAX_FROM_MAIN = False
+                
+            i = int(IN_CUT_IDX[np.argmin(REPENER[IN_CUT_IDX])])
 
             if MIN_VAL > REPENER[i]:
                 MIN_VAL = REPENER[i]
@@ -394,8 +675,6 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
     # Generate the initial sub-selection
     ########################
     
-    random.seed(args["seed"])
-    
     # Step 0: Combine the new (ENER) and old (REPENER) energies into REPO. If
     #         min/max are from ENER, remove (pop off) the from REPO b/c they 
     #         will always be in the selected subset then we can always pick from 
@@ -405,224 +684,117 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
     
     #COMBINED_ENERS = np.concatenate((ENER, REPENER)) # ENER + REPENER # First len(ENER) entries are ALWAYS from ENER    
     
-    REPO = list(range(NENER))
-
+    # The SELE and REPO pools hold ENER indices in preallocated numpy arrays;
+    # POP_MASK marks indices that are in neither pool (above the cutoff, or
+    # a min/max), or that have been moved out of REPO into SELE
+    
     NPOPPED = 0
     NCUTOFF = 0
     
-    POP_LIST = list(PAST_CUT_IDX)
+    POP_MASK = np.zeros(NENER, dtype=bool)
+    
+    POP_MASK[PAST_CUT_IDX] = True
 
     NCUTOFF = len(PAST_CUT_IDX)
     
-    if MAX_FROM_MAIN and (MAX_IDX not in POP_LIST): # modified
-        POP_LIST.append(MAX_IDX)
+    if MAX_FROM_MAIN and (not POP_MASK[MAX_IDX]): # modified
+        POP_MASK[MAX_IDX] = True
         NPOPPED += 1
 
-    if MIN_FROM_MAIN and (MIN_IDX not in POP_LIST): # modified
-        POP_LIST.append(MIN_IDX)
+    if MIN_FROM_MAIN and (not POP_MASK[MIN_IDX]): # modified
+        POP_MASK[MIN_IDX] = True
         NPOPPED += 1
         
-    POP_LIST.sort(reverse=True)
-    
-    for i in range(len(POP_LIST)):
-        REPO.pop(REPO.index(POP_LIST[i]))
+    REPO = np.flatnonzero(~POP_MASK)
     
     print("Values above energy cutoff: ", NCUTOFF)
-        
-    # Step 1: Select NSELECT-NPOPPED random energies only from SELE elemnts from ENER! (repetition not allowed)
     
-    #print "Selecting random values on: ",0, NENER-NPOPPED
-    #print "Selecting nvalues:          ",NSELECT-NPOPPED
+    # Set up conditions for printing current histogram
     
+    CONDITIONS = SET_CONDITIONS(NSWEEPS)
 
-    SELE = random.sample(REPO[0:(NENER-NPOPPED-NCUTOFF)],NSELECT-NPOPPED)     # random sample returns *VALUES* of REPO to SELE... so SELE[i] = energy list index
-
-    # Need to figure out the corresponding REPO index for the values stored in SELE, before popping them off
+    # Generate the probability histogram for the MC run... histogram is over selected new energies (ENER) and all old energies (REPENER)
+    #
+    # Bin numbers are found once for every energy: ENER_BIN for looking up
+    # acceptance probabilities, and ENER_HIST_BIN for counting, as 
+    # numpy.histogram would. The min/max and central repository energies 
+    # are always counted, so their counts (FIXED_COUNT) are found here, 
+    # and each chain adds those of its selection.
+    
+    MINMAX = []
 
-    for i in range(len(SELE)):
-        REPO.pop(REPO.index(SELE[i]))
-        
-    # Determine the number of elements in SELE arising from ENER, and in REPO arising from ENER
+    if MIN_FROM_MAIN:
+        MINMAX += [MIN_IDX]
+    if MAX_FROM_MAIN:
+        MINMAX += [MAX_IDX]
     
-    N_ENER_SELE = len(SELE)
-    N_ENER_REPO = NENER - NPOPPED - N_ENER_SELE - NCUTOFF
+    SELE_BINS = np.histogram_bin_edges(ENER, bins=NBINS, range=(MIN_VAL,MAX_VAL))
+    
+    ENER_BIN      = GET_BINS     (ENER,    SELE_BINS)
+    ENER_HIST_BIN = GET_HIST_BINS(ENER,    SELE_BINS)
+    REPO_HIST_BIN = GET_HIST_BINS(REPENER, SELE_BINS)
     
+    NO_BIN = REPO[ENER_BIN[REPO] < 0]
     
+    if len(NO_BIN) > 0:
+        print("PROBLEM: No bin was found for value ", ENER[NO_BIN[0]])
+        print(SELE_BINS[0])
+        print(SELE_BINS[len(SELE_BINS)-1])
+        exit()
+            
+    FIXED_BINS  = np.concatenate((ENER_HIST_BIN[MINMAX], REPO_HIST_BIN)).astype(int)
+    FIXED_COUNT = np.bincount(FIXED_BINS[FIXED_BINS >= 0], minlength=NBINS)
+    
+    NHIST = NSELECT - NPOPPED + len(MINMAX)
+
+    if NSELECT == ENER.shape[0]:
+        NSWEEPS = 1
+        
     ########################
-    # Do a MC sweep to update selections
+    # Run the MC chain(s)
     ########################
-    #
-    # Our scheme: accept if P_OLD - P_NEW > rand(0,1)
-    # This will bias toward new configurations that were 
-    # lower in probability, and should flatten our hist
     
+    # A single chain uses Python's random module seeded with SEED, as 
+    # always. With more, each chain gets its own numpy Generator, spawned 
+    # from SEED, and runs in its own process; the chain with the lowest
+    # final SSQR (the first, on ties) is kept, so the selection only 
+    # depends on SEED and NCHAINS.
     
-    # Set up conditions for printing current histogram
+    CHAIN_ARGS = [POP_MASK, NSELECT-NPOPPED, ENER_BIN, ENER_HIST_BIN, FIXED_COUNT, NBINS, NHIST, NSWEEPS, CONDITIONS, CONV_TOL, CONV_WIN, MAX_TIME]
     
-    CONDITIONS = SET_CONDITIONS(NSWEEPS)
-
-    # Generate the probability histogram for the MC run... histogram is over selected new energies (ENER) and all old energies (REPENER)
-
-    HIST_SELE = SELE[:]
-
-    if MIN_FROM_MAIN:
-        HIST_SELE += [MIN_IDX]
-    if MAX_FROM_MAIN:
-        HIST_SELE += [MAX_IDX]
+    if NCHAINS == 1:
+    
+        RESULTS = [MC_CHAIN(random.Random(SEED), *CHAIN_ARGS, verbose=True)]
         
-    REMAINING =  REPO[N_ENER_REPO:] # These are values from the central repository
+    else:
+    
+        STREAMS = [np.random.default_rng(i) for i in np.random.SeedSequence(SEED).spawn(NCHAINS)]
         
-    HIST_SELE += REMAINING
-
-    SELE_PROB, SELE_BINS = GEN_NORM_HIST(HIST_SELE, ENER, REPENER, MIN_VAL, MAX_VAL, NBINS)
-
-    # Do MC sweeps
-
-    HIST_SELE = []
-    SSQR_LIST = []
-    SSQR      = "not yet calculated"
-
-    if NSELECT == ENER.shape[0]:
-        NSWEEPS = 1
-        HIST_SELE = SELE[:]
+        print("Running", NCHAINS, "MC chains on", min(NCHAINS, os.cpu_count() or 1), "processes")
         
-        if MIN_FROM_MAIN:
-            HIST_SELE += [MIN_IDX]
-        if MAX_FROM_MAIN:
-            HIST_SELE += [MAX_IDX]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(NCHAINS, os.cpu_count() or 1)) as pool:
+            RESULTS = [future.result() for future in [pool.submit(MC_CHAIN, i, *CHAIN_ARGS) for i in STREAMS]]
             
-        HIST_SELE += REMAINING
-
-        SELE_PROB, SELE_BINS = GEN_NORM_HIST(HIST_SELE, ENER, REPENER, MIN_VAL, MAX_VAL)
-
+    BEST = 0
     
-    for sweep in range(NSWEEPS):
-
-        if sweep in CONDITIONS: #if ((NSWEEPS/5>0) and (sweep+1)%(NSWEEPS/5)==0):
-            print("Running MC sweep " + repr(sweep) + " of " + repr(NSWEEPS) + " ... SSQR: " +  repr(SSQR)) 
+    for i in range(NCHAINS):
+    
+        SELE, SSQR, SSQR_LIST, SNAPSHOTS, SWEEPS, STOP_REASON, ELAPSED = RESULTS[i]
         
-        NONE_ACC = True
-
-        for i in range(NSELECT-NPOPPED):
+        TAG = ""
         
-            # print "    Running MC step " + `i` + " of " + `NSELECT-2`
-
-            if NSELECT < ENER.shape[0]:        
-
-                # Select an existing and new energy (OLD and NEW = index)
-
-                
-                OLD = random.randint(0,N_ENER_SELE-1) # provides a SELE index           # One from the current subset
-                NEW = random.randint(0,N_ENER_REPO-1) # Provides a REPO index           # One from the possible repo of configs
-
-
-                if (OLD >len(ENER)) or (NEW >len(ENER)):
-                    print("++++")                
-                    print("ERROR: ", OLD, NEW)
-                    
-                    print(len(ENER))
-                    ENER.sort(reverse=True)
-                    print(ENER[0])
-                    print("++++")
-                    
-                    exit()
-
-                # Apply the acceptance criteria
-
-                P_OLD = SELE_PROB[GET_BIN(ENER[SELE[OLD]],SELE_BINS)]
-                P_NEW = SELE_PROB[GET_BIN(ENER[REPO[NEW]],SELE_BINS)]
-                        
-                
-                RAND  = random.random()
-                CRIT  = 0.5*(P_NEW-P_OLD) + 1.0
-                #CRIT  = (P_NEW-P_OLD) #  + 1.0    
-                #CRIT = 1.0 + (P_OLD - P_NEW)*0.5
-                
-                if False:            
-                
-                    print("")
-                    print("           old:  ", P_OLD)
-                    print("           new:  ", P_NEW)
-                    print("           rand: ", RAND)
-                    print("           crit: ", CRIT)
-            
-                if ( CRIT > RAND): # This is a high prob cfg... we want to bias against it
-                    continue
-    
-                NONE_ACC = False
-                    
-                # We've accepted the move... update the selected and stored respositories and re-compute the probabilities
-
-                SELE_VAL = SELE.pop(OLD)
-                REPO_VAL = REPO.pop(NEW) # .pop returns REPO[NEW], and removes element [NEW] from REPO
+        if NCHAINS > 1:
+            TAG = "Chain " + repr(i) + ": "
             
-                SELE.append(REPO_VAL)
-                REPO.append(SELE_VAL)
-
-            
-            
-            if any( x>len(ENER) for x in SELE):
-                
-                SELE.sort(reverse=True)
-            
-                print("Warning: Selected value too large: ")
-                print(len(SELE))
-                print(SELE[0])
-                print(len(ENER))
-                print(ENER)            
-                exit()
-            
-            
-            HIST_SELE = SELE[:]
-            
-            if MIN_FROM_MAIN:
-                HIST_SELE += [MIN_IDX]
-            if MAX_FROM_MAIN:
-                HIST_SELE += [MAX_IDX]
-                
-            HIST_SELE += REMAINING
-
-            SELE_PROB, SELE_BINS = GEN_NORM_HIST(HIST_SELE, ENER, REPENER, MIN_VAL, MAX_VAL, NBINS)
-            
-
-            if NSELECT == ENER.shape[0]:
-                break
-            
-            
-        # Compute sum of squared residuals (our "equilibration" criteria)    
+        print(TAG + "MC selection stopped after " + repr(SWEEPS) + " of " + repr(NSWEEPS) + " sweeps (" + "%.1f" % ELAPSED + " s): " + STOP_REASON + "; final SSQR: " + repr(SSQR))
+        
+        if SSQR < RESULTS[BEST][1]:
+            BEST = i
             
-        if NONE_ACC:
-            if len(SSQR_LIST) == 0:
-                SSQR_LIST.append(-1)
-                
-            SSQR = SSQR_LIST[len(SSQR_LIST)-1]
-            SSQR_LIST.append(SSQR)
-        else:
-            TARGET = 1/float(NBINS) # 1/nbins
-            SSQR   = 0.0
+    if NCHAINS > 1:
+        print("Keeping chain " + repr(BEST) + " of " + repr(NCHAINS))
             
-            for i in range(len(SELE_PROB)):
-        
-                #SSQR += (TARGET - ENER[HIST_SELE[i]])**2.0
-                SSQR += (TARGET - SELE_PROB[i])**2.0
-                
-            try: 
-                SSQR = m.sqrt( SSQR / len(HIST_SELE)) 
-            except: 
-                print(SELE)
-                print(HIST_SELE)
-        
-            SSQR_LIST.append(SSQR)    
-        
-        
-        # Plot current selection results 
-
-        SELE_MID = (SELE_BINS[:-1] + SELE_BINS[1:]) / 2.0
-        LABEL    = "sweep " + repr(sweep+1)
-
-        if sweep in CONDITIONS: # if ((NSWEEPS/5>0) and (sweep+1)%(NSWEEPS/5)==0):
-            plt.plot(SELE_MID, SELE_PROB, marker='x', label=LABEL)
-
+    SELE, SSQR, SSQR_LIST, SNAPSHOTS, SWEEPS, STOP_REASON, ELAPSED = RESULTS[BEST]
     
     TMP_SELE = SELE[:]
 
@@ -640,6 +812,10 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
 
     # Plot results
 
+    SELE_MID = (SELE_BINS[:-1] + SELE_BINS[1:]) / 2.0
+    
+    for LABEL, SELE_PROB in SNAPSHOTS:
+        plt.plot(SELE_MID, SELE_PROB, marker='x', label=LABEL)
 
     #plt.legend(loc='upper left')
     plt.legend_ = None
@@ -655,7 +831,7 @@ def gen_subset(**kwargs): # time python gen_subset.py  all.energies_normed $SELE
     plt.cla
     plt.close()    
 
-    helpers.run_bash_cmnd("mv selection.dat all.selection.dat")
+    fileops.mv("selection.dat all.selection.dat")
 
 
 
@@ -8,9 +8,169 @@ import sys
 import math
 import sys
 import os
+import shutil
+import collections
+import threading
+import concurrent.futures
+
+# Local modules
+
+import local_jobs
 
 """ Small helper functions and utilities general to the ALC process. """
 
+# Number of shell commands spawned by run_bash_cmnd(_presplit), and total time spent in them
+
+BASH_CMND_STATS = [0, 0.0]
+
+# Per-command records: [stage, command, wall time (s), exit status, bytes of output]
+# Stage is None until the record is assigned to a stage (see close_cmnd_stage)
+
+BASH_CMND_LOG  = []
+BASH_CMND_LOCK = threading.Lock()
+
+COMPRESSION_EXTENSIONS = [".gz", ".xz", ".zst"]
+
+# Format version of .xyz(f) frame index sidecars (see index_xyzframes); bump
+# whenever the rules for which frames are indexed change, so stale indexes
+# are rebuilt. Version 2: a final atom line without a trailing newline
+# completes its frame. Version 3: indexes end with an "end <nframes>" line
+
+XYZ_INDEX_VERSION = 3
+
+def compression_type(infile):
+
+    """ 
+    
+    Returns the compression extension of a file (".gz", ".xz", or ".zst"), or None
+    
+    Usage: compression_type("OUTCAR.xyzf.gz") # Returns ".gz"
+    
+    """
+    
+    for ext in COMPRESSION_EXTENSIONS:
+        if infile.endswith(ext):
+            return ext
+            
+    return None
+    
+def strip_compression(infile):
+
+    """ 
+    
+    Returns a filename without its compression extension, if any
+    
+    Usage: strip_compression("traj.gen.xz") # Returns "traj.gen"
+    
+    """
+    
+    ext = compression_type(infile)
+    
+    if ext is None:
+        return infile
+        
+    return infile[:-len(ext)]
+    
+def resolve_file(infile):
+
+    """ 
+    
+    Finds the file to read for a given filename, allowing for compression
+    
+    Usage: resolve_file("OUTCAR.xyzf") # Returns "OUTCAR.xyzf.gz" if only it exists
+    
+    Notes: Returns infile if it exists, otherwise the first existing compressed 
+           variant (infile + ".gz", ".xz", ".zst"). If none exist, returns infile
+           so that the caller's open fails with the expected error.
+    
+    """
+    
+    if os.path.exists(infile):
+        return infile
+        
+    for ext in COMPRESSION_EXTENSIONS:
+        if os.path.exists(infile + ext):
+            return infile + ext
+            
+    return infile
+    
+def open_file(infile, mode='r'):
+
+    """ 
+    
+    Opens a file for reading or writing, (de)compressing based on its extension
+    
+    Usage: open_file("traj.gen.gz") or open_file("OUTCAR.xyzf","rb")
+    
+    Notes: Supports gzip (.gz), xz (.xz), and zstandard (.zst). Zstandard requires 
+           python 3.14+ or the zstandard package. When reading, the file is first
+           resolved with resolve_file, so a file that has since been compressed
+           by the driver (see COMPRESS_OUTPUTS) can still be read by its 
+           original name. Text mode is the default, as with open.
+    
+    """
+    
+    if 'r' in mode:
+        infile = resolve_file(infile)
+    
+    ext = compression_type(infile)
+    
+    if ext is None:
+        return open(infile, mode)
+        
+    if 'b' not in mode:
+        mode += 't'
+        
+    if ext == ".gz":
+        import gzip
+        return gzip.open(infile, mode)
+        
+    if ext == ".xz":
+        import lzma
+        return lzma.open(infile, mode)
+        
+    try:
+        from compression import zstd
+    except ImportError:
+        try:
+            import zstandard as zstd
+        except ImportError:
+            print("ERROR: Reading/writing .zst files requires python 3.14+ or the zstandard package")
+            print("       File: ", infile)
+            exit()
+            
+    return zstd.open(infile, mode)
+    
+def compress_file(infile, ext=".gz"):
+
+    """ 
+    
+    Compresses a file, replacing it with infile + ext
+    
+    Usage: compress_file("traj.gen") or compress_file("traj.gen", ".xz")
+    
+    Notes: Streams the data, so the file is never held in memory. Does nothing if 
+           infile doesn't exist (e.g. it has already been compressed).
+    
+    """
+    
+    if not os.path.isfile(infile) or compression_type(infile):
+        return
+    
+    with open(infile, 'rb') as ifstream:
+        with open_file(infile + ext, 'wb') as ofstream:
+        
+            while True:
+            
+                data = ifstream.read(67108864)
+                
+                if not data:
+                    break
+                    
+                ofstream.write(data)
+                
+    os.remove(infile)
+
 def readlines(infile,start_line=0, nlines=-1):
 
     """ 
@@ -28,7 +188,7 @@ def readlines(infile,start_line=0, nlines=-1):
     
     """
     
-    ifstream = open(infile,'r')
+    ifstream = open_file(infile,'r')
     contents = ifstream.readlines()
     ifstream.close()
     
@@ -88,26 +248,53 @@ def writelines(outfile, contents, nlines=-1):
     ofstream.close()
 
 
-def run_bash_cmnd(cmnd_str):
+def execute(cmnd_list):
 
     """ 
     
-    Runs a (bash) shell command - captures and returns any resulting output. 
+    Runs a pre-split command, recording its wall time, exit status, and bytes of output. 
     
-    Usage: run_bash_cmnd("my command string")
+    Usage: msg, status = execute(["my","pre-split", "string"])
     
-    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+    Notes: Returns the raw (bytes) output. Safe to call from multiple threads.
+           Records are appended to BASH_CMND_LOG.
     
     """
 
-    msg = ""
+    msg    = b""
+    status = 0
+    start  = time.time()
 
     try:
-        msg = check_output(cmnd_str.split())
+        msg = check_output(cmnd_list)
     except CalledProcessError as err_msg:
-        msg = err_msg.output
+        msg    = err_msg.output
+        status = err_msg.returncode
+
+    wall = time.time() - start
+
+    with BASH_CMND_LOCK:
+
+        BASH_CMND_STATS[0] += 1
+        BASH_CMND_STATS[1] += wall
+
+        BASH_CMND_LOG.append([None, ' '.join(cmnd_list), wall, status, len(msg)])
+
+    return msg, status
 
-    return msg.decode('utf-8')
+def run_bash_cmnd(cmnd_str):
+
+    """ 
+    
+    Runs a (bash) shell command - captures and returns any resulting output. 
+    
+    Usage: run_bash_cmnd("my command string")
+    
+    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+    
+    """
+
+    return execute(cmnd_str.split())[0].decode('utf-8')
     
 def run_bash_cmnd_presplit(cmnd_str):
 
@@ -121,14 +308,116 @@ def run_bash_cmnd_presplit(cmnd_str):
     
     """
 
-    msg = ""
+    return execute(cmnd_str)[0].decode('utf-8')
+
+def run_bash_cmnds(cmnd_strs, max_procs=None):
+
+    """ 
     
-    try:
-        msg = check_output(cmnd_str)
-    except CalledProcessError as err_msg:
-        msg = err_msg.output
+    Runs a batch of independent (bash) shell commands concurrently - returns a list of their outputs. 
+    
+    Usage: outputs = run_bash_cmnds(["my command string", ["my","pre-split", "string"]], max_procs=4)
+    
+    Notes: Commands can be strings or pre-split lists. At most max_procs 
+           commands run at once (default: number of cores). Outputs are
+           returned in the order commands were given. Commands must not 
+           depend on one another's results.
+           Linux wildcards will not work as expected. Use the glob if needed.
+    
+    """
+
+    if max_procs is None:
+        max_procs = os.cpu_count() or 1
+
+    cmnd_lists = []
+
+    for cmnd in cmnd_strs:
+
+        if isinstance(cmnd, str):
+            cmnd_lists.append(cmnd.split())
+        else:
+            cmnd_lists.append(cmnd)
+
+    if len(cmnd_lists) == 0:
+        return []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_procs) as pool:
+
+        results = list(pool.map(execute, cmnd_lists))
+
+    return [msg.decode('utf-8') for msg, status in results]
+
+def close_cmnd_stage(stage):
+
+    """ 
+    
+    Assigns all not-yet-assigned command records to a stage
+    
+    Usage: close_cmnd_stage("BUILD_AMAT")
+    
+    Notes: Called by the restart controller as each stage completes.
+    
+    """
+
+    with BASH_CMND_LOCK:
+
+        for record in BASH_CMND_LOG:
+
+            if record[0] is None:
+                record[0] = stage
+
+def print_cmnd_summary(stage=None):
+
+    """ 
+    
+    Prints the number of calls, failures, wall time, and output size of logged commands, per stage and program, then clears the log
+    
+    Usage: print_cmnd_summary("THIS_ALC")
+    
+    Notes: If given, stage is assigned to any records not yet assigned one.
+           Records with no stage are listed under "OTHER". Programs are
+           identified by the basename of the command's first word. Stages
+           are listed in the order they ran.
+    
+    """
+
+    if stage:
+        close_cmnd_stage(stage)
+
+    with BASH_CMND_LOCK:
+
+        records = list(BASH_CMND_LOG)
+
+        del BASH_CMND_LOG[:]
+
+    totals = collections.OrderedDict()
+
+    for record in records:
+
+        key = (record[0] or "OTHER", os.path.basename(record[1].split()[0]))
 
-    return msg.decode('utf-8')
+        if key not in totals:
+            totals[key] = [0, 0, 0.0, 0]
+
+        totals[key][0] += 1
+        totals[key][1] += int(record[3] != 0)
+        totals[key][2] += record[2]
+        totals[key][3] += record[4]
+
+    print("Shell command summary:")
+    print("   " + "stage".ljust(20) + "program".ljust(25) + "calls".ljust(8) + "failed".ljust(8) + "wall (s)".ljust(12) + "output (bytes)")
+
+    for key in totals:
+
+        calls, failed, wall, nbytes = totals[key]
+
+        print("   " + key[0].ljust(20) + key[1].ljust(25) + repr(calls).ljust(8) + repr(failed).ljust(8) + ("%-12.3f" % wall) + repr(nbytes))
+
+    if JOB_WAIT_STATS[0] > 0:
+    
+        print("Time between jobs ending and being detected:", "%.0f" % JOB_WAIT_STATS[2], "s over", JOB_WAIT_STATS[0], "waits (" + str(JOB_WAIT_STATS[1]) + " squeue polls)")
+        
+        JOB_WAIT_STATS[:] = [0, 0, 0.0]
     
 def run_bash_cmnd_to_file(outfile, cmnd_str):
 
@@ -166,7 +455,7 @@ def cat_to_var(*argv):
     
     for f in files_to_cat:
         
-        ifstream = open(f,'r')
+        ifstream = open_file(f,'r')
             
         contents += ifstream.readlines()    
             
@@ -175,37 +464,172 @@ def cat_to_var(*argv):
     return contents
     
     
-def cat_specific(outfilename, *argv):
+def append_file(ofstream, infile, bufsize=67108864):
 
     """ 
     
-    Concatenates a list of files and returns result. 
+    Appends the contents of a file to an open binary output stream.
     
-    Usage: cat_specific("my_outfile.dat", "file1.dat", "file2.dat", "file3.dat")    
+    Usage: append_file(ofstream, "file1.dat")
     
-    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+    Notes: Data is moved by the kernel with os.copy_file_range, or
+           os.sendfile where that isn't available, so it never passes through
+           python. If neither works on the underlying filesystem, falls back 
+           to readinto with a single reusable bufsize-byte buffer. The input
+           file is never held in memory.
+           Compressed input files (see open_file) are decompressed through 
+           the buffer.
     
     """
     
-    # Assumes first file is large, so avoids reading contents
+    ofstream.flush()
+    
+    infile = resolve_file(infile)
+    
+    with open_file(infile, "rb") as ifstream:
+    
+        in_fd  = ifstream.fileno()
+        out_fd = ofstream.fileno()
+        remain = os.fstat(in_fd).st_size
+        
+        # Kernel-level copies
+        
+        for kernel_copy in ["copy_file_range", "sendfile"]:
+        
+            if (not hasattr(os, kernel_copy)) or compression_type(infile):
+                continue
+            
+            try:
+                while remain > 0:
+                
+                    if kernel_copy == "copy_file_range":
+                        copied = os.copy_file_range(in_fd, out_fd, min(remain, 1073741824))
+                    else:
+                        copied = os.sendfile(out_fd, in_fd, None, min(remain, 1073741824))
+                    
+                    if copied == 0:
+                        break
+                        
+                    remain -= copied
+                    
+                return
+                
+            except OSError:
+                pass # Unsupported for this file pair; resume with the next method
+                
+        # Buffered fallback... picks up wherever the kernel copy left off
+        
+        buf  = bytearray(bufsize)
+        view = memoryview(buf)
+        
+        while True:
+        
+            nread = ifstream.readinto(buf)
+            
+            if not nread:
+                break
+                
+            ofstream.write(view[:nread])
+            
 
-    files_to_cat = argv[0][0]
+def reflink_file(infile, outfilename):
 
-    run_bash_cmnd("cp " + files_to_cat + " " + outfilename)
+    """ 
+    
+    Creates a copy-on-write clone of a file.
+    
+    Usage: reflink_file("file1.dat", "my_outfile.dat")
+    
+    Notes: Returns True on success, or False if the filesystem doesn't
+           support reflinks (e.g. ext4), in which case nothing is created.
+    
+    """
+    
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    
+    FICLONE = 0x40049409
+    
+    with open(infile, "rb") as ifstream:
+        with open(outfilename, "wb") as ofstream:
+            try:
+                fcntl.ioctl(ofstream.fileno(), FICLONE, ifstream.fileno())
+                return True
+            except OSError:
+                pass
+                
+    os.remove(outfilename)
     
-    files_to_cat = argv[0][1:]
+    return False
 
-    with open(outfilename, "a") as ofstream:
-        for f in files_to_cat:
+
+def cat_specific(outfilename, *argv, **kwargs):
+
+    """ 
+    
+    Concatenates a list of files and returns result. 
+    
+    Usage: cat_specific("my_outfile.dat", ["file1.dat", "file2.dat", "file3.dat"])
+           or cat_specific("my_outfile.dat", ["file1.dat", "file2.dat"], link_first="reflink")
+    
+    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+           Files are concatenated by the kernel (see append_file).
+           link_first can be used to avoid copying the (assumed large) first file:
+           - "reflink": Clone the first file copy-on-write, if the filesystem supports it
+           - "link":    Hard link the first file, but only if it is the only file; otherwise
+                        appending would modify the original, so "reflink" is used instead
+           Either option quietly falls back to a regular copy.
+           Compressed input files are decompressed, and the output is compressed
+           if its name has a compression extension (see open_file).
+    
+    """
+    
+    link_first = kwargs.get("link_first", False)
+    
+    files_to_cat = [resolve_file(f) for f in argv[0]]
+    
+    if os.path.lexists(outfilename):
+        os.remove(outfilename)
         
-            with open(f, "r") as ifstream:
+    if compression_type(outfilename):
+    
+        with open_file(outfilename, "wb") as ofstream:
+            for f in files_to_cat:
+                with open_file(f, "rb") as ifstream:
+                    shutil.copyfileobj(ifstream, ofstream, 67108864)
+        return
         
-                if os.path.getsize(f)/1E9 > 50:
+    # Compressed data can't be linked into a plain output file
+    
+    if compression_type(files_to_cat[0]):
+        link_first = False
+    
+    # Assumes first file is large, so try to avoid copying it at all
 
-                    for line in ifstream:
-                        ofstream.write(line)
-                else:
-                    ofstream.write(ifstream.read()) # Memory issues with large files
+    if link_first == "link" and len(files_to_cat) == 1:
+    
+        try:
+            os.link(files_to_cat[0], outfilename)
+            return
+        except OSError:
+            pass
+    
+    mode = "wb"
+    
+    if link_first and reflink_file(files_to_cat[0], outfilename):
+        files_to_cat = files_to_cat[1:]
+        mode         = "r+b"
+    
+    # Note: Not opened in append mode, which copy_file_range doesn't support
+
+    with open(outfilename, mode) as ofstream:
+    
+        ofstream.seek(0, os.SEEK_END)
+        
+        for f in files_to_cat:
+            append_file(ofstream, f)
 
 def cat_pattern(outfilename, pattern):
 
@@ -216,6 +640,8 @@ def cat_pattern(outfilename, pattern):
     Usage: cat_pattern("my_outfile.txt","*.dat")    
     
     Notes: Linux wildcards WILL work as expected. 
+           Files are concatenated by the kernel (see append_file).
+           Compressed input files are decompressed.
     
     """
 
@@ -225,8 +651,7 @@ def cat_pattern(outfilename, pattern):
 
         for f in files_to_cat:
 
-            with open(f, "rb") as ifstream:
-                ofstream.write(ifstream.read())
+            append_file(ofstream, f)
                 
 def head(*argv):
     
@@ -248,17 +673,20 @@ def head(*argv):
         print("ERROR: Unrecognized head command: ", argv)
         exit()
         
-    possible = wc_l(argv[0])
-    
-    if possible < nlines:
-        nlines = possible
+    # Stop after nlines, or at the end of the file if it is shorter
         
-    ifstream = open(argv[0],'r')
+    ifstream = open_file(argv[0],'r')
     
     contents = []
     
     for i in range(nlines):
-            contents.append(ifstream.readline())
+    
+        line = ifstream.readline()
+        
+        if not line:
+            break
+            
+        contents.append(line)
     
     ifstream.close()
     
@@ -284,141 +712,557 @@ def tail(*argv):
         print("ERROR: Unrecognized head command: ", argv)
         exit()
     
-    total_lines = wc_l(argv[0])
+    if nlines <= 0:
+        return []
         
-    ifstream = open(argv[0],'r')
+    # Compressed files can't be read backwards; stream through them instead
+    
+    if compression_type(resolve_file(argv[0])):
+    
+        with open_file(argv[0],'r') as ifstream:
+            return list(collections.deque(ifstream, nlines))
+    
+    # Read backwards from the end of the file in blocks until more than
+    # nlines newlines have been seen (or the start of the file is reached),
+    # so that the last nlines lines are guaranteed to be complete
+    
+    blocksize = 65536
+    
+    ifstream = open(argv[0],'rb')
+    
+    ifstream.seek(0, os.SEEK_END)
+    
+    pos  = ifstream.tell()
+    data = b''
+    
+    while pos > 0 and data.count(b'\n') <= nlines:
+    
+        step  = min(blocksize, pos)
+        pos  -= step
+        
+        ifstream.seek(pos)
+        
+        data  = ifstream.read(step) + data
+    
+    ifstream.close()
+    
+    # Match the newline handling of a file opened in text mode
     
     contents = []
     
-    for i in range(total_lines):
+    for line in data.splitlines(True)[-nlines:]:
     
-        line = ifstream.readline()
+        line = line.decode('utf-8')
         
-        if i >= (total_lines - nlines):
+        if line.endswith('\r\n'):
+            line = line[:-2] + '\n'
+        elif line.endswith('\r'):
+            line = line[:-1] + '\n'
             
-            contents.append(line)
+        contents.append(line)
     
-    ifstream.close()
+    return contents    
+    
+def wc_l(infile):
+
+    """ 
+    
+    Mimics functionality of Linux wc -l command. 
+    
+    Usage: wc_l("my_file.txt")
+    
+    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+    
+    """    
+
+    nlines = 0
+    
+    with open_file(infile, "r") as ifstream:
+        for line in ifstream:
+            nlines += 1
+    return nlines        
+    
+def count_xyzframes_general(infile):
+
+    """ 
+    
+    Counts the number of frames in a .xyz(f) file 
+    
+    Usage: count_xyzframes_general("my_file.xyz")
+    
+    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+    
+    """    
+
+    return len(index_xyzframes(infile)[0])
+    
+def count_genframes_general(infile):
+
+    """ 
+    
+    Counts the number of frames in a .gen file 
+    
+    Usage: count_genframes_general("my_file.gen")
+    
+    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+    
+    """    
+
+    return scan_genframes(infile)[0]
+    
+def list_natoms(infile):
+
+    """ 
+    
+    Generates a list of the number of atoms in each frames of a .xyz(f) file 
+    
+    Usage: list_natoms("my_file.txt")
+    
+    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+    
+    """    
+
+    return index_xyzframes(infile)[1]
+
+
+def xyz_index_file(infile):
+
+    """
+
+    Returns the name of the frame index sidecar file for a .xyz(f) file
+
+    Usage: xyz_index_file("my_file.xyzf") # Returns ".my_file.xyzf.idx"
+
+    Notes: The sidecar is a hidden file so that it is never picked up by
+           the glob patterns used elsewhere in the driver.
+
+    """
+
+    path, name = os.path.split(infile)
+
+    return os.path.join(path, "." + name + ".idx")
+
+
+def index_xyzframes(infile):
+
+    """
+
+    Generates a byte-offset index of the frames in a .xyz(f) file
+
+    Usage: offsets, natoms, headers = index_xyzframes("my_file.xyzf")
+
+    Notes: Returns three lists with one entry per frame: the byte offset
+           of the frame's atom count line, the number of atoms, and the
+           frame's comment (header) line, without the trailing newline.
+           Only complete frames are indexed; a partially printed last
+           frame is ignored.
+           The index is saved next to the input file (see xyz_index_file)
+           and is reused until the input file's size or mtime, or
+           XYZ_INDEX_VERSION, changes. Saved indexes end with a frame 
+           count; one that is incomplete or unreadable is rebuilt.
+
+    """
+
+    infile  = resolve_file(infile)
+    stats   = os.stat(infile)
+    stamp   = "v" + str(XYZ_INDEX_VERSION) + " " + str(stats.st_size) + " " + str(stats.st_mtime_ns)
+    idxfile = xyz_index_file(infile)
+
+    offsets = []
+    natoms  = []
+    headers = []
+
+    # Reuse the saved index if it is still valid and complete
+
+    if os.path.isfile(idxfile):
+
+        with open(idxfile, "r") as ifstream:
+
+            if ifstream.readline().rstrip('\n') == stamp:
+            
+                complete = False
+
+                try:
+                    for line in ifstream:
+
+                        line = line.rstrip('\n').split(' ', 2)
+                        
+                        if line[0] == "end":
+                            complete = (int(line[1]) == len(offsets))
+                            break
+
+                        offsets.append(int(line[0]))
+                        natoms .append(int(line[1]))
+                        headers.append(line[2])
+                except (ValueError, IndexError):
+                    complete = False
+
+                if complete:
+                    return offsets, natoms, headers
+                    
+                offsets = []
+                natoms  = []
+                headers = []
+
+    # Otherwise, build it in a single pass over the file
+
+    with open_file(infile, "rb") as ifstream:
+
+        while True:
+
+            offset = ifstream.tell()
+            line   = ifstream.readline()
+
+            # Try/except for cases where print isn't finished
+
+            try:
+                atoms = int(line.split()[0])
+            except:
+                break
+
+            header = ifstream.readline()
+
+            if not header.endswith(b'\n'):
+                break
+
+            complete = True
+
+            for i in range(atoms):
+            
+                line = ifstream.readline()
+                
+                # Only the very last line of the file may lack a newline
+                
+                if not line.endswith(b'\n') and (i < atoms-1 or not line.strip()):
+                    complete = False
+                    break
+
+            if not complete:
+                break
+
+            offsets.append(offset)
+            natoms .append(atoms)
+            headers.append(header.decode('utf-8').rstrip('\n'))
+
+    # Save the index... it is renamed into place, so concurrent readers 
+    # never see a partial file; silently skip if the directory isn't writable
+
+    try:
+        with open(idxfile + ".tmp." + str(os.getpid()), "w") as ofstream:
+            ofstream.write(stamp + '\n')
+            for i in range(len(offsets)):
+                ofstream.write(str(offsets[i]) + " " + str(natoms[i]) + " " + headers[i] + '\n')
+            ofstream.write("end " + str(len(offsets)) + '\n')
+        os.replace(idxfile + ".tmp." + str(os.getpid()), idxfile)
+    except OSError:
+        pass
+
+    return offsets, natoms, headers
+
+
+def read_xyzframe(infile, frame, index=None):
+
+    """
+
+    Reads a single frame from a .xyz(f) file without reading the frames before it
+
+    Usage: read_xyzframe("my_file.xyzf", 10) or read_xyzframe("my_file.xyzf", 10, index)
+
+    Notes: Returns a list of lines (including the atom count and comment
+           lines), as would be returned by readlines. index is the output
+           of index_xyzframes; it is generated if not provided.
+
+    """
+
+    if index is None:
+        index = index_xyzframes(infile)
+
+    offsets, natoms, headers = index
+
+    with open_file(infile, "rb") as ifstream:
+
+        ifstream.seek(offsets[frame])
+
+        return [ifstream.readline().decode('utf-8') for i in range(natoms[frame]+2)]
+
+
+def iter_xyzframes(infile, start=0, stop=None, step=1, index=None):
+
+    """
+
+    Iterates over a range of frames in a .xyz(f) file
+
+    Usage: for frame in iter_xyzframes("my_file.xyzf", 0, 100, 10): ...
+
+    Notes: Yields one list of lines per frame (see read_xyzframe). Frames
+           are selected like range(start, stop, step); stop defaults to the
+           number of complete frames in the file. Skipped frames are never read.
+
+    """
+
+    if index is None:
+        index = index_xyzframes(infile)
+
+    offsets, natoms, headers = index
+
+    if stop is None:
+        stop = len(offsets)
+
+    with open_file(infile, "rb") as ifstream:
+
+        for i in range(start, min(stop, len(offsets)), step):
+
+            if ifstream.tell() != offsets[i]:
+                ifstream.seek(offsets[i])
+
+            yield [ifstream.readline().decode('utf-8') for j in range(natoms[i]+2)]
+
+
+
+def subsample_xyzframes(infile, nframes=None, every=None):
+
+    """
+
+    Selects a strided subset of the frames in a .xyz(f) file
+
+    Usage: subsample_xyzframes("my_file.xyz", nframes=20) or subsample_xyzframes("my_file.xyz", every=10)
+
+    Notes: Returns a range of frame indices, for use with iter_xyzframes or
+           write_xyzframes. every=k takes every k-th frame; nframes=N takes N
+           evenly spaced frames, i.e. every (total/N)-th frame, starting from
+           the first. All frames are taken if the file has N or fewer, or if
+           neither option is given.
+
+    """
+
+    total = count_xyzframes_general(infile)
+
+    if every:
+        return range(0, total, int(every))
+
+    if (nframes is None) or (total <= nframes):
+        return range(total)
+
+    skip = int(total / nframes)
+
+    return range(0, nframes*skip, skip)
+
+
+def write_xyzframes(outfilename, selections):
+
+    """
+
+    Writes selected frames from one or more .xyz(f) files to a single file
+
+    Usage: write_xyzframes("my_outfile.xyz", [("traj.xyz", subsample_xyzframes("traj.xyz", nframes=20)),
+                                              ("penalty.xyz", range(5))])
+
+    Notes: selections is a list of (file, frames) pairs, where frames is a
+           range (see subsample_xyzframes). Frames are streamed to the output
+           in the order given, in a single pass with no intermediate files.
+
+    """
+
+    with open_file(outfilename, "w") as ofstream:
+
+        for infile, frames in selections:
+
+            for frame in iter_xyzframes(infile, frames.start, frames.stop, frames.step):
+                ofstream.writelines(frame)
+
+
+
+def xyz_header_format(header):
+
+    """
+    
+    Determines the format of a .xyzf frame header (comment) line.
+    
+    Returns:
+        1. A box type ("ortho" or non "ortho")
+        2. A stress type ("all", "diag", or "no")
+        3. An energy type ("yes" or "no")
     
-    return contents    
+    Usage: xyz_header_format("NON_ORTHO 8.6 0.0 0.0 0.0 8.6 0.0 0.0 0.0 8.6")
     
-def wc_l(infile):
-
-    """ 
     
-    Mimics functionality of Linux wc -l command. 
+    Formats are based of presence of "NON_ORTHO" and number of fields, i.e.:
     
-    Usage: wc_l("my_file.txt")
     
-    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+    17    NON_ORTHO ax ay az bx by bz cx cy cz sxx syy szz sxy sxz syz energy
+    16    NON_ORTHO ax ay az bx by bz cx cy cz sxx syy szz sxy sxz syz
+    14    NON_ORTHO ax ay az bx by bz cx cy cz sxx syy szz energy
+    13    NON_ORTHO ax ay az bx by bz cx cy cz sxx syy szz
+    11    NON_ORTHO ax ay az bx by bz cx cy cz energy
+    10    NON_ORTHO ax ay az bx by bz cx cy cz
     
-    """    
-
-    nlines = 0
+    10    x y z sxx syy szz sxy sxz syz energy
+    9    x y z sxx syy szz sxy sxz syz
+    7    x y z sxx syy szz energy
+    6    x y z sxx syy szz
+    4    x y z energy
+    3    x y z
     
-    with open(infile, "r") as ifstream:
-        for line in ifstream:
-            nlines += 1
-    return nlines        
     
-def count_xyzframes_general(infile):
-
-    """ 
+    """
     
-    Counts the number of frames in a .xyz(f) file 
+    box_type    = None
+    stress_type = None
+    energy_type = None
     
-    Usage: count_xyzframes_general("my_file.xyz")
+    header = header.split()
+    hlen   = len(header)
     
-    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+    # Parse
     
-    """    
+    if header[0] == "NON_ORTHO":
+        box_type = "non_ortho"
+    else:
+        box_type = "ortho"
+    
+    # Determine stress/energy options            
+    
+    if   hlen == 17:
+        stress_type = "all"
+        energy_type = "yes"
+    elif hlen == 16:
+        stress_type = "all"
+        energy_type = "no"        
+    elif hlen == 14:
+        stress_type = "diag"
+        energy_type = "yes"
+    elif hlen == 13:
+        stress_type = "diag"
+        energy_type = "no"        
+    elif hlen == 11:
+        stress_type = "no"
+        energy_type = "yes"        
+    elif hlen == 10:
+        if box_type == "non_ortho":
+            stress_type = "no"
+            energy_type = "no"
+        else:
+            stress_type = "all"
+            energy_type = "yes"            
+    elif hlen == 9:
+        stress_type = "all"
+        energy_type = "no"        
+    elif hlen == 7:
+        stress_type = "diag"
+        energy_type = "yes"
+    elif hlen == 6:
+        stress_type = "diag"
+        energy_type = "no"        
+    elif hlen == 4:
+        stress_type = "no"
+        energy_type = "yes"        
+    elif hlen == 3:
+        stress_type = "no"
+        energy_type = "no"    
+    
+    return box_type, stress_type, energy_type    
+
+
+def scan_xyzframes(infile):
 
-    nframes = 0
-    natoms  = []
-    nlines  = 0
-    
-    with open(infile, "r") as ifstream:
-        for line in ifstream:
-            
-            nlines +=1
-        
-            if len(line.split()) == 1:
-                
-                # Try/except for cases where print isn't finished
-                
-                try:
-                    natoms.append(int(line.split()[0]))
-                except:
-                    break
-                nframes += 1
-                
-    sanity = len(natoms)*2 + sum(natoms)
+    """
     
-    # Check whether frame finished printing
+    Collects all the metadata needed to process a .xyz(f) file in a single pass
     
-    if sanity > nlines:
-        nframes -= 1 
+    Usage: nframes, natoms, file_format, truncated = scan_xyzframes("my_file.xyzf")
     
+    Notes: Returns the number of complete frames, a list of the number of atoms in
+           each, the header format of the first frame (see xyz_header_format; 
+           None's if there are no frames), and whether the file ends with a 
+           partially printed frame.
+           Built on the frame index (see index_xyzframes), so only the atom 
+           count and header lines are ever split, and repeat calls on an 
+           unchanged file don't rescan it.
     
-    return nframes    
+    """
     
-def count_genframes_general(infile):
-
-    """ 
+    offsets, natoms, headers = index_xyzframes(infile)
     
-    Counts the number of frames in a .gen file 
+    file_format = (None, None, None)
     
-    Usage: count_xyzframes_general("my_file.gen")
+    if len(headers) > 0:
+        file_format = xyz_header_format(headers[0])
     
-    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+    # Check for anything but whitespace following the last complete frame
     
-    """    
-
-    nframes = 0
-    natoms  = []
-    nlines  = 0
+    with open_file(infile, "rb") as ifstream:
     
-    with open(infile, "r") as ifstream:
-        for line in ifstream:
-            
-            nlines +=1
+        if len(offsets) > 0:
+        
+            ifstream.seek(offsets[-1])
             
-            splitline = line.split()
+            for i in range(natoms[-1]+2):
+                ifstream.readline()
         
-            if (len(splitline) == 2) and (splitline[-1] == "S"):
-                nframes += 1
-                natoms.append(int(line.split()[0]))
-                
-    sanity = len(natoms)*6 + sum(natoms)
-    
-    # Check whether frame finished printing
+        truncated = len(ifstream.read().strip()) > 0
+        
+    return len(offsets), natoms, file_format, truncated
     
-    if sanity > nlines:
-        nframes -= 1 
+
+def scan_genframes(infile):
+
+    """
     
+    Collects the frame metadata for a DFTB+ .gen file in a single pass
     
-    return nframes        
+    Usage: nframes, natoms, truncated = scan_genframes("my_file.gen")
     
-def list_natoms(infile):
-
-    """ 
+    Notes: Returns the number of complete frames, a list of the number of atoms in
+           each, and whether the file ends with a partially printed frame.
+           Each frame is a "<natoms> S" line, a line of element names, natoms
+           atom lines, and four lines for the origin and cell vectors. Only
+           the "<natoms> S" lines are split.
     
-    Generates a list of the number of atoms in each frames of a .xyz(f) file 
+    """
     
-    Usage: list_natoms("my_file.txt")
+    natoms    = []
+    truncated = False
     
-    Notes: Linux wildcards will not work as expected. Use the glob if needed.
+    with open_file(infile, "rb") as ifstream:
     
-    """    
+        while True:
+        
+            line = ifstream.readline()
+            
+            if not line.strip():
+            
+                if line:
+                    continue # Skip blank lines between frames
+                break
+                
+            line = line.split()
+            
+            if (len(line) != 2) or (line[-1] != b"S"):
+                truncated = True
+                break
+            
+            atoms = int(line[0])
+            
+            complete = True
+            
+            for i in range(atoms+5):
+            
+                line = ifstream.readline()
+                
+                # Only the very last line of the file may lack a newline
+                
+                if not line.endswith(b'\n') and (i < atoms+4 or not line.strip()):
+                    complete = False
+                    break
+                    
+            if not complete:
+                truncated = True
+                break
+                
+            natoms.append(atoms)
+            
+    return len(natoms), natoms, truncated
 
-    natoms = []
-    
-    with open(infile, "r") as ifstream:
-        for line in ifstream:
-            if len(line.split()) == 1:
-                natoms.append(int(line.split()[0]))
-    return natoms        
-    
     
 def email_user(base, address, status):
 
@@ -450,7 +1294,12 @@ def create_and_launch_job(*argv, **kwargs):
     
     Notes: if "job_executable" is empty, uses the commands specified in *argv.
            See function definition in helpers.py for a full list of options.
-           Currently, function only supports SLURM systems.
+           Scripts are submitted with submit_job, so job_system can be
+           "slurm", "torque", "local", or "pilot" (see local_jobs.py).
+           If "job_dependency" is given, the job is held until those jobs
+           complete successfully, and cancelled if any of them fail.
+           If "job_array" is given, an array job is submitted; tasks can read
+           their index from $SLURM_ARRAY_TASK_ID (or $PBS_ARRAYID).
     
     """    
 
@@ -458,8 +1307,8 @@ def create_and_launch_job(*argv, **kwargs):
     # 0. Set up an argument parser
     ################################
     
-    default_keys   = [""]*10
-    default_values = [""]*10
+    default_keys   = [""]*12
+    default_values = [""]*12
 
     # Overall job controls
     
@@ -470,9 +1319,11 @@ def create_and_launch_job(*argv, **kwargs):
     default_keys[4 ] = "job_queue"         ; default_values[4 ] =     "pdebug"       # Queue for ChIMES lsq job
     default_keys[5 ] = "job_account"       ; default_values[5 ] =     "pbronze"      # Account for ChIMES lsq job
     default_keys[6 ] = "job_executable"    ; default_values[6 ] =     ""             # Full path to executable for ChIMES lsq job
-    default_keys[7 ] = "job_system"        ; default_values[7 ] =     "slurm"        # slurm or torque    
+    default_keys[7 ] = "job_system"        ; default_values[7 ] =     "slurm"        # slurm, torque, local, or pilot
     default_keys[8 ] = "job_file"          ; default_values[8 ] =     "run.cmd"      # Name of the resulting submit script    
     default_keys[9 ] = "job_email"         ; default_values[9 ] =     True           # Name of the resulting submit script    
+    default_keys[10] = "job_dependency"    ; default_values[10] =     ""             # Job id(s) that must complete successfully before this job starts
+    default_keys[11] = "job_array"         ; default_values[11] =     ""             # Array task indices (e.g. "0-99"), if submitting an array job
     
 
     args = dict(list(zip(default_keys, default_values)))
@@ -497,12 +1348,37 @@ def create_and_launch_job(*argv, **kwargs):
     JOB.append(" -V " )
     JOB.append(" -o " + "stdoutmsg")
     
+    if args["job_dependency"]:
+    
+        # Hold the job until the listed jobs complete successfully
+    
+        dependency = args["job_dependency"]
+        
+        if not isinstance(dependency, list):
+            dependency = [dependency]
+            
+        dependency = ':'.join([str(job).split()[0] for job in dependency])
+        
+        if args["job_system"] != "torque":
+            JOB.append(" --dependency=afterok:" + dependency)
+            JOB.append(" --kill-on-invalid-dep=yes")
+        else:
+            JOB.append(" -W depend=afterok:" + dependency)
+    
+    if args["job_array"]:
+    
+        if args["job_system"] != "torque":
+            JOB.append(" --array=" + args["job_array"])
+            JOB.append(" --open-mode=append") # Tasks share stdoutmsg
+        else:
+            JOB.append(" -t " + args["job_array"])
+    
     ofstream = open(args["job_file"],'w')
     ofstream.write("#!/bin/bash\n")
     
     for i in range(len(JOB)):
     
-        if args["job_system"] == "slurm":
+        if args["job_system"] in ["slurm", "local", "pilot"]:
             JOB[i] = "#SBATCH" + JOB[i]
         elif args["job_system"] == "torque":
             JOB[i] = "#PBS"  + JOB[i]
@@ -528,74 +1404,208 @@ def create_and_launch_job(*argv, **kwargs):
     # 2. Launch the job file
     ################################
 
-    jobid = None
+    return submit_job(args["job_file"], args["job_system"])
     
-    if args["job_system"] == "slurm":
-        jobid = run_bash_cmnd("sbatch " + args["job_file"]).split()[-1]
-    else:    
-        jobid = run_bash_cmnd("qsub " + args["job_file"])
 
-    return jobid    
+def submit_job(job_file, job_system, options="", job_args=""):
+
+    """ 
+    
+    Submits a job script to the queueing system, or to the local process pool.
+    
+    Usage: jobid = submit_job("run.cmd", "slurm") 
+           jobid = submit_job("run.cmd", "slurm", "--array=1,3", "arg1 arg2")
     
+    Notes: job_system is "slurm", "torque", "local", or "pilot". options are
+           passed to sbatch/qsub ahead of the job file, and job_args to the
+           script. For "local" and "pilot", the script is run by local_jobs,
+           which honors array and dependency options and returns a synthetic
+           job id; for "pilot", the job's srun steps run inside the pilot
+           allocation (see local_jobs.start_pilot).
+    
+    """    
 
-def wait_for_job(active_job, **kwargs):
+    if job_system == "slurm":
+        return run_bash_cmnd("sbatch " + options + " " + job_file + " " + job_args).split()[-1]
+    elif job_system == "torque":
+        return run_bash_cmnd("qsub " + options + " " + job_file + " " + job_args).replace('\n', '')
+    elif job_system in ["local", "pilot"]:
+        return local_jobs.submit(job_file, options, job_args)
+    else:
+        print("ERROR: Unknown job_system: ", job_system)
+        exit()
+        
+
+def slurm_seconds(time_str):
 
     """ 
     
-    Pauses the code until a single SLURM job completes.
+    Converts a SLURM time string ([days-]hours:minutes:seconds, minutes:seconds, ...) to seconds
     
-    Usage: wait_for_job(2116091,<arguments>)
+    Usage: slurm_seconds("1-02:03:04") # Returns 93784
     
-    Notes: Accepts a jobid and queries the queueing system to determine
-           whether the job is active. Doesn't return until job completes.
-           See function definition in helpers.py for a full list of options.
+    Notes: Returns None for strings that aren't times (e.g. UNLIMITED, INVALID).
     
-    """    
+    """
 
-    ################################
-    # 0. Set up an argument parser
-    ################################
+    days = 0
+
+    if "-" in time_str:
+        days, time_str = time_str.split("-", 1)
+
+    try:
+        fields = [int(i) for i in time_str.split(":")]
+        days   = int(days)
+    except ValueError:
+        return None
 
-    default_keys   = [""]*3
-    default_values = [""]*3
+    seconds = 0
+
+    for field in fields:
+        seconds = seconds*60 + field
+
+    return days*86400 + seconds
+
+
+def job_matches(job_id, queued_id):
+
+    """ 
     
-    default_keys  [0] = "job_system" ; default_values[0] = "slurm"
-    default_keys  [1] = "verbose"    ; default_values[1] = False 
-    default_keys  [2] = "job_name"   ; default_values[2] = "unspecified" 
+    Determines whether a job id reported by SLURM belongs to a submitted job
     
-    args = dict(list(zip(default_keys, default_values)))
-    args.update(kwargs)
+    Usage: job_matches("2116091", "2116091_4") # Returns True
+    
+    Notes: Array tasks (<id>_<task>) and job steps (<id>.<step>) belong to <id>.
+    
+    """
+
+    return (queued_id == job_id) or queued_id.startswith(job_id + "_") or queued_id.startswith(job_id + ".")
+
+
+# Job states after which a SLURM job will not run again
+
+SLURM_FINAL_STATES = ["BOOT_FAIL", "CANCELLED", "COMPLETED", "DEADLINE", "FAILED", "NODE_FAIL", "OUT_OF_MEMORY", "PREEMPTED", "TIMEOUT"]
+
+# Number of waits, queue polls, and total time (s) between the last job in a wait ending and the driver noticing
+
+JOB_WAIT_STATS = [0, 0, 0.0]
+
+
+def query_queue(job_ids):
+
+    """ 
     
-    active_job = str(active_job).split()[0]
+    Returns the state and remaining time of queued SLURM jobs, with a single squeue call
     
+    Usage: queued = query_queue(["2116091", "2116092"]) # queued["2116091"] = ["RUNNING", 3540]
     
-    ################################
-    # 1. Determine job status, hold until complete
-    ################################
+    Notes: Jobs missing from the output (finished, or not known to squeue)
+           are not included. Remaining time is None for pending jobs. Returns 
+           None if squeue itself fails, e.g. because all jobs have been purged
+           from the queue, or the controller is not responding.
+    
+    """
 
-    while True:
-        
-        check_job = ""
-        
-        if args["job_system"] == "slurm":
-            check_job = "squeue -j " + active_job
-            
-        elif args["job_system"] == "torque":
-            print("ERROR: torque support not yet implemented in wait_for_job")
-        else:
-            print("ERROR: Unknown job_system: ", args["job_system"])
-            exit()
-            
-        if active_job in  run_bash_cmnd(check_job):
-        
-            if args["verbose"]:
-                print("Sleeping for 60 more seconds while waiting for job ", active_job, "...", args["job_name"])
-        
-            time.sleep(60) # sleep for 60 seconds
-        else:        
-            print("Breaking ... ")
-            break                
+    msg, status = execute(["squeue", "-h", "-o", "%i %T %L", "-j", ','.join(job_ids)])
+
+    if status != 0:
+        return None
+
+    queued = {}
+
+    for line in msg.decode('utf-8').splitlines():
+
+        line = line.split()
+
+        if len(line) < 3:
+            continue
+
+        for job_id in job_ids:
+
+            if not job_matches(job_id, line[0]):
+                continue
+
+            left = None
             
+            if line[1] == "RUNNING":
+                left = slurm_seconds(line[2])
+
+            if (job_id not in queued) or (queued[job_id][1] is None) or ((left is not None) and (left > queued[job_id][1])):
+                queued[job_id] = [line[1], left]
+
+    return queued
+
+
+def query_accounting(job_ids):
+
+    """ 
+    
+    Returns the state and end time of SLURM jobs from the accounting database, with a single sacct call
+    
+    Usage: accounted = query_accounting(["2116091", "2116092"]) # accounted["2116091"] = ["COMPLETED", 1760793296.0]
+    
+    Notes: For array jobs, the state is that of any unfinished task, or else
+           any unsuccessful task, and the end time is that of the last task 
+           to end. End time is None for unfinished jobs. Jobs with no record 
+           (e.g. if accounting is disabled) are not included.
+    
+    """
+
+    msg, status = execute(["sacct", "-n", "-X", "-P", "-o", "JobID,State,End", "-j", ','.join(job_ids)])
+
+    accounted = {}
+
+    for line in msg.decode('utf-8').splitlines():
+
+        line = line.split("|")
+
+        if len(line) < 3:
+            continue
+
+        state = line[1].split()[0] if line[1] else "UNKNOWN" # e.g. "CANCELLED by 1234"
+        end   = None
+
+        try:
+            end = time.mktime(time.strptime(line[2], "%Y-%m-%dT%H:%M:%S"))
+        except ValueError:
+            pass
+
+        for job_id in job_ids:
+
+            if not job_matches(job_id, line[0]):
+                continue
+
+            if job_id not in accounted:
+                accounted[job_id] = [state, end]
+                continue
+
+            if (state not in SLURM_FINAL_STATES) or (accounted[job_id][0] == "COMPLETED"):
+                accounted[job_id][0] = state
+
+            if (end is None) or (accounted[job_id][1] is None) or (state not in SLURM_FINAL_STATES):
+                accounted[job_id][1] = None
+            else:
+                accounted[job_id][1] = max(end, accounted[job_id][1])
+
+    return accounted
+
+
+def wait_for_job(active_job, **kwargs):
+
+    """ 
+    
+    Pauses the code until a single SLURM job completes.
+    
+    Usage: wait_for_job(2116091,<arguments>)
+    
+    Notes: Accepts a jobid and queries the queueing system to determine
+           whether the job is active. Doesn't return until job completes.
+           See wait_for_jobs for a full list of options.
+    
+    """    
+
+    wait_for_jobs([active_job], **kwargs)
+    
     return
     
 
@@ -603,13 +1613,21 @@ def wait_for_jobs(*argv, **kwargs):
 
     """ 
     
-    Pauses the code until SLURM job completes.
+    Pauses the code until SLURM (or local) jobs complete.
     
     Usage: wait_for_jobs([2116091, 2116092], <arguments>)
     
     Notes: Accepts list of jobid and queries the queueing system to determine
            whether any jobs are active. Doesn't return until job completes.
            See function definition in helpers.py for a full list of options.
+           
+           All jobs are checked with a single squeue call per poll. Jobs no
+           longer in the queue are confirmed finished with sacct, so jobs that
+           haven't reached squeue yet, or a failed squeue call, don't end the
+           wait early. Polls start poll_min seconds apart and back off to 
+           poll_max, but never wait much past the soonest expected end (from
+           the jobs' remaining walltime). Local and pilot jobs are waited on
+           directly, without polling.
     
     """
 
@@ -617,60 +1635,117 @@ def wait_for_jobs(*argv, **kwargs):
     # 0. Set up an argument parser
     ################################
 
-    default_keys   = [""]*3
-    default_values = [""]*3
+    default_keys   = [""]*5
+    default_values = [""]*5
     
     default_keys  [0] = "job_system" ; default_values[0] = "slurm"
     default_keys  [1] = "verbose"    ; default_values[1] = False 
     default_keys  [2] = "job_name"   ; default_values[2] = "unspecified" 
+    default_keys  [3] = "poll_min"   ; default_values[3] = 10   # Seconds between polls just after submission/near the expected end 
+    default_keys  [4] = "poll_max"   ; default_values[4] = 60   # Maximum seconds between polls 
     
     args = dict(list(zip(default_keys, default_values)))
     args.update(kwargs)
     
-    active_jobs = argv[0] # Pointer!
+    active_jobs = [str(job).split()[0] for job in argv[0]]
+    
+    if args["job_system"] == "torque":
+        print("ERROR: torque support not yet implemented in wait_for_jobs")
+        exit()
+    elif args["job_system"] not in ["slurm", "local", "pilot"]:
+        print("ERROR: Unknown job_system: ", args["job_system"])
+        exit()
+        
+    if len(active_jobs) == 0:
+        return
+        
+    if args["job_system"] in ["local", "pilot"]:
     
+        # Local (and pilot) jobs are futures in this process: block on them directly
+        
+        if args["verbose"]:
+            print("Waiting for local jobs ", active_jobs, "...", args["job_name"])
+        
+        states = local_jobs.wait(active_jobs)
+        
+        for job in active_jobs:
+            if states[job] != "COMPLETED":
+                print("WARNING: Job", job, "(" + args["job_name"] + ") ended with state", states[job])
+                
+        print("Breaking ... ")
+        
+        return
 
     ################################
     # 1. Determine job status, hold until complete
     ################################
-
-    njobs  = len(active_jobs)
-
-    active = [True]*njobs
+    
+    interval = args["poll_min"]
+    polls    = 0
     
     while True:
     
-        for i in range(njobs):
-            check_job = ""
-            
-            if type(active_jobs[i]) == type(1):
-                active_jobs[i] = str(active_jobs[i])
+        queued = query_queue(active_jobs)
+        polls += 1
         
-            if args["job_system"] == "slurm":
-
-                check_job = "squeue -j " + active_jobs[i]
+        # Confirm that jobs missing from the queue have actually finished
+        
+        if (queued is None) or (len(queued) < len(active_jobs)):
+        
+            missing   = [job for job in active_jobs if (queued is None) or (job not in queued)]
+            accounted = query_accounting(missing)
             
-            elif args["job_system"] == "torque":
-                print("ERROR: torque support not yet implemented in wait_for_job")
-            else:
-                print("ERROR: Unknown job_system: ", args["job_system"])
-                exit()
+            if queued is None:
+                queued = {}
             
-            if active_jobs[i] in  run_bash_cmnd(check_job):
-                active[i] = True
-            else:
-                active[i] = False
+            for job in missing:
+                if (job in accounted) and (accounted[job][0] not in SLURM_FINAL_STATES):
+                    queued[job] = [accounted[job][0], None]
+                    
+        if len(queued) == 0:
+            break
             
+        # Poll again sooner if a job is expected to end before the next poll
+        
+        sleep = interval
+        
+        for job in queued:
+            if queued[job][1] is not None:
+                sleep = min(sleep, max(queued[job][1], 0) + args["poll_min"])
+
+        if args["verbose"]:
+            print("Sleeping for", sleep, "more seconds while waiting for jobs ", sorted(queued), "...", args["job_name"])
+    
+        time.sleep(sleep)
         
-        if True in active:
+        interval = min(2*interval, args["poll_max"])
+        
+    ################################
+    # 2. Report failures and time lost between the jobs ending and this poll
+    ################################
+    
+    detected  = time.time()
+    accounted = query_accounting(active_jobs)
+    
+    for job in active_jobs:
+        if (job in accounted) and (accounted[job][0] != "COMPLETED"):
+            print("WARNING: Job", job, "(" + args["job_name"] + ") ended with state", accounted[job][0])
+    
+    ends = [accounted[job][1] for job in active_jobs if (job in accounted) and (accounted[job][1] is not None)]
+    
+    JOB_WAIT_STATS[0] += 1
+    JOB_WAIT_STATS[1] += polls
+    
+    if len(ends) == len(active_jobs):
+    
+        lag = max(detected - max(ends), 0.0)
         
-            if args["verbose"]:
-                print("Sleeping for 60 more seconds while waiting for jobs ", active_jobs, "...", args["job_name"])
+        JOB_WAIT_STATS[2] += lag
         
-            time.sleep(60) # sleep for 60 seconds
-        else:        
-            print("Breaking ... ")
-            break                    
+        print("Jobs", args["job_name"], "finished", "%.0f" % lag, "s before being detected, after", polls, "squeue polls")
+    
+    print("Breaking ... ")
+    
     return
     
 
@@ -732,7 +1807,7 @@ def break_apart_xyz(*argv):
     #########
 
     # What is the input .xyz file?
-    XYZFILE = open(argv[1],"r")
+    XYZFILE = open_file(argv[1],"r")
 
     CHUNK_LEN = 1
     if len(argv) >= 3:
@@ -744,6 +1819,11 @@ def break_apart_xyz(*argv):
 
     #########
 
+    # Byte offsets of each frame, so skipped frames don't need to be read
+
+    if FIRST_ONLY:
+        OFFSETS = index_xyzframes(argv[1])[0]
+
     ZEROES = len(str(FRAMES))+1
 
     for f in range(FRAMES):
@@ -771,8 +1851,8 @@ def break_apart_xyz(*argv):
                     TAG += repr(f)
                     break
 
-            OUTFILE  = argv[1]
-            FORCES   = argv[1]
+            OUTFILE  = strip_compression(argv[1])
+            FORCES   = strip_compression(argv[1])
             TESTER   = OUTFILE [0:-4]
             TESTER   = TESTER  [-1]
 
@@ -788,28 +1868,17 @@ def break_apart_xyz(*argv):
             OFSTREAM = open(OUTFILE,"w")
             FRSTREAM = open(FORCES,"w")
             
-        if FIRST_ONLY and f%CHUNK_LEN > 0: # We still need to filter through ignored frames
-        
-            # Read the first line to get the number of atoms in the frame,
-            # print back out to the xyzf file
-        
-            ATOMS = XYZFILE.readline()
-        
-            ATOMS = ATOMS.split()
-        
-            ATOMS = int(ATOMS[0])
+        if FIRST_ONLY and f%CHUNK_LEN > 0: # Ignored frames are never read
         
-            # Read/print the comment line
-
-            XYZFILE.readline()
-
-            # Now, read/print each atom line
-        
-            for j in range(ATOMS):
-                XYZFILE.readline()
+            continue
                 
         else:
         
+            # Jump straight to the frame if the ones before it were skipped
+            
+            if FIRST_ONLY:
+                XYZFILE.seek(OFFSETS[f])
+        
             # Read the first line to get the number of atoms in the frame,
             # print back out to the xyzf file
         
@@ -844,11 +1913,11 @@ def break_apart_xyz(*argv):
 def xyz_to_dftbgen(xyzfile):
 
     frames   = count_xyzframes_general(xyzfile)
-    ifstream = open(xyzfile,'r')
+    ifstream = open_file(xyzfile,'r')
     
     # Write the .gen file
 
-    genfile  = '.'.join(xyzfile.split('.')[0:-1]) + ".gen"
+    genfile  = '.'.join(strip_compression(xyzfile).split('.')[0:-1]) + ".gen"
     ofstream = open(genfile,'w')
     
     for f in range(frames):
@@ -919,18 +1988,18 @@ def dftbgen_to_xyz(*argv):
     FRAMES = int(argv[0])
 
     # What is the input file?
-    IFSTREAM = open(argv[1],"r")
+    IFSTREAM = open_file(argv[1],"r")
 
     SKIP = 1
     if len(argv) == 3:
         SKIP = int(argv[2])
 
     # What is the outputfile
-    OUTFILE  = argv[1]
+    OUTFILE  = strip_compression(argv[1])
     OUTFILE  = OUTFILE[0:-4] + ".xyz" # replace ".gen" with ".xyz"
     OFSTREAM = open(OUTFILE,"w")
 
-    BOXFILE  = argv[1]
+    BOXFILE  = strip_compression(argv[1])
     BOXFILE  = BOXFILE[0:-4] + ".box" # replace ".gen" with ".xyz"
     BOXSTREAM = open(BOXFILE,"w")
 
@@ -0,0 +1,501 @@
+# Global (python) modules
+
+import os
+import time
+import shlex
+import atexit
+import subprocess
+import threading
+import concurrent.futures
+
+""" 
+
+Runs job scripts in a bounded pool of local processes, in place of a queueing
+system (HPC_SYSTEM = "local"), or inside one long-lived SLURM allocation
+(HPC_SYSTEM = "pilot"). 
+
+In pilot mode, scripts still run in the driver's process pool, but each job
+(or array task) is first given the number of whole nodes it requested from the
+allocation's free nodes, and its srun calls run as job steps of the pilot
+allocation, confined to those nodes. Nodes are handed out first-fit, in
+allocation order, and returned when the script exits, so many small jobs can
+pack onto the allocation at once while larger ones wait for enough free nodes.
+
+"""
+
+# Stand-ins for srun, mpirun, and mpiexec, added to the end of PATH for local
+# jobs, so generated job scripts run on machines without them
+
+LOCAL_LAUNCHERS = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utilities", "local_launchers"))
+
+# Maximum number of job scripts (or array tasks) run at once; see set_max_jobs
+
+MAX_JOBS = [os.cpu_count() or 1]
+
+# Submitted jobs: job id -> list of futures, one per (array) task. Ids are
+# synthetic, numbered from 1 in submission order, and only meaningful to this
+# driver process.
+
+LOCAL_JOBS = {}
+LOCAL_LOCK = threading.Lock()
+LOCAL_POOL = []
+
+# Pilot allocation: [job id, whether this driver submitted it, cores per node],
+# its nodes, and the nodes not currently given to a job. Empty unless 
+# start_pilot was called.
+
+PILOT       = []
+PILOT_NODES = []
+PILOT_FREE  = []
+PILOT_COND  = threading.Condition()
+
+
+def set_max_jobs(max_jobs):
+
+    """
+
+    Sets the number of job scripts the local backend runs at once
+
+    Usage: set_max_jobs(4)
+
+    Notes: Must be called before the first submission; the pool is created then.
+
+    """
+
+    MAX_JOBS[0] = max(1, int(max_jobs))
+
+
+def get_pool():
+
+    """
+
+    Returns the local process pool, creating it on first use
+
+    Usage: pool = get_pool()
+
+    """
+
+    with LOCAL_LOCK:
+
+        if len(LOCAL_POOL) == 0:
+            LOCAL_POOL.append(concurrent.futures.ThreadPoolExecutor(max_workers=MAX_JOBS[0]))
+
+    return LOCAL_POOL[0]
+
+
+def array_indices(spec):
+
+    """
+
+    Expands a SLURM array specification into a list of task indices
+
+    Usage: array_indices("0-9")       # Returns [0, 1, ..., 9]
+           array_indices("1,3,5-7")   # Returns [1, 3, 5, 6, 7]
+           array_indices("0-15:4%2")  # Returns [0, 4, 8, 12]
+
+    Notes: Throttles (%N) are ignored; the pool size already bounds concurrency.
+
+    """
+
+    indices = []
+
+    for item in spec.split('%')[0].split(','):
+
+        step = 1
+
+        if ':' in item:
+            item, step = item.split(':')
+            step = int(step)
+
+        if '-' in item:
+            first, last = item.split('-')
+            indices += list(range(int(first), int(last)+1, step))
+        else:
+            indices.append(int(item))
+
+    return indices
+
+
+def parse_options(options, job_file):
+
+    """
+
+    Reads the options the local backend honors from #SBATCH lines and sbatch-style options
+
+    Usage: opts = parse_options("--array=1,3", "run.cmd")
+
+    Notes: Returns a dictionary with "array" (list of indices, or None),
+           "dependency" (list of job ids), "output" (file for stdout and
+           stderr, default "stdoutmsg"), and the requested "nodes" and
+           "ntasks" (exported to the script as their SLURM variables). As with
+           sbatch, options override #SBATCH lines. All other options
+           (walltime, queue, account, ...) are accepted and ignored.
+
+    """
+
+    words = []
+
+    with open(job_file, "r") as ifstream:
+        for line in ifstream:
+            if line.startswith("#SBATCH"):
+                words += line.split()[1:]
+
+    words += shlex.split(options)
+
+    opts = {"array" : None, "dependency" : [], "output" : "stdoutmsg", "nodes" : "1", "ntasks" : "1"}
+
+    for i in range(len(words)):
+
+        if words[i].startswith("--array="):
+            opts["array"] = array_indices(words[i].split('=')[1])
+
+        elif words[i].startswith("--dependency="):
+
+            for condition in words[i].split('=')[1].split(','):
+                opts["dependency"] += condition.split(':')[1:]
+
+        elif (words[i] == "-o") and (i+1 < len(words)):
+            opts["output"] = words[i+1]
+
+        elif words[i].startswith("--output="):
+            opts["output"] = words[i].split('=')[1]
+
+        elif (words[i] == "-N") and (i+1 < len(words)):
+            opts["nodes"] = words[i+1]
+
+        elif (words[i] == "-n") and (i+1 < len(words)):
+            opts["ntasks"] = words[i+1]
+
+    return opts
+
+
+def expand_nodelist(nodelist):
+
+    """
+
+    Expands a SLURM node list into host names
+
+    Usage: expand_nodelist("node[1-3,7]") # Returns ["node1", "node2", "node3", "node7"]
+
+    """
+
+    return subprocess.check_output(["scontrol", "show", "hostnames", nodelist]).decode().split()
+
+
+def start_pilot(nodes=0, walltime="24:00:00", queue="pbatch", account="pbronze", ppn=36, poll=30):
+
+    """
+
+    Acquires the allocation that pilot-mode jobs run in
+
+    Usage: start_pilot(8, "24:00:00", "pbatch", "pbronze", 36)
+
+    Notes: If nodes is 0 and the driver is itself running inside a SLURM
+           allocation, that allocation is used. Otherwise an allocation of
+           the given size is requested with sbatch (the job just holds the
+           nodes), and this function blocks until it starts. A submitted
+           pilot is cancelled when the driver exits. ppn is the number of
+           cores per node, used to place job-step tasks on their nodes.
+
+    """
+
+    if (nodes == 0) and ("SLURM_JOB_ID" in os.environ):
+
+        PILOT.append([os.environ["SLURM_JOB_ID"], False, ppn])
+
+        nodelist = os.environ["SLURM_JOB_NODELIST"]
+
+        print("Running jobs inside the current allocation,", PILOT[0][0])
+
+    elif nodes == 0:
+
+        print("ERROR: Pilot mode requires HPC_PILOT_NODES, unless the driver is run inside an allocation")
+        exit()
+
+    else:
+
+        with open("pilot.cmd", "w") as ofstream:
+            ofstream.write("#!/bin/bash\n")
+            ofstream.write("#SBATCH -J ALC-pilot\n")
+            ofstream.write("#SBATCH -N " + str(nodes) + "\n")
+            ofstream.write("#SBATCH -t " + str(walltime) + "\n")
+            ofstream.write("#SBATCH -p " + queue + "\n")
+            ofstream.write("#SBATCH -A " + account + "\n")
+            ofstream.write("#SBATCH -o pilot.stdoutmsg\n")
+            ofstream.write("sleep infinity\n")
+
+        job_id = subprocess.check_output(["sbatch", "pilot.cmd"]).decode().split()[-1]
+
+        PILOT.append([job_id, True, ppn])
+
+        atexit.register(stop_pilot)
+
+        print("Submitted pilot job", job_id, "- waiting for it to start")
+
+        # Jobs can take a moment to appear in squeue; give up if the pilot
+        # stays missing or ends
+
+        missing = 0
+
+        while True:
+
+            try:
+                state = subprocess.check_output(["squeue", "-h", "-j", job_id, "-o", "%T %N"]).decode().split()
+            except subprocess.CalledProcessError:
+                state = []
+
+            if (len(state) > 1) and (state[0] == "RUNNING"):
+                nodelist = state[1]
+                break
+
+            if len(state) == 0:
+                missing += 1
+
+            if (missing > 10) or ((len(state) > 0) and (state[0] not in ["PENDING", "CONFIGURING", "RUNNING"])):
+                print("ERROR: Pilot job", job_id, "did not start")
+                exit()
+
+            time.sleep(poll)
+
+    with PILOT_COND:
+        PILOT_NODES.extend(expand_nodelist(nodelist))
+        PILOT_FREE .extend(PILOT_NODES)
+
+    set_max_jobs(len(PILOT_NODES))
+
+    print("Pilot allocation", PILOT[0][0], "has", len(PILOT_NODES), "nodes")
+
+
+def stop_pilot():
+
+    """
+
+    Releases the pilot allocation, if this driver submitted it
+
+    Usage: stop_pilot()
+
+    """
+
+    if (len(PILOT) > 0) and PILOT[0][1]:
+
+        subprocess.call(["scancel", PILOT[0][0]])
+
+        PILOT[0][1] = False
+
+
+def acquire_nodes(count):
+
+    """
+
+    Blocks until count pilot nodes are free, then takes them
+
+    Usage: nodes = acquire_nodes(2)
+
+    Notes: Requests for more nodes than the allocation has are given the
+           whole allocation. Free nodes are taken first-fit, in allocation
+           order.
+
+    """
+
+    count = max(1, min(count, len(PILOT_NODES)))
+
+    with PILOT_COND:
+
+        PILOT_COND.wait_for(lambda: len(PILOT_FREE) >= count)
+
+        nodes = PILOT_FREE[:count]
+
+        del PILOT_FREE[:count]
+
+    return nodes
+
+
+def release_nodes(nodes):
+
+    """
+
+    Returns pilot nodes taken with acquire_nodes
+
+    Usage: release_nodes(nodes)
+
+    """
+
+    with PILOT_COND:
+
+        PILOT_FREE.extend(nodes)
+        PILOT_FREE.sort(key=PILOT_NODES.index)
+
+        PILOT_COND.notify_all()
+
+
+def job_state(job_id):
+
+    """
+
+    Returns the state of a local job, using SLURM state names
+
+    Usage: job_state("3") # Returns e.g. "RUNNING" or "COMPLETED"
+
+    Notes: Array jobs report FAILED if any task failed. Unknown ids (e.g.
+           jobs from before a driver restart) report COMPLETED, matching
+           how wait_for_jobs treats jobs that have left the queue.
+
+    """
+
+    with LOCAL_LOCK:
+        futures = LOCAL_JOBS.get(str(job_id), [])
+
+    if not all([future.done() for future in futures]):
+
+        if any([future.running() for future in futures]):
+            return "RUNNING"
+
+        return "PENDING"
+
+    states = [future.result() for future in futures]
+
+    for state in ["FAILED", "CANCELLED"]:
+        if state in states:
+            return state
+
+    return "COMPLETED"
+
+
+def run_task(job_id, job_file, job_args, work_dir, opts, task):
+
+    """
+
+    Runs a single job script (or array task), once its dependencies succeed
+
+    Usage: Called from the pool by submit; returns the task's final state.
+
+    Notes: Mirrors --dependency=afterok with --kill-on-invalid-dep=yes: if a
+           dependency did not complete, the task is cancelled without running.
+           Dependencies are always submitted earlier, so they are ahead in the
+           pool's queue, and waiting on them can't deadlock.
+
+    """
+
+    for job in opts["dependency"]:
+
+        with LOCAL_LOCK:
+            futures = LOCAL_JOBS.get(job, [])
+
+        concurrent.futures.wait(futures)
+
+        if job_state(job) != "COMPLETED":
+            return "CANCELLED"
+
+    env = os.environ.copy()
+
+    env["SLURM_JOB_ID"]            = job_id
+    env["SLURM_JOB_NUM_NODES"]     = opts["nodes"]
+    env["SLURM_NTASKS"]            = opts["ntasks"]
+    env["SLURM_NPROCS"]            = opts["ntasks"]
+    env["SLURM_JOB_CPUS_PER_NODE"] = opts["ntasks"]
+
+    if task is not None:
+        env["SLURM_ARRAY_JOB_ID"]  = job_id
+        env["SLURM_ARRAY_TASK_ID"] = str(task)
+
+    nodes = []
+
+    if len(PILOT) == 0:
+        env["PATH"] = env.get("PATH", "") + os.pathsep + LOCAL_LAUNCHERS
+
+    if len(PILOT) > 0:
+
+        # srun calls in the script become steps of the pilot allocation,
+        # with their tasks placed (in order) on this job's nodes
+
+        nodes    = acquire_nodes(int(opts["nodes"]))
+        hostfile = os.path.join(work_dir, ".pilot_hosts." + job_id + "." + str(task))
+
+        with open(hostfile, "w") as ofstream:
+            for node in nodes:
+                ofstream.write((node + '\n')*PILOT[0][2])
+
+        env["SLURM_JOB_ID"]        = PILOT[0][0]
+        env["SLURM_JOB_NODELIST"]  = ','.join(nodes)
+        env["SLURM_JOB_NUM_NODES"] = str(len(nodes))
+        env["SLURM_NNODES"]        = str(len(nodes))
+        env["SLURM_HOSTFILE"]      = hostfile
+        env["SLURM_DISTRIBUTION"]  = "arbitrary"
+
+    try:
+
+        with open(os.path.join(work_dir, opts["output"]), "a") as ofstream:
+
+            status = subprocess.call(["bash", job_file] + shlex.split(job_args), cwd=work_dir, env=env, stdout=ofstream, stderr=subprocess.STDOUT)
+
+    finally:
+
+        if len(nodes) > 0:
+            release_nodes(nodes)
+            os.remove(hostfile)
+
+    if status != 0:
+        return "FAILED"
+
+    return "COMPLETED"
+
+
+def submit(job_file, options="", job_args=""):
+
+    """
+
+    Queues a job script to run in the local process pool
+
+    Usage: job_id = submit("run.cmd", "--array=0-3", "arg1 arg2")
+
+    Notes: Drop-in for "sbatch <options> <job_file> <job_args>": the script
+           runs with bash in the current directory, writing its output to the
+           -o file, and the synthetic job id is returned as a string. Array
+           jobs queue one process per task, each with $SLURM_ARRAY_TASK_ID
+           set. In local mode, srun, mpirun, and mpiexec fall back to the
+           stand-ins in LOCAL_LAUNCHERS (which run the command once, without
+           MPI) if not installed, and the executables named in the config
+           must run on the local machine; in pilot mode, the script's srun
+           calls run on the job's share of the allocation.
+
+    """
+
+    opts     = parse_options(options, job_file)
+    work_dir = os.getcwd()
+    pool     = get_pool()
+
+    with LOCAL_LOCK:
+
+        job_id = str(len(LOCAL_JOBS) + 1)
+
+        tasks = opts["array"]
+
+        if tasks is None:
+            tasks = [None]
+
+        LOCAL_JOBS[job_id] = [pool.submit(run_task, job_id, job_file, job_args, work_dir, opts, task) for task in tasks]
+
+    return job_id
+
+
+def wait(job_ids):
+
+    """
+
+    Blocks until the given local jobs finish
+
+    Usage: states = wait(["1", "2"])
+
+    Notes: Returns a dictionary of final states, keyed by job id.
+
+    """
+
+    futures = []
+
+    with LOCAL_LOCK:
+        for job in job_ids:
+            futures += LOCAL_JOBS.get(str(job), [])
+
+    concurrent.futures.wait(futures)
+
+    return dict([(str(job), job_state(job)) for job in job_ids])
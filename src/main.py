@@ -1,11 +1,14 @@
 # Global (python) modules
 
 import os
+import glob
 import sys
 
 # Local modules
 
 import helpers
+import fileops
+import local_jobs
 import gen_ff
 import run_md
 import cluster
@@ -17,7 +20,7 @@ import pretty_stuff
 
 # Allow config file to be read from local directory
 
-local_path = os.path.normpath(helpers.run_bash_cmnd("pwd").rstrip())
+local_path = os.path.normpath(fileops.pwd().rstrip())
 sys.path.append(local_path)
 import config  # User-specified "global" vars
 
@@ -124,6 +127,11 @@ def main(args):
     
     verify_config.verify(config)
     
+    if config.HPC_SYSTEM == "local":
+        local_jobs.set_max_jobs(config.HPC_NJOBS)
+    elif config.HPC_SYSTEM == "pilot":
+        local_jobs.start_pilot(config.HPC_PILOT_NODES, config.HPC_PILOT_TIME, config.HPC_PILOT_QUEUE, config.HPC_ACCOUNT, config.HPC_PPN)
+    
     print("The following has been set as the working directory:")
     print('\t', config.WORKING_DIR)
     print("The ALC-X contents of this directory will be overwritten.")
@@ -209,6 +217,10 @@ def main(args):
         os.chdir(config.WORKING_DIR)
         
 
+        # Set if the A-matrix solve is chained onto the build job, and has completed
+
+        solve_chained = False
+
         # Begins in the working directory (WORKING_DIR)
 
         if THIS_ALC == 0: # Then this is the first ALC, so we need to do things a bit differently ... 
@@ -218,8 +230,8 @@ def main(args):
 
                 # Set up/move into the ALC directory
             
-                helpers.run_bash_cmnd("rm -rf ALC-" + str(THIS_ALC))
-                helpers.run_bash_cmnd("mkdir  ALC-" + str(THIS_ALC))
+                fileops.rm_rf("ALC-" + str(THIS_ALC))
+                fileops.mkdir("ALC-" + str(THIS_ALC))
             
             os.chdir("ALC-" + str(THIS_ALC))
             
@@ -228,6 +240,29 @@ def main(args):
             # Generate the force field    
             ################################
             
+            # Arguments for the A-matrix solve, which may be chained onto the build job
+            
+            solve_args = dict(
+                    weights_set_alc_0  = config.WEIGHTS_SET_ALC_0,
+                    weights_alc_0      = config.WEIGHTS_ALC_0,
+                    weights_force      = config.WEIGHTS_FORCE,
+                    weights_force_gas  = config.WEIGHTS_FGAS,
+                    weights_energy     = config.WEIGHTS_ENER,
+                    weights_energy_gas = config.WEIGHTS_EGAS,
+                    weights_stress     = config.WEIGHTS_STRES,
+                    regression_alg     = config.REGRESS_ALG,
+                    regression_nrm     = config.REGRESS_NRM,
+                    regression_var     = config.REGRESS_VAR,
+                    job_email          = config.HPC_EMAIL,
+                    job_ppn            = str(config.HPC_PPN),
+                    node_ppn           = config.HPC_PPN,
+                    job_nodes          = config.CHIMES_SOLVE_NODES,
+                    job_walltime       = config.CHIMES_SOLVE_TIME,    
+                    job_queue          = config.CHIMES_SOLVE_QUEUE,                    
+                    job_account        = config.HPC_ACCOUNT, 
+                    job_system         = config.HPC_SYSTEM,
+                    job_executable     = config.CHIMES_SOLVER)
+            
             if not restart_controller.BUILD_AMAT:
             
                 # Note: Stress tensor inclusion controlled by contents of config.ALC0_FILES
@@ -241,6 +276,11 @@ def main(args):
                         correction_files   = config.CORRECTED_TYPE_FILES,
                         correction_exe     = config.CORRECTED_TYPE_EXE,
                         correction_temps   = config.CORRECTED_TEMPS_BY_FILE,                        
+                        subtract_nprocs    = config.SUBTRACT_NPROCS,
+                        subtract_launcher  = config.SUBTRACT_LAUNCHER,
+                        subtract_cache     = config.SUBTRACT_CACHE,
+                        subtract_cache_size= config.SUBTRACT_CACHE_SIZE,
+                        subtract_warm_start= config.SUBTRACT_WARM_START,
                         prev_gen_path      = config.ALC0_FILES,
                         job_email          = config.HPC_EMAIL,
                         job_ppn            = str(config.HPC_PPN),
@@ -251,7 +291,17 @@ def main(args):
                         job_system         = config.HPC_SYSTEM,
                         job_executable     = config.CHIMES_LSQ)
                         
-                helpers.wait_for_job(active_job, job_system = config.HPC_SYSTEM, verbose = True, job_name = "build_amat")
+                if config.HPC_CHAIN:
+                
+                    # Submit the solve job now, held until the build job succeeds, and only wake up once both are done
+                
+                    solve_job = gen_ff.solve_amat(THIS_ALC, job_dependency = active_job, local_python = config.HPC_PYTHON, driver_dir = config.DRIVER_DIR, **solve_args)
+                    
+                    helpers.wait_for_jobs([active_job, solve_job], job_system = config.HPC_SYSTEM, verbose = True, job_name = "build_amat + solve_amat")
+                    
+                    solve_chained = gen_ff.solve_amat_completed()
+                else:
+                    helpers.wait_for_job(active_job, job_system = config.HPC_SYSTEM, verbose = True, job_name = "build_amat")
 
                 restart_controller.update_file("BUILD_AMAT: COMPLETE" + '\n')
                 
@@ -261,30 +311,11 @@ def main(args):
 
             if not restart_controller.SOLVE_AMAT:
             
-                if not gen_ff.solve_amat_started(): 
+                if (not solve_chained) and (not gen_ff.solve_amat_started()):
                 
                     print("Starting solve_amat from scratch")            
             
-                    active_job = gen_ff.solve_amat(THIS_ALC, 
-                        weights_set_alc_0  = config.WEIGHTS_SET_ALC_0,
-                        weights_alc_0      = config.WEIGHTS_ALC_0,
-                        weights_force      = config.WEIGHTS_FORCE,
-                        weights_force_gas  = config.WEIGHTS_FGAS,
-                        weights_energy     = config.WEIGHTS_ENER,
-                        weights_energy_gas = config.WEIGHTS_EGAS,
-                        weights_stress     = config.WEIGHTS_STRES,
-                        regression_alg     = config.REGRESS_ALG,
-                        regression_nrm     = config.REGRESS_NRM,
-                        regression_var     = config.REGRESS_VAR,
-                        job_email          = config.HPC_EMAIL,
-                        job_ppn            = str(config.HPC_PPN),
-                        node_ppn           = config.HPC_PPN,
-                        job_nodes          = config.CHIMES_SOLVE_NODES,
-                        job_walltime       = config.CHIMES_SOLVE_TIME,    
-                        job_queue          = config.CHIMES_SOLVE_QUEUE,                    
-                        job_account        = config.HPC_ACCOUNT, 
-                        job_system         = config.HPC_SYSTEM,
-                        job_executable     = config.CHIMES_SOLVER)    
+                    active_job = gen_ff.solve_amat(THIS_ALC, **solve_args)
                         
                     helpers.wait_for_job(active_job, job_system = config.HPC_SYSTEM, verbose = True, job_name = "solve_amat")
 
@@ -332,7 +363,7 @@ def main(args):
 
                     helpers.run_bash_cmnd(config.CHIMES_POSTPRC + " hierarch.params.txt")
                     
-                    helpers.run_bash_cmnd("mv  hierarch.params.txt.reduced GEN_FF/params.txt.reduced")
+                    fileops.mv("hierarch.params.txt.reduced GEN_FF/params.txt.reduced")
                     
                 else:
                     helpers.run_bash_cmnd(config.CHIMES_POSTPRC + " GEN_FF/params.txt")
@@ -381,7 +412,7 @@ def main(args):
                     
                     repo = "CFG_REPO-" + traj_files[i].split()[0]
                     
-                    helpers.run_bash_cmnd("mv CFG_REPO " + repo)
+                    fileops.mv("CFG_REPO " + repo)
                     
                     # list
                     
@@ -391,8 +422,8 @@ def main(args):
                     else:
                         cluster.list_clusters(repo, config.ATOM_TYPES)
                                         
-                    helpers.run_bash_cmnd("mv xyzlist.dat    " + traj_files[i].split()[0] + ".xyzlist.dat"   )
-                    helpers.run_bash_cmnd("mv ts_xyzlist.dat " + traj_files[i].split()[0] + ".ts_xyzlist.dat")
+                    fileops.mv("xyzlist.dat    " + traj_files[i].split()[0] + ".xyzlist.dat")
+                    fileops.mv("ts_xyzlist.dat " + traj_files[i].split()[0] + ".ts_xyzlist.dat")
                     
                     cat_xyzlist_cmnd    += traj_files[i].split()[0] + ".xyzlist.dat "
                     cat_ts_xyzlist_cmnd += traj_files[i].split()[0] + ".ts_xyzlist.dat "
@@ -400,8 +431,8 @@ def main(args):
                 helpers.cat_specific("xyzlist.dat"   , cat_xyzlist_cmnd   .split())
                 helpers.cat_specific("ts_xyzlist.dat", cat_ts_xyzlist_cmnd.split())
 
-                helpers.run_bash_cmnd("rm -f " + cat_xyzlist_cmnd   )
-                helpers.run_bash_cmnd("rm -f " + cat_ts_xyzlist_cmnd)
+                fileops.rm(cat_xyzlist_cmnd)
+                fileops.rm(cat_ts_xyzlist_cmnd)
                 
                 restart_controller.update_file("CLUSTER_EXTRACTION: COMPLETE" + '\n')
                 
@@ -425,11 +456,12 @@ def main(args):
                         job_cent_walltime = str(config.CALC_REPO_ENER_CENT_TIME), 
                         job_account    = config.HPC_ACCOUNT, 
                         job_system     = config.HPC_SYSTEM,
-                        job_executable = config.CHIMES_MD_SER)    
+                        job_executable = config.CHIMES_MD_SER,
+                        local_python   = config.HPC_PYTHON)    
                         
                 helpers.wait_for_jobs(active_jobs, job_system = config.HPC_SYSTEM, verbose = True, job_name = "get_repo_energies")
             
-                print(helpers.run_bash_cmnd("pwd"))
+                print(fileops.pwd())
                 print(helpers.run_bash_cmnd("ls -lrt"))    
             
                 restart_controller.update_file("CLUENER_CALC: COMPLETE" + '\n')    
@@ -451,7 +483,11 @@ def main(args):
                         nsweep   = config.MEM_CYCL, # Number of MC sqeeps          
                         nbins    = config.MEM_BINS, # Number of histogram bins      
                         ecut     = config.MEM_ECUT, # Maximum energy to consider
-                        seed     = config.SEED    ) # Seed for random number generator    
+                        seed     = config.SEED,     # Seed for random number generator    
+                        conv_tol = config.MEM_CONV_TOL, # Relative SSQR change at which to stop early
+                        conv_win = config.MEM_CONV_WIN, # Sweeps over which SSQR change is measured
+                        max_time = config.MEM_MAX_TIME, # Wall time budget for MC sweeps
+                        nchains  = config.MEM_NCHAINS) # Number of MC chains to run in parallel
             
                 gen_selections.populate_repo(THIS_ALC)
 
@@ -498,6 +534,7 @@ def main(args):
                         VASP_nodes     = config.VASP_NODES,
                         VASP_time      = config.VASP_TIME,
                         VASP_queue     = config.VASP_QUEUE,
+                        VASP_array     = config.VASP_ARRAY,
                         VASP_modules   = config.VASP_MODULES,
                         DFTB_nodes     = config.DFTB_NODES,  
                         DFTB_ppn       = config.DFTB_PPN,    
@@ -607,6 +644,9 @@ def main(args):
 
             os.chdir("..")
             
+            helpers.print_cmnd_summary("THIS_ALC")
+            fileops.print_stats()
+            
             print("ALC-", THIS_ALC, "is complete")    
             
             restart_controller.update_file("THIS_ALC: COMPLETE" + '\n')
@@ -619,8 +659,8 @@ def main(args):
 
                 # Set up/move into the ALC directory
             
-                helpers.run_bash_cmnd("rm -rf ALC-" + str(THIS_ALC))
-                helpers.run_bash_cmnd("mkdir  ALC-" + str(THIS_ALC))
+                fileops.rm_rf("ALC-" + str(THIS_ALC))
+                fileops.mkdir("ALC-" + str(THIS_ALC))
             
             os.chdir("ALC-" + str(THIS_ALC))
             
@@ -647,6 +687,30 @@ def main(args):
                     print("Error in main driver while building Amat: unkown BULK QM method:", config.BULK_QM_METHOD)
                     exit()
 
+            # Arguments for the A-matrix solve, which may be chained onto the build job
+            
+            solve_args = dict(
+                    do_cluster       = config.DO_CLUSTER,
+                    weights_set_alc_0  = config.WEIGHTS_SET_ALC_0,
+                    weights_alc_0      = config.WEIGHTS_ALC_0,                        
+                    weights_force      = config.WEIGHTS_FORCE,
+                    weights_force_gas  = config.WEIGHTS_FGAS,
+                    weights_energy     = config.WEIGHTS_ENER,
+                    weights_energy_gas = config.WEIGHTS_EGAS,
+                    weights_stress     = config.WEIGHTS_STRES,
+                    regression_alg     = config.REGRESS_ALG,
+                    regression_nrm     = config.REGRESS_NRM,
+                    regression_var     = config.REGRESS_VAR,    
+                    job_email          = config.HPC_EMAIL,                    
+                    job_ppn            = config.CHIMES_SOLVE_PPN,
+                    node_ppn           = config.HPC_PPN,
+                    job_nodes          = config.CHIMES_SOLVE_NODES,
+                    job_walltime       = config.CHIMES_SOLVE_TIME,    
+                    job_queue          = config.CHIMES_SOLVE_QUEUE,                            
+                    job_account        = config.HPC_ACCOUNT, 
+                    job_system         = config.HPC_SYSTEM,
+                    job_executable     = config.CHIMES_SOLVER)
+            
             if not restart_controller.BUILD_AMAT:
             
                 do_stress = False
@@ -665,6 +729,11 @@ def main(args):
                             correction_files   = config.CORRECTED_TYPE_FILES,
                             correction_exe     = config.CORRECTED_TYPE_EXE,                            
                             correction_temps   = config.CORRECTED_TEMPS_BY_FILE,                            
+                            subtract_nprocs    = config.SUBTRACT_NPROCS,
+                            subtract_launcher  = config.SUBTRACT_LAUNCHER,
+                            subtract_cache     = config.SUBTRACT_CACHE,
+                            subtract_cache_size= config.SUBTRACT_CACHE_SIZE,
+                            subtract_warm_start= config.SUBTRACT_WARM_START,
                             do_cluster         = config.DO_CLUSTER,
                             prev_gen_path      = config.ALC0_FILES,
                             job_email          = config.HPC_EMAIL,
@@ -688,6 +757,11 @@ def main(args):
                         correction_files   = config.CORRECTED_TYPE_FILES,
                         correction_exe     = config.CORRECTED_TYPE_EXE,                            
                         correction_temps   = config.CORRECTED_TEMPS_BY_FILE,                        
+                        subtract_nprocs    = config.SUBTRACT_NPROCS,
+                        subtract_launcher  = config.SUBTRACT_LAUNCHER,
+                        subtract_cache     = config.SUBTRACT_CACHE,
+                        subtract_cache_size= config.SUBTRACT_CACHE_SIZE,
+                        subtract_warm_start= config.SUBTRACT_WARM_START,
                         do_cluster       = config.DO_CLUSTER,
                         include_stress   = do_stress,    
                         stress_style     = config.STRS_STYLE,
@@ -700,7 +774,17 @@ def main(args):
                         job_system       = config.HPC_SYSTEM,
                         job_executable   = config.CHIMES_LSQ)
             
-                helpers.wait_for_job(active_job, job_system = config.HPC_SYSTEM, verbose = True, job_name = "build_amat")
+                if config.HPC_CHAIN:
+                
+                    # Submit the solve job now, held until the build job succeeds, and only wake up once both are done
+                
+                    solve_job = gen_ff.solve_amat(THIS_ALC, job_dependency = active_job, local_python = config.HPC_PYTHON, driver_dir = config.DRIVER_DIR, **solve_args)
+                    
+                    helpers.wait_for_jobs([active_job, solve_job], job_system = config.HPC_SYSTEM, verbose = True, job_name = "build_amat + solve_amat")
+                    
+                    solve_chained = gen_ff.solve_amat_completed()
+                else:
+                    helpers.wait_for_job(active_job, job_system = config.HPC_SYSTEM, verbose = True, job_name = "build_amat")
             
                 restart_controller.update_file("BUILD_AMAT: COMPLETE" + '\n')
                 
@@ -714,31 +798,11 @@ def main(args):
                 # Check whether we have previously started 
                 # only works for dlasso/dlars... for all other algorithms, assumes false
             
-                if not gen_ff.solve_amat_started(): 
+                if (not solve_chained) and (not gen_ff.solve_amat_started()):
                 
                     print("Starting solve_amat from scratch")
             
-                    active_job = gen_ff.solve_amat(THIS_ALC, 
-                        do_cluster       = config.DO_CLUSTER,
-                        weights_set_alc_0  = config.WEIGHTS_SET_ALC_0,
-                        weights_alc_0      = config.WEIGHTS_ALC_0,                        
-                        weights_force      = config.WEIGHTS_FORCE,
-                        weights_force_gas  = config.WEIGHTS_FGAS,
-                        weights_energy     = config.WEIGHTS_ENER,
-                        weights_energy_gas = config.WEIGHTS_EGAS,
-                        weights_stress     = config.WEIGHTS_STRES,
-                        regression_alg     = config.REGRESS_ALG,
-                        regression_nrm     = config.REGRESS_NRM,
-                        regression_var     = config.REGRESS_VAR,    
-                        job_email          = config.HPC_EMAIL,                    
-                        job_ppn            = config.CHIMES_SOLVE_PPN,
-                        node_ppn           = config.HPC_PPN,
-                        job_nodes          = config.CHIMES_SOLVE_NODES,
-                        job_walltime       = config.CHIMES_SOLVE_TIME,    
-                        job_queue          = config.CHIMES_SOLVE_QUEUE,                            
-                        job_account        = config.HPC_ACCOUNT, 
-                        job_system         = config.HPC_SYSTEM,
-                        job_executable     = config.CHIMES_SOLVER)    
+                    active_job = gen_ff.solve_amat(THIS_ALC, **solve_args)
                         
                     helpers.wait_for_job(active_job, job_system = config.HPC_SYSTEM, verbose = True, job_name = "solve_amat")
                 
@@ -780,7 +844,7 @@ def main(args):
                 if config.DO_HIERARCH:
                     gen_ff.combine("GEN_FF/params.txt", config.HIERARCH_PARAM_FILES)    
                     helpers.run_bash_cmnd(config.CHIMES_POSTPRC + " hierarch.params.txt")                    
-                    helpers.run_bash_cmnd("mv  hierarch.params.txt.reduced GEN_FF/params.txt.reduced")                
+                    fileops.mv("hierarch.params.txt.reduced GEN_FF/params.txt.reduced")
                 else:
                     
                     helpers.run_bash_cmnd(config.CHIMES_POSTPRC + " GEN_FF/params.txt")
@@ -827,7 +891,7 @@ def main(args):
                         job_queue      = config.MD_QUEUE[THIS_CASE],      
                         job_account    = config.HPC_ACCOUNT, 
                         job_executable = config.CHIMES_MD_MPI,     
-                        job_system     = "slurm",       
+                        job_system     = config.HPC_SYSTEM,       
                         job_file       = "run.cmd")
                         
         
@@ -867,6 +931,13 @@ def main(args):
             else:
                 restart_controller.update_file("POST_PROC: COMPLETE" + '\n')    
                 
+            if config.COMPRESS_OUTPUTS:
+            
+                # MD trajectories have been fully consumed by post-processing
+                
+                for THIS_CASE in range(config.NO_CASES):
+                    helpers.compress_file("CASE-" + str(THIS_CASE) + "_INDEP_" + str(THIS_INDEP) + "/traj.gen", "." + config.COMPRESS_OUTPUTS)
+                
                 
             if config.DO_CLUSTER:
             
@@ -887,8 +958,8 @@ def main(args):
                         else:
                             cluster.list_clusters(repo, config.ATOM_TYPES)        
                 
-                            helpers.run_bash_cmnd("mv xyzlist.dat     " + "CASE-" + str(THIS_CASE) + ".xyzlist.dat"   )
-                            helpers.run_bash_cmnd("mv ts_xyzlist.dat " + "CASE-" + str(THIS_CASE) + ".ts_xyzlist.dat")
+                            fileops.mv("xyzlist.dat     " + "CASE-" + str(THIS_CASE) + ".xyzlist.dat")
+                            fileops.mv("ts_xyzlist.dat " + "CASE-" + str(THIS_CASE) + ".ts_xyzlist.dat")
                 
                             cat_xyzlist_cmnd    += "CASE-" + str(THIS_CASE) + ".xyzlist.dat "
                             cat_ts_xyzlist_cmnd += "CASE-" + str(THIS_CASE) + ".ts_xyzlist.dat "
@@ -896,8 +967,8 @@ def main(args):
                     helpers.cat_specific("xyzlist.dat"   , cat_xyzlist_cmnd   .split())
                     helpers.cat_specific("ts_xyzlist.dat", cat_ts_xyzlist_cmnd.split())
                 
-                    helpers.run_bash_cmnd("rm -f " + cat_xyzlist_cmnd   )
-                    helpers.run_bash_cmnd("rm -f " + cat_ts_xyzlist_cmnd)
+                    fileops.rm(cat_xyzlist_cmnd)
+                    fileops.rm(cat_ts_xyzlist_cmnd)
                     
                     restart_controller.update_file("CLUSTER_EXTRACTION: COMPLETE" + '\n')    
                     
@@ -924,7 +995,8 @@ def main(args):
                             job_cent_walltime = str(config.CALC_REPO_ENER_CENT_TIME), 
                             job_account    = config.HPC_ACCOUNT, 
                             job_system     = config.HPC_SYSTEM,
-                            job_executable = config.CHIMES_MD_SER)    
+                            job_executable = config.CHIMES_MD_SER,
+                            local_python   = config.HPC_PYTHON)    
                             
                     helpers.wait_for_jobs(active_jobs, job_system = config.HPC_SYSTEM, verbose = True, job_name = "get_repo_energies")
                 
@@ -944,7 +1016,11 @@ def main(args):
                              nsel      = config.MEM_NSEL, # Number of selections to make    
                              nsweep   = config.MEM_CYCL, # Number of MC sqeeps           
                              nbins    = config.MEM_BINS, # Number of histogram bins      
-                             ecut      = config.MEM_ECUT) # Maximum energy to consider    
+                             ecut      = config.MEM_ECUT, # Maximum energy to consider    
+                             conv_tol  = config.MEM_CONV_TOL, # Relative SSQR change at which to stop early
+                             conv_win  = config.MEM_CONV_WIN, # Sweeps over which SSQR change is measured
+                             max_time  = config.MEM_MAX_TIME, # Wall time budget for MC sweeps
+                             nchains   = config.MEM_NCHAINS) # Number of MC chains to run in parallel
                              
                     gen_selections.populate_repo(THIS_ALC)   
                              
@@ -1000,6 +1076,7 @@ def main(args):
                         VASP_ppn       = config.VASP_PPN,
                         VASP_time      = config.VASP_TIME,
                         VASP_queue     = config.VASP_QUEUE,
+                        VASP_array     = config.VASP_ARRAY,
                         DFTB_exe       = config.DFTB_EXE,
                         DFTB_nodes     = config.DFTB_NODES,
                         DFTB_ppn       = config.DFTB_PPN,
@@ -1134,6 +1211,16 @@ def main(args):
                         
             os.chdir("..")
             
+            if config.COMPRESS_OUTPUTS:
+            
+                # The previous ALC's combined fitting data have been consumed by this ALC's fit
+            
+                for comb_file in sorted(glob.glob("ALC-" + str(THIS_ALC-1) + "/GEN_FF/*_comb.*")):
+                    helpers.compress_file(comb_file, "." + config.COMPRESS_OUTPUTS)
+            
+            helpers.print_cmnd_summary("THIS_ALC")
+            fileops.print_stats()
+            
             print("ALC-", THIS_ALC, "is complete")    
             
             restart_controller.update_file("THIS_ALC: COMPLETE" + '\n')    
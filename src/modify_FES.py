@@ -1,8 +1,17 @@
+import os
 import sys
+import shutil
+import concurrent.futures
 import helpers
+import fes_cache
+import xyzf_store
 import chimes_modify_FES
 import dftbplus_modify_FES
 
+# Consecutive frames per worker task, when warm starting single points
+
+WARM_START_BLOCK = 20
+
 def clean_up(method):
     
     if method == "CHIMES":
@@ -13,12 +22,21 @@ def clean_up(method):
         print("ERROR: Unknown method in modify_FES.py:",method)
 
 
-def write_full_FES(traj_files):
+def write_full_FES(traj_files, stores=None):
 
     """
     
     Creates a b-labeled.txt file for a given set of trajectories
     
+    Usage: write_full_FES(["traj-1.xyzf", "traj-2.xyzf",...])
+           write_full_FES(["traj-1.xyzf", "traj-2.xyzf",...], ["traj-1.store", None,...])
+    
+    Notes: stores optionally lists a binary store (see xyzf_store) for each
+           trajectory. Forces, stresses, and energies are then read from its
+           arrays rather than parsed from the text file, with the same 
+           output. Stores that are missing or older than their trajectory
+           are ignored.
+    
     """
     
     kcalpermolAng2HperB = 1/627.50960803/1.889725989 # Multiply a value in kcal/mol/Ang by this to get H/B
@@ -32,20 +50,33 @@ def write_full_FES(traj_files):
         print("\tOpening file:", "b-labeled_full.traj_file_idx-" + str(i)  + ".dat")
         helpers.run_bash_cmnd("rm -f b-labeled_full.traj_file_idx-" + str(i)  + ".dat")
         full = open("b-labeled_full.traj_file_idx-" + str(i)  + ".dat",'a')
+        
+        if (stores is not None) and (stores[i] is not None):
+        
+            if xyzf_store.is_current(stores[i], traj_files[i]):
             
-        # Figure out what options the target .xyzf file has
+                print("\tReading from store:", stores[i])
+                write_full_FES_store(full, xyzf_store.load_store(stores[i]))
+                full.close()
+                continue
+                
+            print("WARNING: Ignoring missing or out of date store:", stores[i], "for file:", traj_files[i])
+            
+        # Figure out the frame count, atoms per frame, and header format of the target .xyzf file
     
-        box_type, stress_type, energy_type = get_format(traj_files[i])
+        nframes, natoms_per_frame, file_format, truncated = helpers.scan_xyzframes(traj_files[i])
+        
+        box_type, stress_type, energy_type = file_format
+        
+        if truncated:
+            print("WARNING: Ignoring partially printed last frame of file:", traj_files[i])
     
         # Process file frame by frame...
         
-        natoms_per_frame = helpers.list_natoms(traj_files[i])
-        nframes          = helpers.count_xyzframes_general(traj_files[i])
-        
         ener = [None]*nframes
         sxx  = [None]*nframes; syy = [None]*nframes; szz = [None]*nframes; sxy = [None]*nframes; sxz = [None]*nframes; syz = [None]*nframes;
 
-        start_line = 0
+        frames = helpers.iter_xyzframes(traj_files[i])
 
         for j in range(nframes):
     
@@ -55,11 +86,7 @@ def write_full_FES(traj_files):
 
             # Parse and store info from the input.xyzf file
     
-            nlines = 2+natoms_per_frame[j]
-
-            contents = helpers.readlines(traj_files[i],start_line, start_line+nlines)
-                        
-            start_line += nlines
+            contents = next(frames)
             
             boxline = contents[1].split()
             
@@ -103,11 +130,150 @@ def write_full_FES(traj_files):
         full.close()
 
 
-def subtract_off(param_file, md_driver, method, traj_files, temper_files=None):
+def write_full_FES_store(full, store):
 
     """
     
-    Subtracts force/energy/stress contributions predicted by a model specified in param_file, 
+    Writes the b-labeled.txt contents of a trajectory from its binary store
+    
+    Usage: Called by write_full_FES, as write_full_FES_store(open_file, xyzf_store.load_store("traj.store"))
+    
+    Notes: Matches write_full_FES's text output exactly; values are 
+           converted to python floats so they print the same way.
+    
+    """
+
+    kcalpermolAng2HperB = 1/627.50960803/1.889725989 # Multiply a value in kcal/mol/Ang by this to get H/B
+    
+    from_GPa = 6.9479
+    
+    symbols = store["elements"].tolist()
+    
+    for j in range(len(store["natoms"])):
+    
+        nstress    = store["layout"][j][1]
+        has_energy = store["layout"][j][2]
+        stress     = store["stress"][j].tolist()
+        
+        ener = None
+        sxx  = None; syy = None; szz = None; sxy = None; sxz = None; syz = None
+        
+        if has_energy:
+            ener = store["energy"][j].item()
+    
+        if nstress == 6:
+            sxy, sxz, syz = stress[3:]
+    
+        if nstress != 0:
+            sxx, syy, szz = stress[:3]
+            
+        start = store["offsets"][j]
+        end   = store["offsets"][j+1]
+        
+        types  = store["types"][start:end].tolist()
+        forces = (store["forces"][start:end]/kcalpermolAng2HperB).tolist()
+        
+        for k in range(len(types)):
+        
+            full.write(symbols[types[k]] + " " + str(forces[k][0]) + "\n")
+            full.write(symbols[types[k]] + " " + str(forces[k][1]) + "\n")
+            full.write(symbols[types[k]] + " " + str(forces[k][2]) + "\n")
+            
+        full.write("s_xx " + str(sxx/from_GPa) + "\n")
+        full.write("s_xy " + str(sxy/from_GPa) + "\n")
+        full.write("s_xz " + str(sxz/from_GPa) + "\n")
+        full.write("s_yx " + str(sxy/from_GPa) + "\n")
+        full.write("s_yy " + str(syy/from_GPa) + "\n")
+        full.write("s_yz " + str(syz/from_GPa) + "\n")
+        full.write("s_zx " + str(sxz/from_GPa) + "\n")
+        full.write("s_zy " + str(syz/from_GPa) + "\n")
+        full.write("s_zz " + str(szz/from_GPa) + "\n")
+        full.write("+1 "  + str(ener) + "\n")
+        full.write("+1 "  + str(ener) + "\n")
+        full.write("+1 "  + str(ener) + "\n")
+
+
+def reduce_frame(contents, atmtyps):
+
+    """
+    
+    Removes atoms not described by a parameter file from an .xyz(f) frame
+    
+    Usage: popped_data, popped_idx = reduce_frame(frame_lines, ["C", "N"])
+    
+    Notes: contents is modified in place, including its atom count line.
+           Returns the removed atom lines, and their (0-based) atom indices,
+           in frame order.
+    
+    """
+    
+    natoms      = int(contents[0])
+    popped_data = []
+    popped_idx  = []
+    
+    for k in range(natoms+1,1,-1):
+
+        if contents[k].split()[0] not in atmtyps:
+            popped_data.insert(0,contents.pop(k))
+            popped_idx .insert(0,k-2)
+            
+    contents[0] = str(natoms-len(popped_data)) +'\n'
+    
+    return popped_data, popped_idx
+
+
+def start_worker(scratch_root):
+
+    """
+    
+    Moves a subtraction worker process into its own scratch directory
+    
+    Usage: Used as the process pool initializer in subtract_off
+    
+    Notes: The single point helpers for each method read and write fixed 
+           file names (tmp.xyz, run_md.in, dftb_in.hsd, results.tag, ...) 
+           in the current directory, so each worker needs its own.
+    
+    """
+    
+    scratch = os.path.join(scratch_root, "worker-" + str(os.getpid()))
+    
+    os.makedirs(scratch)
+    os.chdir(scratch)
+
+
+def block_FES(frames, param_file, md_driver, method, temperatures, warm_start=False):
+
+    """
+    
+    Returns the energy, stresses, and forces predicted by a model for a block
+    of consecutive frames of one trajectory
+    
+    Usage: Called in subtract_off's worker processes, as 
+           block_FES([frame_lines,...], param_file, md_driver, method, [temperature,...], warm_start)
+    
+    Notes: With warm_start, each frame after the first starts from the
+           previous frame of the block, so results do not depend on which
+           worker ran the block, or what it ran before.
+    
+    """
+    
+    results = []
+    
+    for k in range(len(frames)):
+    
+        helpers.writelines("tmp.xyz",frames[k])
+    
+        results.append(get_FES("tmp.xyz", param_file, md_driver, method, temperatures[k], warm_start and (k > 0)))
+        
+    return results
+
+
+def subtract_off(param_files, md_driver, method, traj_files, temper_files=None, nprocs=1, launcher="", cache_dir=None, cache_size=1000, warm_start=False):
+
+    """
+    
+    Subtracts force/energy/stress contributions predicted by the models specified in param_files, 
     from .xyzf files listed in *argv
     
     Expcts .xyzf file stresses in GPa, energies in kcal/mol, and forces in H/B
@@ -116,9 +282,33 @@ def subtract_off(param_file, md_driver, method, traj_files, temper_files=None):
     Names the new file "<original_name>"
     
     Usage: subtract_off(param_file, md_driver, "CHIMES", ["traj-1.xyzf", "traj-2.xyzf",...], <kwargs>)
+           subtract_off([param_file_1, param_file_2,...], md_driver, "CHIMES", ["traj-1.xyzf",...], <kwargs>)
     
     Notes: See function definition in modify_FES.py for a full list of options. 
            Expects to be run from ???? folder           
+           
+           Frames from all trajectory files are evaluated by a pool of nprocs
+           worker processes, each in its own scratch directory, and results
+           are written back in order. launcher (e.g. "srun -N 1 -n 1 --exact")
+           is prepended to md_driver, to spread the single points over the
+           nodes of an allocation.
+           
+           Given a list of parameter files, every file is evaluated for each
+           frame and all contributions are subtracted in a single pass over
+           the trajectories, in list order, giving the same result as one
+           call per file. Each file's contributions are still written to its
+           own b-labeled_subtracted.<file>.traj_file_idx-X.dat, and
+           <original_name>.original holds the unmodified trajectory.
+           
+           With cache_dir set, single points are looked up in (and added to)
+           the fes_cache there before any are run, and the cache is then
+           pruned to cache_size MB.
+           
+           With warm_start, frames are evaluated in blocks of WARM_START_BLOCK
+           consecutive frames of a trajectory, and methods that support it
+           (DFTB) start each frame's SCC cycle from the previous frame of its
+           block. Results can then differ from cold starts within the SCC
+           tolerance.
     
     """
     
@@ -131,223 +321,341 @@ def subtract_off(param_file, md_driver, method, traj_files, temper_files=None):
         
     if temper_files is not None:
         temper_files = list(temper_files)
+        
+    if not isinstance(param_files, list):
+        param_files = [param_files]
     
-    # Read the parameter file and determine which atom types it describes
+    # Read the parameter files and determine which atom types each describes
     
-    atmtyps = None
+    atmtyps = []
     
-    if method == "CHIMES":
-        atmtyps = chimes_modify_FES.check_atomtypes(param_file)
-    elif method == "DFTB":
-        atmtyps = dftbplus_modify_FES.check_atomtypes(param_file)
-    else:
-        print("ERROR: Unknown method in modify_FES.py:",method)
-
+    for param_file in param_files:
+    
+        if method == "CHIMES":
+            atmtyps.append(chimes_modify_FES.check_atomtypes(param_file))
+        elif method == "DFTB":
+            atmtyps.append(dftbplus_modify_FES.check_atomtypes(param_file))
+        else:
+            print("ERROR: Unknown method in modify_FES.py:",method)
 
-    print("Ignoring all atom types except:", atmtyps)
+        print("Ignoring all atom types except:", atmtyps[-1], "for parameters:", param_file)
         
     # Process the trajectory file
     
     print("Will process traj files:",traj_files)
     
+    # Workers run in their own directories, so paths must be absolute
     
-    for i in range(len(traj_files)):
+    param_files = [os.path.abspath(param_file) for param_file in param_files]
     
-        print("\t...Subtracting from file:",traj_files[i])
-    
-        helpers.run_bash_cmnd("rm -f subtracted.xyzf")
-        ofstream = open("subtracted.xyzf",'a')
+    if cache_dir is not None:
+        digests = [fes_cache.model_digest(param_file) for param_file in param_files]
+        driver  = fes_cache.driver_stamp(md_driver)
         
-        print("\t\tReading temperatures from:",temper_files[i])
+    md_driver   = md_driver.split()
+    
+    if os.path.exists(md_driver[0]):
+        md_driver[0] = os.path.abspath(md_driver[0])
         
-        temperature = 0.0
-        if temper_files is not None:
-            temperatures = helpers.readlines(temper_files[i])
-
-        print("\t\tOpening file:","b-labeled_subtracted." + param_file.split("/")[-1] + ".traj_file_idx-" + str(i)  + ".dat")
-        helpers.run_bash_cmnd("rm -f b-labeled_subtracted." + param_file.split("/")[-1] + ".traj_file_idx-" + str(i)  + ".dat")
-        removed = open("b-labeled_subtracted." + param_file.split("/")[-1] + ".traj_file_idx-" + str(i)  + ".dat",'a')
+    md_driver = (launcher + " " + ' '.join(md_driver)).strip()
+    
+    # Evaluate each model for every frame of every file
+    
+    scratch_root = os.path.abspath("subtract_scratch." + str(os.getpid()))
+    pool         = concurrent.futures.ProcessPoolExecutor(max_workers=nprocs, initializer=start_worker, initargs=(scratch_root,))
 
-        # Figure out what options the target .xyzf file has
+    # Workers and their scratch directories are always cleaned up, even if
+    # a frame fails
     
-        box_type, stress_type, energy_type = get_format(traj_files[i])
+    try:
+        results      = []
+        keys         = []
+        hits         = [0]
+        block        = 1
+        
+        if warm_start:
+            block = WARM_START_BLOCK
     
-        # Process file frame by frame...
+        print("\tEvaluating frames with", nprocs, "worker processes")
         
-        natoms_per_frame = helpers.list_natoms(traj_files[i])
-        nframes          = helpers.count_xyzframes_general(traj_files[i])
+        if warm_start:
+            print("\tWarm starting SCC cycles within blocks of", block, "consecutive frames")
         
-        ener = [None]*nframes
-        sxx  = [None]*nframes; syy = [None]*nframes; szz = [None]*nframes; sxy = [None]*nframes; sxz = [None]*nframes; syz = [None]*nframes;
-        fx   = []; fy  = []; fz  = [];
+        # Frames are evaluated in blocks of consecutive frames of a trajectory 
+        # (one frame per block, unless warm starting). A block is only reused 
+        # from the cache if all of its frames are, so warm starts always 
+        # follow the same frames.
         
-        start_line = 0
-
-        for j in range(nframes):
-
-            frame_fx = [0.0]*natoms_per_frame[j]
-            frame_fy = [0.0]*natoms_per_frame[j]
-            frame_fz = [0.0]*natoms_per_frame[j]
-
-            # Parse and store info from the input.xyzf file
+        def submit_block(i, p, pending):
+        
+            if all([frame[4] is not None for frame in pending]):
+            
+                for j, reduced, temperature, key, cached in pending:
+                
+                    results[i][j][p] = [concurrent.futures.Future(), 0]
+                    results[i][j][p][0].set_result([cached])
+                    
+                hits[0] += len(pending)
+                
+            else:
+            
+                future = pool.submit(block_FES, [frame[1] for frame in pending], param_files[p], md_driver, method, [frame[2] for frame in pending], warm_start)
+                
+                for k in range(len(pending)):
+                
+                    results[i][pending[k][0]][p] = [future, k]
+                    keys   [i][pending[k][0]][p] = pending[k][3]
+                    
+            del pending[:]
     
-            nlines = 2+natoms_per_frame[j]
-
-            contents = helpers.readlines(traj_files[i],start_line, start_line+nlines)
-                        
-            start_line += nlines
+        for i in range(len(traj_files)):
+    
+            temperatures = None
+            if temper_files is not None:
+                temperatures = helpers.readlines(temper_files[i])
+            
+            results.append([])
+            keys   .append([])
             
-            # Remove atoms not described by parameter file
+            pending = [[] for p in param_files]
+        
+            for j, contents in enumerate(helpers.iter_xyzframes(traj_files[i])):
+        
+                temperature = None
+                if temperatures is not None:
+                    temperature = int(float(temperatures[j]))
+                
+                results[i].append([None]*len(param_files))
+                keys   [i].append([None]*len(param_files))
+                
+                for p in range(len(param_files)):
+            
+                    reduced = list(contents)
+            
+                    reduce_frame(reduced, atmtyps[p])
+                
+                    # Reuse cached contributions, where inputs are unchanged;
+                    # warm started results also depend on the frames before 
+                    # them in their block
+                
+                    key    = None
+                    cached = None
+                
+                    if cache_dir is not None:
+                    
+                        previous = None
+                        
+                        if len(pending[p]) > 0:
+                            previous = pending[p][-1][3]
+                            
+                        key    = fes_cache.frame_key(digests[p], driver, method, temperature, reduced, previous)
+                        cached = fes_cache.lookup(cache_dir, key)
+                        
+                    pending[p].append([j, reduced, temperature, key, cached])
+                    
+                    if len(pending[p]) == block:
+                        submit_block(i, p, pending[p])
+                        
+            for p in range(len(param_files)):
+                if len(pending[p]) > 0:
+                    submit_block(i, p, pending[p])
+                    
+        if cache_dir is not None:
+            print("\tReusing", hits[0], "cached single points from:", cache_dir)
             
-            popped = 0
-            popped_data = []
+        # Write the subtracted files, in order, as results come in
+    
+        for i in range(len(traj_files)):
+    
+            print("\t...Subtracting from file:",traj_files[i])
+    
+            helpers.run_bash_cmnd("rm -f subtracted.xyzf")
+            ofstream = open("subtracted.xyzf",'a')
+        
+            removed = []
+        
+            for param_file in param_files:
+        
+                removed_file = "b-labeled_subtracted." + param_file.split("/")[-1] + ".traj_file_idx-" + str(i)  + ".dat"
+        
+                print("\t\tOpening file:",removed_file)
+                helpers.run_bash_cmnd("rm -f " + removed_file)
+                removed.append(open(removed_file,'a'))
 
-            for k in range(natoms_per_frame[j]+1,1,-1):
+            # Figure out the frame count, atoms per frame, and header format of the target .xyzf file
+    
+            nframes, natoms_per_frame, file_format, truncated = helpers.scan_xyzframes(traj_files[i])
+        
+            box_type, stress_type, energy_type = file_format
+        
+            if truncated:
+                print("WARNING: Ignoring partially printed last frame of file:", traj_files[i])
+    
+            # Process file frame by frame...
+        
+            ener = [None]*nframes
+            sxx  = [None]*nframes; syy = [None]*nframes; szz = [None]*nframes; sxy = [None]*nframes; sxz = [None]*nframes; syz = [None]*nframes;
+        
+            frames = helpers.iter_xyzframes(traj_files[i])
 
-                if contents[k].split()[0] not in atmtyps:
-                    popped_data.insert(0,contents.pop(k))
-                    frame_fx[k-2] = -1
-                    frame_fy[k-2] = -1
-                    frame_fz[k-2] = -1
-                    popped += 1
+            for j in range(nframes):
 
-            boxline = contents[1].split()
+                # Parse and store info from the input.xyzf file
+    
+                contents = next(frames)
             
-            if energy_type == "yes":
-                ener[j] = float(boxline.pop())
+                boxline = contents[1].split()
+            
+                if energy_type == "yes":
+                    ener[j] = float(boxline.pop())
                 
-            if stress_type == "all":
-                syz[j] = float(boxline.pop())
-                sxz[j] = float(boxline.pop())
-                sxy[j] = float(boxline.pop())
+                if stress_type == "all":
+                    syz[j] = float(boxline.pop())
+                    sxz[j] = float(boxline.pop())
+                    sxy[j] = float(boxline.pop())
                 
-            if stress_type != "no":
-                szz[j] = float(boxline.pop())
-                syy[j] = float(boxline.pop())
-                sxx[j] = float(boxline.pop())            
+                if stress_type != "no":
+                    szz[j] = float(boxline.pop())
+                    syy[j] = float(boxline.pop())
+                    sxx[j] = float(boxline.pop())            
                 
-            # Save the frame to a temporary .xyz file
-
-            contents[0] = str(natoms_per_frame[j]-popped) +'\n'
-            
-            helpers.writelines("tmp.xyz",contents)
+                atoms    = [contents[k+2].split() for k in range(natoms_per_frame[j])]
+                frame_fx = [float(line[4]) for line in atoms]
+                frame_fy = [float(line[5]) for line in atoms]
+                frame_fz = [float(line[6]) for line in atoms]
+                modified = [False]*natoms_per_frame[j]
                 
-            # Obtain the corresponding F/E/S from the reference md code
+                # Obtain the corresponding F/E/S from each reference model
             
-            print("\t\t\t Running file:",traj_files[i],"frame",j, "with T = ",int(float(temperatures[j])))
-
-            tmp_ener, tmp_stress, force_file = get_FES("tmp.xyz",param_file, md_driver, method, int(float(temperatures[j]))) 
+                print("\t\t\t Collecting file:",traj_files[i],"frame",j)
+            
+                for p in range(len(param_files)):
 
-            tmp_forces = helpers.readlines(force_file)
+                    tmp_ener, tmp_stress, tmp_forces = results[i][j][p][0].result()[results[i][j][p][1]]
+                
+                    if keys[i][j][p] is not None:
+                        if not fes_cache.store(cache_dir, keys[i][j][p], [tmp_ener, tmp_stress, tmp_forces]):
+                            print("WARNING: Not caching non-finite single point results for file:",traj_files[i],"frame",j)
             
-            # Update the forces, energies, and stresses
+                    # Update the forces, energies, and stresses
             
-            if energy_type == "yes":
-                ener[j] -= tmp_ener     ; ener[j] = str(ener[j])
-            if stress_type != "no":
-                sxx [j] -= tmp_stress[0]; sxx [j] = str(sxx [j])
-                syy [j] -= tmp_stress[1]; syy [j] = str(syy [j])
-                szz [j] -= tmp_stress[2]; szz [j] = str(szz [j])
-                if stress_type == "all":
-                    sxy [j] -= tmp_stress[3]; sxy [j] = str(sxy [j])
-                    sxz [j] -= tmp_stress[4]; sxz [j] = str(sxz [j])
-                    syz [j] -= tmp_stress[5]; syz [j] = str(syz [j])
+                    if energy_type == "yes":
+                        ener[j] -= tmp_ener
+                    if stress_type != "no":
+                        sxx [j] -= tmp_stress[0]
+                        syy [j] -= tmp_stress[1]
+                        szz [j] -= tmp_stress[2]
+                        if stress_type == "all":
+                            sxy [j] -= tmp_stress[3]
+                            sxz [j] -= tmp_stress[4]
+                            syz [j] -= tmp_stress[5]
             
-            contents_idx = 0            
-            popped_idx   = 0
-                
+                    contents_idx = 0            
 
-            for k in range(len(frame_fx)):
-            
-                if frame_fx[k] == -1: # Then this atom didn't exist in the parameter file - no modification to forces
+                    for k in range(natoms_per_frame[j]):
                 
-                    popped_line = popped_data[popped_idx].split()
+                        if atoms[k][0] not in atmtyps[p]: # Then this atom didn't exist in the parameter file - no modification to forces
                 
-                    removed.write(popped_line[0] + " 0.0\n")
-                    removed.write(popped_line[0] + " 0.0\n")
-                    removed.write(popped_line[0] + " 0.0\n")
-
-                    popped_idx += 1
-    
-                    continue                    
-                else:
-                    line = contents[contents_idx+2].split()
-                    
-                    frame_fx[k] = str(float(line[4]) - float(tmp_forces[3*contents_idx  ])*kcalpermolAng2HperB)
-                    frame_fy[k] = str(float(line[5]) - float(tmp_forces[3*contents_idx+1])*kcalpermolAng2HperB)
-                    frame_fz[k] = str(float(line[6]) - float(tmp_forces[3*contents_idx+2])*kcalpermolAng2HperB)
+                            removed[p].write(atoms[k][0] + " 0.0\n")
+                            removed[p].write(atoms[k][0] + " 0.0\n")
+                            removed[p].write(atoms[k][0] + " 0.0\n")
+    
+                            continue                    
+                        else:
+                            frame_fx[k] -= float(tmp_forces[3*contents_idx  ])*kcalpermolAng2HperB
+                            frame_fy[k] -= float(tmp_forces[3*contents_idx+1])*kcalpermolAng2HperB
+                            frame_fz[k] -= float(tmp_forces[3*contents_idx+2])*kcalpermolAng2HperB
+                            modified[k]  = True
                     
-                    removed.write(line[0] + " " + tmp_forces[3*contents_idx  ])
-                    removed.write(line[0] + " " + tmp_forces[3*contents_idx+1])
-                    removed.write(line[0] + " " + tmp_forces[3*contents_idx+2])
+                            removed[p].write(atoms[k][0] + " " + tmp_forces[3*contents_idx  ])
+                            removed[p].write(atoms[k][0] + " " + tmp_forces[3*contents_idx+1])
+                            removed[p].write(atoms[k][0] + " " + tmp_forces[3*contents_idx+2])
 
-                    contents_idx += 1    
+                            contents_idx += 1    
                     
-            from_GPa = 6.9479
+                    from_GPa = 6.9479
                 
-            removed.write("s_xx " + str(tmp_stress[0]/from_GPa) + "\n")
-            removed.write("s_xy " + str(tmp_stress[3]/from_GPa) + "\n")
-            removed.write("s_xz " + str(tmp_stress[4]/from_GPa) + "\n")
-            removed.write("s_yx " + str(tmp_stress[3]/from_GPa) + "\n")
-            removed.write("s_yy " + str(tmp_stress[1]/from_GPa) + "\n")
-            removed.write("s_yz " + str(tmp_stress[5]/from_GPa) + "\n")
-            removed.write("s_zx " + str(tmp_stress[4]/from_GPa) + "\n")
-            removed.write("s_zy " + str(tmp_stress[5]/from_GPa) + "\n")
-            removed.write("s_zz " + str(tmp_stress[2]/from_GPa) + "\n")
-            removed.write("+1 "  + str(tmp_ener)      + "\n")
-            removed.write("+1 "  + str(tmp_ener)      + "\n")
-            removed.write("+1 "  + str(tmp_ener)      + "\n")
-            
-            # Output the modified frame
-            
-            ofstream.write(str(natoms_per_frame[j]) + '\n')
-            ofstream.write(' '.join(boxline) + ' ')
+                    removed[p].write("s_xx " + str(tmp_stress[0]/from_GPa) + "\n")
+                    removed[p].write("s_xy " + str(tmp_stress[3]/from_GPa) + "\n")
+                    removed[p].write("s_xz " + str(tmp_stress[4]/from_GPa) + "\n")
+                    removed[p].write("s_yx " + str(tmp_stress[3]/from_GPa) + "\n")
+                    removed[p].write("s_yy " + str(tmp_stress[1]/from_GPa) + "\n")
+                    removed[p].write("s_yz " + str(tmp_stress[5]/from_GPa) + "\n")
+                    removed[p].write("s_zx " + str(tmp_stress[4]/from_GPa) + "\n")
+                    removed[p].write("s_zy " + str(tmp_stress[5]/from_GPa) + "\n")
+                    removed[p].write("s_zz " + str(tmp_stress[2]/from_GPa) + "\n")
+                    removed[p].write("+1 "  + str(tmp_ener)      + "\n")
+                    removed[p].write("+1 "  + str(tmp_ener)      + "\n")
+                    removed[p].write("+1 "  + str(tmp_ener)      + "\n")
+                
+                results[i][j] = None
             
-            if stress_type == "all":
-                ofstream.write(sxx[j] + ' ' + syy[j] + ' ' + szz[j] + ' ' + sxy[j] + ' ' + sxz[j] + ' ' + syz[j] + ' ')
-            elif stress_type == "diag":
-                ofstream.write(sxx[j] + ' ' + syy[j] + ' ' + szz[j] + ' ')
-            if energy_type == "yes":
-                ofstream.write(ener[j])
-            ofstream.write('\n')
+                # Output the modified frame
             
+                ofstream.write(str(natoms_per_frame[j]) + '\n')
+                ofstream.write(' '.join(boxline) + ' ')
             
-            popped_idx   = 0
-            contents_idx = 0
+                if stress_type == "all":
+                    ofstream.write(str(sxx[j]) + ' ' + str(syy[j]) + ' ' + str(szz[j]) + ' ' + str(sxy[j]) + ' ' + str(sxz[j]) + ' ' + str(syz[j]) + ' ')
+                elif stress_type == "diag":
+                    ofstream.write(str(sxx[j]) + ' ' + str(syy[j]) + ' ' + str(szz[j]) + ' ')
+                if energy_type == "yes":
+                    ofstream.write(str(ener[j]))
+                ofstream.write('\n')
                 
-            for k in range(len(frame_fx)):
+                for k in range(natoms_per_frame[j]):
             
-                if frame_fx[k] == -1: # Then this atom didn't exist in the parameter file - no modification to forces
-                    ofstream.write(popped_data[popped_idx])
-                    popped_idx += 1
-                else:
-                    line = contents[contents_idx+2].split()
-                    idx  = k-2                
-                    ofstream.write(' '.join(line[0:4]) + ' ' + frame_fx[k] + ' ' + frame_fy[k] + ' ' + frame_fz[k] + '\n')
-                    contents_idx += 1
+                    if not modified[k]: # Then this atom didn't exist in any parameter file - no modification to forces
+                        ofstream.write(contents[k+2])
+                    else:
+                        ofstream.write(' '.join(atoms[k][0:4]) + ' ' + str(frame_fx[k]) + ' ' + str(frame_fy[k]) + ' ' + str(frame_fz[k]) + '\n')
                 
-        ofstream.close()
-        removed.close()
-        helpers.run_bash_cmnd("cp " + traj_files[i] + " " + traj_files[i] + ".original")
-        helpers.run_bash_cmnd("mv subtracted.xyzf " + traj_files[i])
+            ofstream.close()
+        
+            for p in range(len(param_files)):
+                removed[p].close()
+            
+            helpers.run_bash_cmnd("cp " + traj_files[i] + " " + traj_files[i] + ".original")
+            helpers.run_bash_cmnd("mv subtracted.xyzf " + traj_files[i])
+            
+    finally:
+    
+        pool.shutdown(cancel_futures=True)
+        
+        shutil.rmtree(scratch_root, ignore_errors=True)
+    
+    if cache_dir is not None:
+        fes_cache.prune(cache_dir, cache_size)
 
             
-def get_FES(xyz_file, param_file, md_driver, method, temperature=None):
+def get_FES(xyz_file, param_file, md_driver, method, temperature=None, warm_start=False):
+
+    """
+    
+    Returns the energy, stresses, and forces predicted by a model for a single configuration
+    
+    Usage: tmp_ener, tmp_stress, tmp_forces = get_FES("tmp.xyz", param_file, md_driver, "CHIMES")
+    
+    Notes: tmp_forces holds the lines of the model's force file, one force
+           component (kcal/mol/Ang) per line. warm_start is only used by DFTB,
+           to start from the last configuration evaluated in this directory.
+    
+    """
 
     tmp_ener   = None
     tmp_stress = None
-    force_file = None
+    tmp_forces = None
     
     if method == "CHIMES":
-        tmp_ener, tmp_stress, force_file = chimes_modify_FES.get_FES("tmp.xyz",param_file, md_driver) 
+        tmp_ener, tmp_stress, tmp_forces = chimes_modify_FES.get_FES(xyz_file,param_file, md_driver) 
     elif method == "DFTB":
-        tmp_ener, tmp_stress, force_file = dftbplus_modify_FES.get_FES("tmp.xyz",param_file, md_driver,temperature) 
+        tmp_ener, tmp_stress, tmp_forces = dftbplus_modify_FES.get_FES(xyz_file,param_file, md_driver,temperature,warm_start) 
     else:
         print("ERROR: Unrecognized method \"" + method + "\" for modify_FES.get_FES")
         print("Exiting.")
         exit()
         
-    return tmp_ener, tmp_stress, force_file
+    return tmp_ener, tmp_stress, tmp_forces
 
     
 def get_format(traj_file):
@@ -363,89 +671,13 @@ def get_format(traj_file):
     
     Usage: get_format(traj_file_name)
     
-    
-    Formats are based of presence of "NON_ORTHO" and number of fields, i.e.:
-    
-    
-    17    NON_ORTHO ax ay az bx by bz cx cy cz sxx syy szz sxy sxz syz energy
-    16    NON_ORTHO ax ay az bx by bz cx cy cz sxx syy szz sxy sxz syz
-    14    NON_ORTHO ax ay az bx by bz cx cy cz sxx syy szz energy
-    13    NON_ORTHO ax ay az bx by bz cx cy cz sxx syy szz
-    11    NON_ORTHO ax ay az bx by bz cx cy cz energy
-    10    NON_ORTHO ax ay az bx by bz cx cy cz
-    
-    10    x y z sxx syy szz sxy sxz syz energy
-    9    x y z sxx syy szz sxy sxz syz
-    7    x y z sxx syy szz energy
-    6    x y z sxx syy szz
-    4    x y z energy
-    3    x y z
-    
+    Notes: Formats are described in helpers.xyz_header_format. To get the 
+           format along with the frame count and atoms per frame, use 
+           helpers.scan_xyzframes instead.
     
     """
     
-    box_type    = None
-    stress_type = None
-    energy_type = None
-    
-
-    # Grab the header line
-
-    ifstream = open(traj_file,'r')
-    header   = ifstream.readline() # Ignore number of atoms
-    header   = ifstream.readline()
-    header   = header.split()
-    hlen     = len(header)
-    ifstream.close()
-    
-    # Parse
-    
-    if header[0] == "NON_ORTHO":
-        box_type = "non_ortho"
-    else:
-        box_type = "ortho"
-    
-    # Determine stress/energy options            
-    
-    if   hlen == 17:
-        stress_type = "all"
-        energy_type = "yes"
-    elif hlen == 16:
-        stress_type = "all"
-        energy_type = "no"        
-    elif hlen == 14:
-        stress_type = "diag"
-        energy_type = "yes"
-    elif hlen == 13:
-        stress_type = "diag"
-        energy_type = "no"        
-    elif hlen == 11:
-        stress_type = "no"
-        energy_type = "yes"        
-    elif hlen == 10:
-        if box_type == "non_ortho":
-            stress_type = "no"
-            energy_type = "no"
-        else:
-            stress_type = "all"
-            energy_type = "yes"            
-    elif hlen == 9:
-        stress_type = "all"
-        energy_type = "no"        
-    elif hlen == 7:
-        stress_type = "diag"
-        energy_type = "yes"
-    elif hlen == 6:
-        stress_type = "diag"
-        energy_type = "no"        
-    elif hlen == 4:
-        stress_type = "no"
-        energy_type = "yes"        
-    elif hlen == 3:
-        stress_type = "no"
-        energy_type = "no"    
-    
-    return box_type, stress_type, energy_type    
+    return helpers.scan_xyzframes(traj_file)[2]
 
 
 def main():
@@ -105,8 +105,8 @@ def setup_qm(my_ALC, bulk_qm_method, igas_qm_method, *argv, **kwargs):
     
     ### ...kwargs
     
-    default_keys   = [""]*25
-    default_values = [""]*25
+    default_keys   = [""]*26
+    default_values = [""]*26
 
 
     default_keys[0 ] = "basefile_dir"  ; default_values[0 ] = "../QM_BASEFILES/"  # VASP and DFTB+ input files
@@ -118,6 +118,7 @@ def setup_qm(my_ALC, bulk_qm_method, igas_qm_method, *argv, **kwargs):
     default_keys[3 ] = "VASP_ppn"      ; default_values[3 ] = "36"               # Requested VASP  job proc per node    
     default_keys[4 ] = "VASP_time"        ; default_values[4 ] = "00:30:00"      # Requested max walltime for VASP job
     default_keys[5 ] = "VASP_queue"    ; default_values[5 ] = "pdebug"           # Requested VASP job queue
+    default_keys[25] = "VASP_array"    ; default_values[25] = 0                  # Configurations per array task; 0 runs all configurations in one job
     
     # Gaussian specific controls
     
@@ -176,7 +177,8 @@ def setup_qm(my_ALC, bulk_qm_method, igas_qm_method, *argv, **kwargs):
                 job_walltime   = args  ["VASP_time"],
                 job_queue      = args  ["VASP_queue"],
                 job_account    = args  ["job_account"], 
-                job_system     = args  ["job_system"])
+                job_system     = args  ["job_system"],
+                job_array      = args  ["VASP_array"])
                 
         elif bulk_qm_method == "DFTB+":
         
@@ -217,7 +219,8 @@ def setup_qm(my_ALC, bulk_qm_method, igas_qm_method, *argv, **kwargs):
                         job_walltime   = args  ["VASP_time"],
                         job_queue      = args  ["VASP_queue"],
                         job_account    = args  ["job_account"],
-                        job_system     = args  ["job_system"])
+                        job_system     = args  ["job_system"],
+                        job_array      = args  ["VASP_array"])
                 elif bulk_qm_method == "DFTB+":
                     run_qm_jobids += dftbplus_driver.setup_dftb(my_ALC, *tmp_args,
                         first_run      = True,             
@@ -248,7 +251,8 @@ def setup_qm(my_ALC, bulk_qm_method, igas_qm_method, *argv, **kwargs):
                         job_walltime   = args  ["VASP_time"],
                         job_queue      = args  ["VASP_queue"],
                         job_account    = args  ["job_account"],
-                        job_system     = args  ["job_system"])
+                        job_system     = args  ["job_system"],
+                        job_array      = args  ["VASP_array"])
                         
                 elif igas_qm_method == "DFTB+":
                 
@@ -2,6 +2,10 @@
 
 import os
 
+# Local modules
+
+import helpers
+
 class restart:
 
     def __init__(self):
@@ -150,6 +154,11 @@ class restart:
     def update_file(self, txt_str):
         self.restart_stream.write(txt_str)
         self.restart_stream.flush()
+        
+        # Attribute shell commands run since the last completed stage to this one
+        
+        if txt_str.rstrip().endswith(": COMPLETE"):
+            helpers.close_cmnd_stage(txt_str.split(":")[0])
 
             
 
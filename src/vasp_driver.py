@@ -6,6 +6,7 @@ import os
 # Localmodules
 
 import helpers
+import fileops
 
 ######
 # NOTE: Implementation is based on VASP 5.4.1
@@ -59,11 +60,11 @@ def cleanup_and_setup(*argv, **kwargs):
             
                 if os.path.isdir(vasp_dir):
             
-                    helpers.run_bash_cmnd("rm -rf " + vasp_dir)
-                    helpers.run_bash_cmnd("mkdir  " + vasp_dir)
+                    fileops.rm_rf(vasp_dir)
+                    fileops.mkdir(vasp_dir)
                                 
                 else:
-                    helpers.run_bash_cmnd("mkdir  " + vasp_dir)
+                    fileops.mkdir(vasp_dir)
                 
             return
 
@@ -83,10 +84,10 @@ def cleanup_and_setup(*argv, **kwargs):
             if os.path.isdir(vasp_dir):
                 helpers.run_bash_cmnd("rm -rf " + vasp_dir + "/*")
             else:
-                helpers.run_bash_cmnd("mkdir  -p " + vasp_dir)
+                fileops.mkdir(vasp_dir, parents=True)
             
         else:
-            helpers.run_bash_cmnd("mkdir -p  " + vasp_dir + "/CASE-" + repr(args_this_case))
+            fileops.mkdir(vasp_dir + "/CASE-" + repr(args_this_case), parents=True)
 
 
 def continue_job(*argv, **kwargs):
@@ -99,6 +100,8 @@ def continue_job(*argv, **kwargs):
     
     Notes: See function definition in vasp_driver.py for a full list of options. 
            Returns a SLURM jobid list
+           For array jobs (see setup_vasp), only tasks with missing OUTCARs
+           are resubmitted.
                
     """
     
@@ -163,12 +166,34 @@ def continue_job(*argv, **kwargs):
             
             if count_POSCAR > count_OUTCAR:
             
-                print("            Resubmitting.")
+                resubmit = ""
+                
+                if os.path.isfile("vasp_tasks.dat"):
+                
+                    # Array job: only rerun the tasks with missing OUTCARs
+                    
+                    tasks = failed_tasks("vasp_tasks.dat")
+                    
+                    print("            Array tasks:", tasks)
+                    
+                    if args["job_system"] != "torque":
+                        resubmit = " --array=" + tasks
+                    else:
+                        resubmit = " -t " + tasks
+                        
+                if os.path.isfile("vasp_tasks.dat") and (tasks == ""):
+                
+                    # The configurations lacking OUTCARs aren't in any array 
+                    # task, so the array script can't run them
+                
+                    print("            Configurations lacking OUTCARs are not in vasp_tasks.dat.")
+                    print("            Not resubmitting.")
+                    
+                else:
+                
+                    print("            Resubmitting.")
 
-                if args["job_system"] == "slurm":
-                    job_list.append(helpers.run_bash_cmnd("sbatch run_vasp.cmd").split()[-1])
-                else:    
-                    job_list.append(helpers.run_bash_cmnd("qsub run_vasp.cmd").replace('\n', ''))
+                    job_list.append(helpers.submit_job("run_vasp.cmd", args["job_system"], resubmit))
 
             else:
                 print("            Not resubmitting.")
@@ -178,7 +203,7 @@ def continue_job(*argv, **kwargs):
             os.chdir("../..")
         else:
             print("Cant find directory VASP-"+ args_targets[i] + "/" + CASE_PATH)
-            print(helpers.run_bash_cmnd("pwd"))
+            print(fileops.pwd())
 
     return job_list    
     
@@ -303,7 +328,7 @@ def check_convergence(my_ALC, *argv, **kwargs):
         # Delete corresponding .OUTCAR files
         
         for j in range(len(base_list)):
-            helpers.run_bash_cmnd("rm -f " + base_list[j] + ".OUTCAR")
+            fileops.rm(base_list[j] + ".OUTCAR")
             
         # Update the *.INCAR files for the cases
         
@@ -319,9 +344,9 @@ def check_convergence(my_ALC, *argv, **kwargs):
             print("Working on:",incars[j])
             
             if os.path.exists(incars[j] + ".bck"):
-                helpers.run_bash_cmnd("cp " + incars[j] + ".bck " + incars[j])
+                fileops.cp(incars[j] + ".bck " + incars[j])
             
-            helpers.run_bash_cmnd("cp " + incars[j] + " " + incars[j] + ".bck")
+            fileops.cp(incars[j] + " " + incars[j] + ".bck")
         
             contents = helpers.readlines(incars[j])
             
@@ -501,7 +526,7 @@ def post_process(*argv, **kwargs):
     
         os.chdir("VASP-" + args_targets[i])
     
-        helpers.run_bash_cmnd("rm -f OUTCAR.xyzf")
+        fileops.rm("OUTCAR.xyzf")
         
         outcar_list = []
         
@@ -509,6 +534,8 @@ def post_process(*argv, **kwargs):
         
             outcar_list += sorted(glob.glob("CASE-" + repr(j) + "/*.OUTCAR"))
             
+        converged = []
+            
         for j in range(len(outcar_list)):
         
             # Make sure the job completed within requested NELM
@@ -538,7 +565,18 @@ def post_process(*argv, **kwargs):
                 continue            
             
 
-            print(helpers.run_bash_cmnd(args["vasp_postproc"] + " " + outcar_list[j] + " 1 " + args_properties + " | grep ERROR "))
+            converged.append(outcar_list[j])
+            
+        # Post-process the converged jobs concurrently; each only writes its own <OUTCAR>.xyzf and .temps
+        
+        postproc_cmnds = [args["vasp_postproc"] + " " + outcar + " 1 " + args_properties + " | grep ERROR " for outcar in converged]
+        
+        for msg in helpers.run_bash_cmnds(postproc_cmnds):
+            print(msg)
+            
+        outcar_list = converged
+            
+        for j in range(len(outcar_list)):
             
                         
             
@@ -578,12 +616,76 @@ def post_process(*argv, **kwargs):
                     helpers.cat_specific("tmp.dat", [outcar_list[j] + ".xyzf"])
                     helpers.cat_specific("tmp.tmp", [tmpfile])                    
                 
-                helpers.run_bash_cmnd("mv tmp.dat OUTCAR.xyzf")
-                helpers.run_bash_cmnd("mv tmp.tmp OUTCAR.temps")
+                fileops.mv("tmp.dat OUTCAR.xyzf")
+                fileops.mv("tmp.tmp OUTCAR.temps")
                 
         
         os.chdir("..")
 
+def chunk_configurations(poscars, per_task):
+
+    """ 
+    
+    Groups POSCAR files into array tasks of roughly equal size.
+    
+    Usage: tasks = chunk_configurations(sorted(glob.glob("*.POSCAR")), 4)
+    
+    Notes: Each task gets about per_task configurations' worth of atoms (based
+           on the mean atom count), so large configurations run alone and 
+           small ones (e.g. gas-phase clusters) are packed together. Every 
+           task holds at least one configuration. Returns a list of lists of 
+           tags (POSCAR file names, without the extension).
+              
+    """
+    
+    if len(poscars) == 0:
+        return []
+        
+    natoms = [sum([int(i) for i in helpers.head(poscar, 7)[6].split()]) for poscar in poscars]
+    budget = per_task * float(sum(natoms)) / len(natoms)
+    
+    tasks = []
+    size  = 0
+    
+    for i in range(len(poscars)):
+    
+        tag = poscars[i][:-len(".POSCAR")]
+        
+        if (len(tasks) > 0) and (size + natoms[i] <= budget):
+            tasks[-1].append(tag)
+            size += natoms[i]
+        else:
+            tasks.append([tag])
+            size = natoms[i]
+            
+    return tasks
+    
+
+def failed_tasks(task_file):
+
+    """ 
+    
+    Returns the indices of array tasks with configurations lacking an OUTCAR.
+    
+    Usage: failed_tasks("vasp_tasks.dat") # Returns e.g. "3,17,102"
+    
+    Notes: task_file lists the tags for array task i on line i (see setup_vasp).
+              
+    """
+    
+    failed = []
+    
+    for i, line in enumerate(helpers.readlines(task_file)):
+    
+        for tag in line.split():
+        
+            if not os.path.isfile(tag + ".OUTCAR"):
+                failed.append(str(i))
+                break
+                
+    return ','.join(failed)
+
+
 def setup_vasp(my_ALC, *argv, **kwargs):
 
     """ 
@@ -601,6 +703,9 @@ def setup_vasp(my_ALC, *argv, **kwargs):
                   X.POSCAR
            All other input files (INCAR, KPOINTS, etc) are taken from config.VASP_FILES.
            Returns a SLURM jobid
+           If job_array > 0, submits an array job instead, with about job_array
+           configurations (weighted by atom count) per task; each task gets 
+           job_nodes nodes and job_walltime.
            
     WARNING: For ALC-0, smearing is taken to be the corresponding temeprature
              in the traj_list.dat file.
@@ -632,8 +737,8 @@ def setup_vasp(my_ALC, *argv, **kwargs):
     
     ### ...kwargs
     
-    default_keys   = [""]*14
-    default_values = [""]*14
+    default_keys   = [""]*15
+    default_values = [""]*15
 
 
     # VASP specific controls
@@ -656,6 +761,7 @@ def setup_vasp(my_ALC, *argv, **kwargs):
     default_keys[11] = "job_system"    ; default_values[11] = "slurm"               # slurm or torque       
     default_keys[12] = "job_file"       ; default_values[12] = "run.cmd"            # Name of the resulting submit script   
     default_keys[13] = "job_email"     ; default_values[13] = True                  # Send slurm emails?
+    default_keys[14] = "job_array"     ; default_values[14] = 0                     # Configurations per array task; 0 runs all configurations in one job
     
 
     args = dict(list(zip(default_keys, default_values)))
@@ -673,11 +779,11 @@ def setup_vasp(my_ALC, *argv, **kwargs):
         if (args_targets[i] == "all") and (int(my_case) > 0):
             continue    
     
-        curr_dir = helpers.run_bash_cmnd("pwd").rstrip() # This should be either CASE-X... (ALC>=1) or ...? (ALC==0)
+        curr_dir = fileops.pwd().rstrip() # This should be either CASE-X... (ALC>=1) or ...? (ALC==0)
     
         vasp_dir = "VASP-" + args_targets[i] + "/CASE-" + my_case
         
-        helpers.run_bash_cmnd("mkdir -p " + vasp_dir)        
+        fileops.mkdir(vasp_dir, parents=True)
             
         # Set up an launch the job
         
@@ -712,15 +818,13 @@ def setup_vasp(my_ALC, *argv, **kwargs):
 
             my_file = "case_" + str(my_case) + ".indep_0.traj_" + args_targets[i] + "F.xyz"
 
-            helpers.run_bash_cmnd("cp " + my_md_path + "/traj_20F.xyz " + my_file)
+            fileops.cp(my_md_path + "/traj_20F.xyz " + my_file)
             
-            atoms  = helpers.head(my_file,1)[0].rstrip()
-            frames = helpers.wc_l(my_file  )
-            frames = frames / (2+int(atoms))
+            frames = helpers.count_xyzframes_general(my_file)
 
             helpers.break_apart_xyz(frames, my_file)
             
-            helpers.run_bash_cmnd("rm -f " + ' '.join(glob.glob("*FORCES*")))
+            fileops.rm(fileops.matching("*FORCES*"))
             
             temp = my_smear
 
@@ -775,22 +879,32 @@ def setup_vasp(my_ALC, *argv, **kwargs):
 
                 generate_POSCAR(curr_dir + "/" + sel_file, atm_types, temp)
 
-                helpers.run_bash_cmnd("mv " + curr_dir + "/" + sel_file + ".POSCAR tmp.POSCAR")
+                fileops.mv(curr_dir + "/" + sel_file + ".POSCAR tmp.POSCAR")
                 
     
                 sel_POSCAR = sel_file + ".POSCAR"
                 sel_POSCAR = sel_POSCAR.replace('/','.')
                 
-                helpers.run_bash_cmnd("mv  tmp.POSCAR " + sel_POSCAR)
+                fileops.mv("tmp.POSCAR " + sel_POSCAR)
 
 
         ################################
         # 2. Launch the actual job 
         ################################
+        
+        # Nothing to submit (an array job would have no tasks)
+        
+        if len(glob.glob("*.POSCAR")) == 0:
+        
+            print("\tNo configurations to run in", vasp_dir, "... not submitting a job")
+            
+            os.chdir(curr_dir)
+            
+            continue
     
         # Grab the necessary files
     
-        helpers.run_bash_cmnd("cp " + ' '.join(glob.glob(args["basefile_dir"] + "/*")) + " .")
+        fileops.cp(fileops.matching(args["basefile_dir"] + "/*"), ".")
         
         # Delete any not for this case (temperature)
 
@@ -803,7 +917,7 @@ def setup_vasp(my_ALC, *argv, **kwargs):
         temp   = helpers.head(glob.glob("*" + tag + "*POSCAR")[0],1)[0].split()[-2]
 
         incars.remove(temp +".INCAR")
-        helpers.run_bash_cmnd("rm -f " + ' '.join(incars))
+        fileops.rm(incars)
     
         # Create the task string
                 
@@ -814,6 +928,76 @@ def setup_vasp(my_ALC, *argv, **kwargs):
         for k in range(len(atm_types)):
     
             job_task.append("ATOMS[" + repr(k) + "]=" + atm_types[k] + '\n')
+            
+        fileops.rm("vasp_tasks.dat")
+            
+        if int(args["job_array"]) > 0:
+        
+            # One array task per chunk of configurations, each run in its own 
+            # sub-directory so tasks don't overwrite each other's VASP files.
+            # Tags for task i are on line i of vasp_tasks.dat.
+        
+            tasks = chunk_configurations(sorted(glob.glob("*.POSCAR")), int(args["job_array"]))
+            
+            helpers.writelines("vasp_tasks.dat", [' '.join(task) + '\n' for task in tasks])
+            
+            print("\tSplit", len(glob.glob("*.POSCAR")), "configurations into", len(tasks), "array tasks")
+            
+            base_files = [os.path.basename(f) for f in glob.glob(args["basefile_dir"] + "/*")]
+            base_files = [f for f in base_files if not (f.endswith(".INCAR") or f.endswith(".POTCAR"))]
+            
+            job_task.append("TASK=${SLURM_ARRAY_TASK_ID:-$PBS_ARRAYID}")
+            job_task.append("mkdir -p task-${TASK}")
+            job_task.append("cd task-${TASK}")
+            
+            for f in base_files:
+                job_task.append("ln -sf ../" + f + " .")
+                
+            job_task.append("for TAG in $(sed -n \"$((TASK+1))p\" ../vasp_tasks.dat)")
+            job_task.append("do                ")
+            job_task.append("    cp ../${TAG}.POSCAR POSCAR    ")
+            job_task.append("    CHECK=../${TAG}.OUTCAR    ")
+            job_task.append("    if [ -e ${CHECK} ] ; then ")    
+            job_task.append("        continue    ")    
+            job_task.append("    fi            ")
+            job_task.append("    prev_tries=`wc -l ../${TAG}.tries`")
+            job_task.append("    if [ $prev_tries -ge 2 ]; then ")
+            job_task.append("        continue        ")
+            job_task.append("    fi                      ")                
+            job_task.append("    echo \"Attempt\" >> ../${TAG}.tries")
+            job_task.append("    TEMP=`awk '{print $(NF-1); exit}' POSCAR`")
+            job_task.append("    cp ../${TEMP}.INCAR INCAR    ")    
+            job_task.append("    rm -f POTCAR        ")
+            job_task.append("    for k in ${ATOMS[@]}    ")
+            job_task.append("    do            ")
+            job_task.append("        NA=`awk -v atm=\"$k\" \'{if(NR==6){for(i=1;i<=NF;i++){ if($i==atm){getline;print $i;exit}} print \"0\"}}\' POSCAR` ")
+            job_task.append("        if [ $NA -gt 0 ] ; then ")
+            job_task.append("            cat ../${k}.POTCAR >> POTCAR ")
+            job_task.append("        fi ")    
+            job_task.append("    done    ")    
+            job_task.append("    srun -N " + repr(args["job_nodes" ]) + " -n " + repr(int(args["job_nodes"])*int(args["job_ppn"])) + " " + args["job_executable"] + " > ../${TAG}.out  ")
+            job_task.append("    cp OUTCAR  ../${TAG}.OUTCAR    ")
+            job_task.append("    cp OSZICAR ../${TAG}.OSZICAR    ")
+            job_task.append("    rm -f OUTCAR CHG DOSCAR XDATCAR POSCAR CHGCAR EIGENVAL PCDAT XDATCAR CONTCAR IBZKPT OSZICAR WAVECAR  ")    
+            job_task.append("done    ")
+            
+            this_jobid = helpers.create_and_launch_job(job_task,
+                job_name       =          "vasp_spcalcs"  ,
+                job_email      =     args["job_email"   ] ,            
+                job_nodes      = str(args["job_nodes"    ]),
+                job_ppn        = str(args["job_ppn"    ]),
+                job_walltime   = str(args["job_walltime"]),
+                job_queue      =     args["job_queue"    ] ,
+                job_account    =     args["job_account" ] ,
+                job_system     =     args["job_system"  ] ,
+                job_file       =     "run_vasp.cmd",
+                job_array      =     "0-" + repr(len(tasks)-1))
+                
+            run_vasp_jobid.append(this_jobid.split()[0])    
+    
+            os.chdir(curr_dir)
+            
+            continue
     
         job_task.append("for j in $(ls *.POSCAR)    ")    
         job_task.append("do                ")
@@ -13,6 +13,7 @@ def print_help():
 
     PARAM.append("EMAIL_ADD");                      VARTYP.append("str");           DETAILS.append("E-mail address for driver to sent status updates to")
     PARAM.append("SEED");                           VARTYP.append("int");           DETAILS.append("Seed for random number generator (used for MC cluster selection)")
+    PARAM.append("COMPRESS_OUTPUTS");               VARTYP.append("str");           DETAILS.append("Compress consumed MD trajectories and fitting data with \"gz\", \"xz\", or \"zst\"; False to disable")
     PARAM.append("ATOM_TYPES");                     VARTYP.append("str list");      DETAILS.append("List of atom types in system of interest , e.g. [\"C\", \"H\", \"O\", \"N\"]")
     PARAM.append("NO_CASES");                       VARTYP.append("int");           DETAILS.append("Number of different state points considered")
     PARAM.append("MOLANAL_SPECIES");                VARTYP.append("str list");      DETAILS.append("List of species to track in molanal output, e.g. [\"C1 O1 1(O-C)\", \"C1 O2 2(O-C)\"] ")
@@ -25,6 +26,11 @@ def print_help():
     PARAM.append("DO_HIERARCH");                    VARTYP.append("bool");          DETAILS.append("Is this a hierarchical fit (i.e., building on existing parameters?") 
     PARAM.append("HIERARCH_PARAM_FILES");           VARTYP.append("str list");      DETAILS.append("List of parameter files to build on, which chould be in ALL_BASE_FILES/HIERARCH_PARAMS")     
     PARAM.append("HIERARCH_EXE");                   VARTYP.append("str");           DETAILS.append("Executable to use when subtracting existing parameter contributions")     
+    PARAM.append("SUBTRACT_NPROCS");                VARTYP.append("int");           DETAILS.append("Number of worker processes evaluating frames when subtracting hierarchical or corrected-method contributions")
+    PARAM.append("SUBTRACT_LAUNCHER");              VARTYP.append("str");           DETAILS.append("Command prepended to HIERARCH_EXE/CORRECTED_TYPE_EXE for each subtraction single point, e.g. \"srun -N 1 -n 1 --exact\"")
+    PARAM.append("SUBTRACT_CACHE");                 VARTYP.append("str");           DETAILS.append("Directory caching subtracted single point results, reused across rebuilds and restarts; None (default) disables it")
+    PARAM.append("SUBTRACT_CACHE_SIZE");            VARTYP.append("int");           DETAILS.append("Size limit of the subtraction cache, in MB; least recently used entries are removed beyond it")
+    PARAM.append("SUBTRACT_WARM_START");            VARTYP.append("bool");          DETAILS.append("Start DFTB+ subtraction SCC cycles from the previous frame's charges, within blocks of consecutive frames; results change within the SCC tolerance")
     PARAM.append("FIT_CORRECTION");                 VARTYP.append("bool");          DETAILS.append("Is this ChIMES model being fit as a correction to another method?") 
     PARAM.append("CORRECTED_TYPE");                 VARTYP.append("str");           DETAILS.append("Method type being corrected. Currently only \"DFTB\" is supported")    
     PARAM.append("CORRECTED_TYPE_FILES");           VARTYP.append("str");           DETAILS.append("Files needed to run simulations/single points with the method to be corrected")    
@@ -32,9 +38,14 @@ def print_help():
     PARAM.append("CORRECTED_TEMPS_BY_FILE");        VARTYP.append("bool");          DETAILS.append("Should electron temperatures be set to values in traj_list.dat (false) or in specified file location, for correction calculation? Only needed if correction method is QM-based. ")
     PARAM.append("HPC_PPN");                        VARTYP.append("int");           DETAILS.append("The number of processors per node on the machine code is launched on")    
     PARAM.append("HPC_ACCOUNT");                    VARTYP.append("str");           DETAILS.append("Charge bank name on machine code is launched on (e.g. \"pbronze\")")
-    PARAM.append("HPC_SYSTEM");                     VARTYP.append("str");           DETAILS.append("Job scheduler on machine code is launched on (only \"slurm\" is supported currently)")
+    PARAM.append("HPC_SYSTEM");                     VARTYP.append("str");           DETAILS.append("Job scheduler on machine code is launched on (\"slurm\", \"pilot\" to run all jobs in one allocation, or \"local\" to run job scripts in a local process pool)")
     PARAM.append("HPC_PYTHON");                     VARTYP.append("str");           DETAILS.append("Path to python executable (2.X required for now)")
     PARAM.append("HPC_EMAIL");                      VARTYP.append("bool");          DETAILS.append("Controls whether driver status updates are e-mailed to user")
+    PARAM.append("HPC_NJOBS");                      VARTYP.append("int");           DETAILS.append("Number of job scripts run at once when HPC_SYSTEM is \"local\"")
+    PARAM.append("HPC_PILOT_NODES");                VARTYP.append("int");           DETAILS.append("Nodes to request for the pilot allocation when HPC_SYSTEM is \"pilot\" (0: use the allocation the driver runs in)")
+    PARAM.append("HPC_PILOT_TIME");                 VARTYP.append("str");           DETAILS.append("Walltime to request for the pilot allocation")
+    PARAM.append("HPC_PILOT_QUEUE");                VARTYP.append("str");           DETAILS.append("Queue to request the pilot allocation from")
+    PARAM.append("HPC_CHAIN");                      VARTYP.append("bool");          DETAILS.append("Submit the solve_amat job with the build_amat job, held until the build succeeds")
     PARAM.append("ALC0_FILES");                     VARTYP.append("str");           DETAILS.append("Path to base files required by the driver (e.g. ChIMES input files, VASP, input files, etc.)")
     PARAM.append("CHIMES_LSQ");                     VARTYP.append("str");           DETAILS.append("ChIMES_lsq executable absolute path (e.g. CHIMES_SRCDIR + \"chimes_lsq\")")
     PARAM.append("CHIMES_SOLVER");                  VARTYP.append("str");           DETAILS.append("lsq2.py executable absolute path (e.g. CHIMES_SRCDIR + \"lsq2.py\")")
@@ -76,6 +87,10 @@ def print_help():
     PARAM.append("MEM_CYCL");                       VARTYP.append("int");           DETAILS.append("Number of MC cycles to use during cluster selection")
     PARAM.append("MEM_NSEL");                       VARTYP.append("int");           DETAILS.append("Number of clusters to select")
     PARAM.append("MEM_ECUT");                       VARTYP.append("float");         DETAILS.append("Maximum ChIMES \"dumb\" energy cutoff for cluster selection")
+    PARAM.append("MEM_CONV_TOL");                   VARTYP.append("float");         DETAILS.append("Stop cluster selection once the MC SSQR changes by less than this fraction over MEM_CONV_WIN sweeps; None to run all MEM_CYCL sweeps")
+    PARAM.append("MEM_CONV_WIN");                   VARTYP.append("int");           DETAILS.append("Sliding window (in MC sweeps) for the MEM_CONV_TOL convergence test")
+    PARAM.append("MEM_MAX_TIME");                   VARTYP.append("float");         DETAILS.append("Wall time budget (s) for cluster selection MC sweeps; None for no limit")
+    PARAM.append("MEM_NCHAINS");                    VARTYP.append("int");           DETAILS.append("Number of independent cluster selection MC chains to run in parallel; the one with the lowest final SSQR is kept")
     PARAM.append("CALC_REPO_ENER_CENT_QUEUE");      VARTYP.append("str");           DETAILS.append("Queue to submit cluster ChIMES \"dumb\" energy calculations for central repository clusters to")
     PARAM.append("CALC_REPO_ENER_CENT_TIME");       VARTYP.append("str");           DETAILS.append("Walltime for ChIMES \"dumb\" energy calculations for central repository clusters")
     PARAM.append("CALC_REPO_ENER_QUEUE");           VARTYP.append("str");           DETAILS.append("Queue to submit cluster ChIMES \"dumb\" energy calculations for candidate clusters to")
@@ -89,6 +104,7 @@ def print_help():
     PARAM.append("VASP_TIME");                      VARTYP.append("str");           DETAILS.append("Walltime for VASP calculations, e.g. \"04:00:00\"")
     PARAM.append("VASP_QUEUE");                     VARTYP.append("str");           DETAILS.append("Queue to submit VASP jobs to")
     PARAM.append("VASP_EXE");                       VARTYP.append("str");           DETAILS.append("Absolute path to VASP executable")
+    PARAM.append("VASP_ARRAY");                     VARTYP.append("int");           DETAILS.append("If > 0, run VASP calculations as an array job, with about this many configurations (by atom count) per task")
     PARAM.append("DFTB_FILES");                     VARTYP.append("str");           DETAILS.append("Absolute path to DFTB+ input file ")
     PARAM.append("DFTB_POSTPRC");                   VARTYP.append("str");           DETAILS.append("Absolute path to dftb+2yzf.py ")
     PARAM.append("DFTB_NODES");                     VARTYP.append("int");           DETAILS.append("Number of nodes to use for DFTB+ jobs")
@@ -188,6 +204,12 @@ def check_VASP(user_config):
             print("         Will use mkl")
 
         user_config.VASP_MODULES = "mkl"        
+
+    if not hasattr(user_config,'VASP_ARRAY'):
+
+        # Configurations per VASP array task (0: all configurations in a single job)
+
+        user_config.VASP_ARRAY = 0
         
     if not hasattr(user_config,'VASP_EXE'):
 
@@ -418,6 +440,22 @@ def verify(user_config):
         
         user_config.SEED          = 1
         
+        
+    if not hasattr(user_config,'COMPRESS_OUTPUTS'):
+
+        # Whether to compress MD trajectories and fitting data once they've been consumed
+
+        print("WARNING: Option config.COMPRESS_OUTPUTS was not set")
+        print("         Will not compress consumed stage outputs")    
+        
+        user_config.COMPRESS_OUTPUTS = False
+        
+    if user_config.COMPRESS_OUTPUTS and (user_config.COMPRESS_OUTPUTS not in ["gz", "xz", "zst"]):
+    
+        print("ERROR: Unrecognized config.COMPRESS_OUTPUTS option:", user_config.COMPRESS_OUTPUTS)
+        print("       Options are False, \"gz\", \"xz\", or \"zst\"")
+        exit()
+        
 
     if not hasattr(user_config,'ATOM_TYPES'):
 
@@ -568,6 +606,52 @@ def verify(user_config):
             else:
                 user_config.HIERARCH_EXE = None                
 
+    if not hasattr(user_config,'SUBTRACT_NPROCS'):
+
+        # Number of worker processes used to subtract hierarchical/corrected-method contributions
+
+        print("WARNING: Option config.SUBTRACT_NPROCS was not set")
+        print("         Will use a value of 1")
+
+        user_config.SUBTRACT_NPROCS = 1
+
+    if not hasattr(user_config,'SUBTRACT_LAUNCHER'):
+
+        # Command prepended to HIERARCH_EXE/CORRECTED_TYPE_EXE for each subtraction single point
+
+        print("WARNING: Option config.SUBTRACT_LAUNCHER was not set")
+        print("         Will run subtraction single points without a launcher")
+
+        user_config.SUBTRACT_LAUNCHER = ""
+
+    if not hasattr(user_config,'SUBTRACT_CACHE'):
+
+        # Directory caching subtracted single point results across rebuilds/restarts; None disables the cache
+
+        print("WARNING: Option config.SUBTRACT_CACHE was not set")
+        print("         Will not cache subtraction single points")
+
+        user_config.SUBTRACT_CACHE = None
+
+    if not hasattr(user_config,'SUBTRACT_CACHE_SIZE'):
+
+        # Size limit of the subtraction cache in MB; least recently used entries are removed beyond it
+
+        if user_config.SUBTRACT_CACHE is not None:
+            print("WARNING: Option config.SUBTRACT_CACHE_SIZE was not set")
+            print("         Will use a value of 1000")
+
+        user_config.SUBTRACT_CACHE_SIZE = 1000
+
+    if not hasattr(user_config,'SUBTRACT_WARM_START'):
+
+        # Start DFTB+ subtraction SCC cycles from the previous frame's charges; results change within the SCC tolerance
+
+        print("WARNING: Option config.SUBTRACT_WARM_START was not set")
+        print("         Will cold start every subtraction single point")
+
+        user_config.SUBTRACT_WARM_START = False
+
 
     ################################
     ##### General HPC options
@@ -597,9 +681,49 @@ def verify(user_config):
 
         print("WARNING: Option config.HPC_SYSTEM was not set")
         print("         Will use slurm")
-        print("        Note: No other options are currently supported.")    
+        print("        Note: Other options are \"pilot\" and \"local\".")    
         
         user_config.HPC_SYSTEM = "slurm"    
+        
+    if not hasattr(user_config,'HPC_NJOBS'):
+
+        # Number of job scripts run at once by the local backend; only used if HPC_SYSTEM is "local"
+
+        if user_config.HPC_SYSTEM == "local":
+            print("WARNING: Option config.HPC_NJOBS was not set")
+            print("         Will use the number of local cores")
+        
+        user_config.HPC_NJOBS = os.cpu_count() or 1
+        
+    if not hasattr(user_config,'HPC_PILOT_NODES'):
+
+        # Size of the pilot allocation; only used if HPC_SYSTEM is "pilot"
+
+        if user_config.HPC_SYSTEM == "pilot":
+            print("WARNING: Option config.HPC_PILOT_NODES was not set")
+            print("         Will run inside the driver's own allocation")
+        
+        user_config.HPC_PILOT_NODES = 0
+        
+    if not hasattr(user_config,'HPC_PILOT_TIME'):
+
+        # Walltime of the pilot allocation; only used if the driver submits it (HPC_PILOT_NODES > 0)
+
+        if (user_config.HPC_SYSTEM == "pilot") and (int(user_config.HPC_PILOT_NODES) > 0):
+            print("WARNING: Option config.HPC_PILOT_TIME was not set")
+            print("         Will request a 24:00:00 pilot allocation")
+        
+        user_config.HPC_PILOT_TIME = "24:00:00"
+        
+    if not hasattr(user_config,'HPC_PILOT_QUEUE'):
+
+        # Queue for the pilot allocation; only used if the driver submits it (HPC_PILOT_NODES > 0)
+
+        if (user_config.HPC_SYSTEM == "pilot") and (int(user_config.HPC_PILOT_NODES) > 0):
+            print("WARNING: Option config.HPC_PILOT_QUEUE was not set")
+            print("         Will use pbatch")
+        
+        user_config.HPC_PILOT_QUEUE = "pbatch"
 
         
     if not hasattr(user_config,'HPC_PYTHON'):
@@ -620,6 +744,15 @@ def verify(user_config):
         print("         Will use False")
         
         user_config.HPC_EMAIL = False
+        
+    if not hasattr(user_config, 'HPC_CHAIN'):
+
+        # Boolean: Chain dependent jobs through the queueing system rather than waiting between them?
+
+        print("WARNING: Option config.HPC_CHAIN was not set")
+        print("         Will use False")
+        
+        user_config.HPC_CHAIN = False
 
 
 
@@ -1165,6 +1298,42 @@ def verify(user_config):
 
             user_config.MEM_ECUT = 100.0        
             
+        if not hasattr(user_config,'MEM_CONV_TOL'):
+
+            # Relative change in the MC SSQR over MEM_CONV_WIN sweeps below which cluster selection stops early
+
+            print("WARNING: Option config.MEM_CONV_TOL was not set")
+            print("         Will run all config.MEM_CYCL cluster selection sweeps")
+
+            user_config.MEM_CONV_TOL = None
+            
+        if not hasattr(user_config,'MEM_CONV_WIN'):
+
+            # Sliding window (in MC sweeps) for the cluster selection convergence test
+
+            print("WARNING: Option config.MEM_CONV_WIN was not set")
+            print("         Will use a value of 1000")
+
+            user_config.MEM_CONV_WIN = 1000
+            
+        if not hasattr(user_config,'MEM_MAX_TIME'):
+
+            # Wall time budget (s) for cluster selection MC sweeps
+
+            print("WARNING: Option config.MEM_MAX_TIME was not set")
+            print("         Will not limit cluster selection wall time")
+
+            user_config.MEM_MAX_TIME = None
+            
+        if not hasattr(user_config,'MEM_NCHAINS'):
+
+            # Number of independent cluster selection MC chains, run in parallel; the one with the lowest final SSQR is kept
+
+            print("WARNING: Option config.MEM_NCHAINS was not set")
+            print("         Will use a value of 1")
+
+            user_config.MEM_NCHAINS = 1
+            
         if not hasattr(user_config,'CALC_REPO_ENER_CENT_QUEUE'):
 
             # Queue for central repo energy calculations
@@ -0,0 +1,316 @@
+"""
+
+Binary, columnar storage for .xyz(f) trajectories.
+
+A store is a directory of .npy files:
+
+    elements.npy   - Unique element symbols
+    natoms.npy     - Atoms per frame                                       (nframes)
+    offsets.npy    - Index of each frame's first atom; offsets[-1] = total (nframes+1)
+    types.npy      - Index into elements for each atom                     (total)
+    coords.npy     - Atom coordinates                                      (total, 3)
+    forces.npy     - Atom forces, as written in the .xyzf file (H/B)       (total, 3)
+    box.npy        - Cell vectors ax ay az bx by bz cx cy cz                (nframes, 9)
+    stress.npy     - Stresses sxx syy szz sxy sxz syz                      (nframes, 6)
+    energy.npy     - Frame energies                                         (nframes)
+    layout.npy     - Per-frame header layout: non_ortho, no. stress
+                     components (0, 3, or 6), has energy, has forces       (nframes, 4)
+    source.npy     - Size and mtime of the .xyz(f) file it was made from
+
+Arrays are memory-mapped on read, so frame j's atoms are simply
+coords[offsets[j]:offsets[j+1]]. Components absent from a frame's header
+are stored as zeros, and layout records what was present so that the
+.xyzf file can be regenerated. Values round-trip exactly; only whitespace
+and number formatting (repr) in the regenerated text may differ from the
+original. Any atom line fields beyond the forces are not stored.
+
+Stores are only written on request (xyzf_to_store, or the command line
+below), so the driver never keeps a second copy of a trajectory on disk.
+Where one is given for a trajectory (e.g. gen_ff.subtract's stores), 
+modify_FES.write_full_FES reads it instead of the text file, as long as
+is_current finds it up to date.
+
+"""
+
+# Global (python) modules
+
+import os
+import sys
+import numpy as np
+from numpy.lib.format import open_memmap
+
+# Local modules
+
+import helpers
+
+STORE_ARRAYS = ["elements", "natoms", "offsets", "types", "coords", "forces", "box", "stress", "energy", "layout", "source"]
+
+
+def source_stamp(traj_file):
+
+    """
+
+    Returns the size and mtime of a .xyz(f) file, as recorded in its stores
+
+    Usage: stamp = source_stamp("OUTCAR.xyzf")
+
+    """
+
+    stats = os.stat(helpers.resolve_file(traj_file))
+
+    return str(stats.st_size) + " " + str(stats.st_mtime_ns)
+
+
+def is_current(store_dir, traj_file):
+
+    """
+
+    Checks whether a store was made from the current version of a .xyz(f) file
+
+    Usage: if is_current("OUTCAR.store", "OUTCAR.xyzf"): ...
+
+    Notes: Returns False for a missing or incomplete store.
+
+    """
+
+    try:
+        return str(np.load(store_dir + "/source.npy")) == source_stamp(traj_file)
+    except (OSError, ValueError):
+        return False
+
+
+def parse_header(header):
+
+    """
+
+    Splits a frame header line into box, stress, and energy values
+
+    Usage: box, stress, energy, layout = parse_header(header_line)
+
+    Notes: See helpers.xyz_header_format for supported header formats.
+
+    """
+
+    box_type, stress_type, energy_type = helpers.xyz_header_format(header)
+
+    fields = header.split()
+
+    if box_type == "non_ortho":
+        fields.pop(0)
+
+    fields = [float(i) for i in fields]
+
+    box    = [0.0]*9
+    stress = [0.0]*6
+    energy = 0.0
+    nstr   = {"all" : 6, "diag" : 3, "no" : 0}[stress_type]
+
+    if box_type == "non_ortho":
+        box    = fields[:9]
+        fields = fields[9:]
+    else:
+        box[0] = fields[0]
+        box[4] = fields[1]
+        box[8] = fields[2]
+        fields = fields[3:]
+
+    stress[:nstr] = fields[:nstr]
+
+    if energy_type == "yes":
+        energy = fields[nstr]
+
+    layout = [int(box_type == "non_ortho"), nstr, int(energy_type == "yes"), 0]
+
+    return box, stress, energy, layout
+
+
+def xyzf_to_store(traj_file, store_dir):
+
+    """
+
+    Converts a .xyz(f) file to a binary store
+
+    Usage: xyzf_to_store("OUTCAR.xyzf", "OUTCAR.store")
+
+    Notes: Only complete frames are converted. Arrays are filled frame by
+           frame through memory maps, so the trajectory is never held in
+           memory.
+
+    """
+
+    if not os.path.isdir(store_dir):
+        os.mkdir(store_dir)
+        
+    # The source stamp is taken first, and written last, so a store that is
+    # partially written, or made while the file changed, is never current
+    
+    stamp = source_stamp(traj_file)
+    
+    if os.path.isfile(store_dir + "/source.npy"):
+        os.remove(store_dir + "/source.npy")
+
+    index   = helpers.index_xyzframes(traj_file)
+    natoms  = np.array(index[1], dtype=np.int64)
+    nframes = len(natoms)
+    offsets = np.zeros(nframes+1, dtype=np.int64)
+
+    np.cumsum(natoms, out=offsets[1:])
+
+    total = int(offsets[-1])
+
+    types  = open_memmap(store_dir + "/types.npy" , mode='w+', dtype=np.int16  , shape=(total,  ))
+    coords = open_memmap(store_dir + "/coords.npy", mode='w+', dtype=np.float64, shape=(total, 3))
+    forces = open_memmap(store_dir + "/forces.npy", mode='w+', dtype=np.float64, shape=(total, 3))
+    box    = np.zeros((nframes, 9))
+    stress = np.zeros((nframes, 6))
+    energy = np.zeros(nframes)
+    layout = np.zeros((nframes, 4), dtype=np.int8)
+
+    elements = []
+
+    for i, frame in enumerate(helpers.iter_xyzframes(traj_file, index=index)):
+
+        box[i], stress[i], energy[i], layout[i] = parse_header(frame[1])
+
+        atoms = [line.split() for line in frame[2:]]
+
+        for atom in atoms:
+            if atom[0] not in elements:
+                elements.append(atom[0])
+
+        start = offsets[i]
+        end   = offsets[i+1]
+
+        types [start:end] = [elements.index(atom[0]) for atom in atoms]
+        coords[start:end] = [atom[1:4]               for atom in atoms]
+
+        if natoms[i] > 0 and len(atoms[0]) >= 7:
+            forces[start:end] = [atom[4:7] for atom in atoms]
+            layout[i][3]      = 1
+        else:
+            forces[start:end] = 0.0
+
+    types .flush()
+    coords.flush()
+    forces.flush()
+
+    np.save(store_dir + "/elements.npy", np.array(elements))
+    np.save(store_dir + "/natoms.npy"  , natoms )
+    np.save(store_dir + "/offsets.npy" , offsets)
+    np.save(store_dir + "/box.npy"     , box    )
+    np.save(store_dir + "/stress.npy"  , stress )
+    np.save(store_dir + "/energy.npy"  , energy )
+    np.save(store_dir + "/layout.npy"  , layout )
+    np.save(store_dir + "/source.npy"  , np.array(stamp))
+
+    return store_dir
+
+
+def load_store(store_dir):
+
+    """
+
+    Opens a binary store
+
+    Usage: store = load_store("OUTCAR.store"); forces = store["forces"]
+
+    Notes: Returns a dictionary of (read-only, memory-mapped) arrays, keyed by
+           the names in STORE_ARRAYS.
+
+    """
+
+    store = {}
+
+    for name in STORE_ARRAYS:
+        store[name] = np.load(store_dir + "/" + name + ".npy", mmap_mode='r')
+
+    return store
+
+
+def get_frame(store, frame):
+
+    """
+
+    Returns the per-atom arrays for a single frame of a store
+
+    Usage: symbols, coords, forces = get_frame(store, 10)
+
+    Notes: coords and forces are views into the memory-mapped arrays.
+
+    """
+
+    start = store["offsets"][frame]
+    end   = store["offsets"][frame+1]
+
+    symbols = store["elements"][store["types"][start:end]]
+
+    return symbols, store["coords"][start:end], store["forces"][start:end]
+
+
+def store_to_xyzf(store_dir, traj_file):
+
+    """
+
+    Converts a binary store back to a .xyz(f) file
+
+    Usage: store_to_xyzf("OUTCAR.store", "OUTCAR.xyzf")
+
+    Notes: Frames are written with the same header layout and fields they
+           were read with.
+
+    """
+
+    store = load_store(store_dir)
+
+    with open(traj_file, "w") as ofstream:
+
+        for i in range(len(store["natoms"])):
+
+            non_ortho, nstr, has_energy, has_forces = store["layout"][i].tolist()
+
+            if non_ortho:
+                header = ["NON_ORTHO"] + store["box"][i].tolist()
+            else:
+                header = store["box"][i][[0,4,8]].tolist()
+
+            header += store["stress"][i][:nstr].tolist()
+
+            if has_energy:
+                header.append(store["energy"][i].item())
+
+            ofstream.write(repr(int(store["natoms"][i])) + '\n')
+            ofstream.write(' '.join([str(j) for j in header]) + '\n')
+
+            symbols, coords, forces = get_frame(store, i)
+
+            if has_forces:
+                values = np.hstack((coords, forces)).tolist()
+            else:
+                values = coords.tolist()
+
+            for j in range(len(symbols)):
+                ofstream.write(str(symbols[j]) + ' ' + ' '.join([repr(k) for k in values[j]]) + '\n')
+
+
+if __name__=='__main__':
+
+    """
+
+    Allows commandline conversions between .xyz(f) files and binary stores.
+
+    Usage: python3 xyzf_store.py to_store OUTCAR.xyzf OUTCAR.store
+           python3 xyzf_store.py to_xyzf  OUTCAR.store OUTCAR.xyzf
+
+    """
+
+    if   sys.argv[1] == "to_store":
+
+        xyzf_to_store(sys.argv[2], sys.argv[3])
+
+    elif sys.argv[1] == "to_xyzf":
+
+        store_to_xyzf(sys.argv[2], sys.argv[3])
+
+    else:
+        print("ERROR: Unknown option in call to xyzf_store.py: ", sys.argv[1])
+        exit()
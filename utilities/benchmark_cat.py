@@ -0,0 +1,130 @@
+"""
+
+Benchmarks helpers.cat_specific against the original cp + read() implementation.
+
+Usage: python3 benchmark_cat.py <scratch directory> [sizes in GB; default: 1 10 100]
+
+Notes: For each size, a "previous ALC" file of that size and a 1% "new data"
+       file are written to the scratch directory, then concatenated with both
+       implementations (mimicking the *_comb updates in gen_ff.solve_amat).
+       Run on the same filesystem used for ALC runs; the scratch directory needs
+       roughly 3.1x the largest size free. Page cache is dropped between runs if
+       possible (requires root); otherwise timings for the second method benefit
+       from a warm cache. Files are removed when done.
+
+"""
+
+# Global (python) modules
+
+import os
+import sys
+import time
+
+# Local modules
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../src")
+
+import helpers
+
+
+def legacy_cat_specific(outfilename, *argv):
+
+    """
+
+    The original implementation of helpers.cat_specific, for comparison
+
+    """
+
+    files_to_cat = argv[0][0]
+
+    helpers.run_bash_cmnd("cp " + files_to_cat + " " + outfilename)
+
+    files_to_cat = argv[0][1:]
+
+    with open(outfilename, "a") as ofstream:
+        for f in files_to_cat:
+
+            with open(f, "r") as ifstream:
+
+                if os.path.getsize(f)/1E9 > 50:
+
+                    for line in ifstream:
+                        ofstream.write(line)
+                else:
+                    ofstream.write(ifstream.read())
+
+
+def write_file(outfilename, nbytes):
+
+    """
+
+    Writes nbytes of A-matrix-like text to a file
+
+    """
+
+    line  = ("  1.234567890123e-01"*10 + '\n').encode()
+    block = line*(67108864//len(line))
+
+    with open(outfilename, "wb") as ofstream:
+
+        while nbytes > 0:
+            ofstream.write(block[:nbytes])
+            nbytes -= len(block)
+
+
+def drop_caches():
+
+    os.sync()
+
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as ofstream:
+            ofstream.write("3\n")
+    except:
+        pass
+
+
+def time_method(method, files, **kwargs):
+
+    drop_caches()
+
+    start = time.time()
+
+    method("bench_out.txt", files, **kwargs)
+
+    os.sync()
+
+    return time.time() - start
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print("ERROR: Usage: python3 benchmark_cat.py <scratch directory> [sizes in GB]")
+        exit()
+
+    os.chdir(sys.argv[1])
+
+    sizes = [1, 10, 100]
+
+    if len(sys.argv) > 2:
+        sizes = [float(i) for i in sys.argv[2:]]
+
+    print("size (GB)    legacy (s)    kernel (s)    kernel+reflink (s)")
+
+    for size in sizes:
+
+        write_file("bench_prev.txt", int(size*1E9))
+        write_file("bench_new.txt" , int(size*1E7))
+
+        files = ["bench_prev.txt", "bench_new.txt"]
+
+        results = []
+
+        results.append(time_method(legacy_cat_specific,  files))
+        results.append(time_method(helpers.cat_specific, files))
+        results.append(time_method(helpers.cat_specific, files, link_first="reflink"))
+
+        print(repr(size).ljust(13) + ''.join(["%-14.2f" % i for i in results]))
+
+        for f in files + ["bench_out.txt"]:
+            os.remove(f)
@@ -0,0 +1,119 @@
+"""
+
+Benchmarks reading compressed vs. uncompressed trajectories through helpers.
+
+Usage: python3 benchmark_compressed_io.py <directory on the mount to test> <trajectory .xyzf> [repeats; default: 10]
+
+Notes: The trajectory is copied to the test directory as-is and in each
+       supported compressed format, then a full frame scan
+       (count_xyzframes_general, with no saved index) and a streaming read
+       of every frame (iter_xyzframes) are timed for each. Run it against
+       the shared scratch filesystem to see whether reduced bandwidth
+       outweighs decompression cost there. Page cache is dropped between
+       runs if possible (requires root). Files are removed when done.
+
+"""
+
+# Global (python) modules
+
+import os
+import sys
+import time
+
+# Local modules
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../src")
+
+import helpers
+
+
+def drop_caches():
+
+    os.sync()
+
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as ofstream:
+            ofstream.write("3\n")
+    except:
+        pass
+
+
+def time_reads(traj_file):
+
+    # Frame scan, without a saved index
+
+    if os.path.isfile(helpers.xyz_index_file(traj_file)):
+        os.remove(helpers.xyz_index_file(traj_file))
+
+    drop_caches()
+
+    start = time.time()
+
+    helpers.count_xyzframes_general(traj_file)
+
+    scan = time.time() - start
+
+    # Streaming read of every frame
+
+    drop_caches()
+
+    start = time.time()
+
+    for frame in helpers.iter_xyzframes(traj_file):
+        pass
+
+    read = time.time() - start
+
+    os.remove(helpers.xyz_index_file(traj_file))
+
+    return scan, read
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 3:
+        print("ERROR: Usage: python3 benchmark_compressed_io.py <test directory> <trajectory .xyzf> [repeats]")
+        exit()
+
+    test_dir  = sys.argv[1]
+    traj_file = os.path.abspath(sys.argv[2])
+    repeats   = 10
+
+    if len(sys.argv) > 3:
+        repeats = int(sys.argv[3])
+
+    os.chdir(test_dir)
+
+    print("format   size (MB)   scan (s)   read (s)")
+
+    for ext in [""] + helpers.COMPRESSION_EXTENSIONS:
+
+        test_file = "bench.xyzf"
+
+        helpers.run_bash_cmnd("cp " + traj_file + " " + test_file)
+
+        if ext:
+
+            try:
+                helpers.compress_file(test_file, ext)
+            except SystemExit:
+                os.remove(test_file)
+                continue # zstandard isn't available
+
+            test_file += ext
+
+        scan = 0.0
+        read = 0.0
+
+        for i in range(repeats):
+
+            times = time_reads(test_file)
+
+            scan += times[0]/repeats
+            read += times[1]/repeats
+
+        size = os.path.getsize(test_file)/1E6
+
+        print((ext[1:] or "none").ljust(9) + ("%-12.1f%-11.3f%-11.3f" % (size, scan, read)))
+
+        os.remove(test_file)
@@ -0,0 +1,98 @@
+"""
+
+Benchmarks gen_selections.gen_subset setup and MC sweep cost against repository size.
+
+Usage: python3 benchmark_gen_subset.py <scratch directory> [sizes; default: 1000 10000 100000]
+
+Notes: For each size N, N new energies (all.energies_normed) and N central
+       repository energies are written to the scratch directory, with a few
+       of each beyond the energy cutoff or outside the new energies' range.
+       Setup is timed by running gen_subset with no sweeps, selecting N/10
+       energies. Sweeps are timed by running one sweep per energy (nsweep =
+       1, i.e. N sweeps) selecting 100 energies, less the setup time of that
+       run, and are reported per sweep. Timings include gen_subset's plots.
+       To compare versions, run the copy of this script in each checkout.
+       Files are removed when done.
+
+"""
+
+# Global (python) modules
+
+import os
+import sys
+import time
+import contextlib
+import numpy as np
+
+# Local modules
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../src")
+
+import gen_selections
+
+
+def write_energies(nener):
+
+    """
+
+    Writes nener normal-distributed new and central repository energies
+
+    """
+
+    rng = np.random.default_rng(1)
+
+    ener = rng.normal(-5.0, 1.0, nener)
+    repo = rng.normal(-5.0, 1.3, nener)
+
+    ener[::max(1, nener//20)] = 1.0E3 # Beyond the cutoff
+    repo[::max(1, nener//20)] = 1.0E3
+
+    np.savetxt("bench.energies", ener)
+    np.savetxt("bench.repo"    , repo)
+
+
+def time_gen_subset(nsel, nsweep):
+
+    start = time.time()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+
+        gen_selections.gen_subset(
+            energies = "bench.energies",
+            nsel     = nsel,
+            nsweep   = nsweep,
+            nbins    = 20,
+            ecut     = 100.0,
+            repo     = "bench.repo",
+            seed     = 1)
+
+    return time.time() - start
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print("ERROR: Usage: python3 benchmark_gen_subset.py <scratch directory> [sizes]")
+        exit()
+
+    os.chdir(sys.argv[1])
+
+    sizes = [1000, 10000, 100000]
+
+    if len(sys.argv) > 2:
+        sizes = [int(float(i)) for i in sys.argv[2:]]
+
+    print("size         setup (s)     sweep (ms)")
+
+    for size in sizes:
+
+        write_energies(size)
+
+        setup = time_gen_subset(size//10, 0)
+        sweep = (time_gen_subset(100, 1) - time_gen_subset(100, 0))/size
+
+        print(repr(size).ljust(13) + "%-14.3f" % setup + "%-14.4f" % (sweep*1000.0))
+
+        for f in ["bench.energies", "bench.repo", ".bench.energies.npz", ".bench.repo.npz", "all.selection.dat", "energy_hist.pdf", "residuals.pdf"]:
+            if os.path.isfile(f):
+                os.remove(f)